@@ -1206,6 +1206,54 @@ async fn delete_ml_model(
     Ok(Json(result))
 }
 
+/// Intervalo de sondeo y espera máxima para los trabajos de entrenamiento del ML Service
+const ML_JOB_POLL_INTERVAL: StdDuration = StdDuration::from_secs(2);
+const ML_JOB_MAX_WAIT: StdDuration = StdDuration::from_secs(30 * 60);
+
+/// El ML Service encola los entrenamientos (POST /train, /train/clustering) y responde
+/// con un job_id. Esta función consulta GET /jobs/{id} hasta que termina y devuelve su resultado.
+async fn wait_for_ml_job(
+    client: &reqwest::Client,
+    enqueue_response: &serde_json::Value,
+) -> Result<serde_json::Value, String> {
+    let job_id = enqueue_response
+        .get("job_id")
+        .and_then(|v| v.as_str())
+        .ok_or_else(|| "Respuesta del ML Service sin job_id".to_string())?;
+
+    let deadline = tokio::time::Instant::now() + ML_JOB_MAX_WAIT;
+    loop {
+        let job: serde_json::Value = client
+            .get(format!("http://ccb_ml_service:8000/jobs/{}", job_id))
+            .send()
+            .await
+            .map_err(|e| e.to_string())?
+            .json()
+            .await
+            .map_err(|e| e.to_string())?;
+
+        match job.get("status").and_then(|s| s.as_str()) {
+            Some("completed") => return Ok(job.get("result").cloned().unwrap_or(Value::Null)),
+            Some("failed") => {
+                return Err(job
+                    .get("error")
+                    .and_then(|e| e.as_str())
+                    .unwrap_or("Error desconocido en ML Service")
+                    .to_string())
+            }
+            _ => {}
+        }
+
+        if tokio::time::Instant::now() >= deadline {
+            return Err(format!(
+                "Tiempo de espera agotado para el trabajo {}",
+                job_id
+            ));
+        }
+        tokio::time::sleep(ML_JOB_POLL_INTERVAL).await;
+    }
+}
+
 async fn train_ml_model(
     State(state): State<AppState>,
     auth_user: AuthUser,
@@ -1271,7 +1319,10 @@ async fn train_ml_model(
         )));
     }
 
-    let result: serde_json::Value = response.json().await.map_err(|_| AppError::InternalError)?;
+    let job: serde_json::Value = response.json().await.map_err(|_| AppError::InternalError)?;
+    let result = wait_for_ml_job(&client, &job)
+        .await
+        .map_err(|e| AppError::BadRequest(format!("ML Service error: {}", e)))?;
 
     // Auditoría e Notificación
     let model_id_str = result.get("model_id").and_then(|v| v.as_str());
@@ -1339,7 +1390,10 @@ async fn train_clustering_model(
         return Err(AppError::BadRequest(error_text));
     }
 
-    let json_response: serde_json::Value = res.json().await.map_err(|_| AppError::InternalError)?;
+    let job: serde_json::Value = res.json().await.map_err(|_| AppError::InternalError)?;
+    let json_response = wait_for_ml_job(&client, &job)
+        .await
+        .map_err(AppError::BadRequest)?;
 
     Ok(Json(json_response))
 }
@@ -1431,23 +1485,33 @@ async fn train_all_models(
                 let client = reqwest::Client::new();
                 let train_request = serde_json::json!({
                     "schema_id": schema_id.to_string(),
-                    "model_type": "regression", // Default to regression
+                    "model_type": "auto", // ridge en forma cerrada salvo que el MLP sea claramente mejor
                     "hyperparameters": {
                         "epochs": 100,
                         "learning_rate": 0.001,
-                        "batch_size": 32
+                        "batch_size": 32,
+                        // Con un modelo previo sólo se ajusta con las filas nuevas (más un repaso)
+                        "warm_start": last_model_time.is_some() && !force
                     }
                 });
 
+                // El ML Service encola el entrenamiento; se sondea su estado hasta que termine
                 match client
                     .post("http://ccb_ml_service:8000/train")
                     .json(&train_request)
-                    .timeout(StdDuration::from_secs(300)) // 5 min timeout per model
+                    .timeout(StdDuration::from_secs(30))
                     .send()
                     .await
                 {
                     Ok(res) if res.status().is_success() => {
-                        (schema_id, schema_name, "trained".to_string())
+                        let job: serde_json::Value = match res.json().await {
+                            Ok(job) => job,
+                            Err(e) => return (schema_id, schema_name, format!("error: {}", e)),
+                        };
+                        match wait_for_ml_job(&client, &job).await {
+                            Ok(_) => (schema_id, schema_name, "trained".to_string()),
+                            Err(e) => (schema_id, schema_name, format!("error: {}", e)),
+                        }
                     }
                     Ok(res) => {
                         let err_msg = res
@@ -1745,6 +1809,34 @@ impl IntoResponse for AppError {
     }
 }
 
+/// Serializa las filas como CSV para enviarlas a /predict en formato columnar en lugar de
+/// un objeto JSON por fila. La cabecera es la unión de las claves de todas las filas, en orden
+/// de aparición; las celdas de claves ausentes en una fila quedan vacías.
+fn rows_to_csv(rows: &[serde_json::Map<String, Value>]) -> Result<Vec<u8>, AppError> {
+    let mut seen = std::collections::HashSet::new();
+    let headers: Vec<String> = rows
+        .iter()
+        .flat_map(|r| r.keys())
+        .filter(|k| seen.insert(k.as_str()))
+        .cloned()
+        .collect();
+
+    let mut writer = csv::Writer::from_writer(Vec::new());
+    writer
+        .write_record(&headers)
+        .map_err(|_| AppError::InternalError)?;
+    for row in rows {
+        writer
+            .write_record(headers.iter().map(|h| match row.get(h) {
+                Some(Value::String(s)) => s.clone(),
+                Some(Value::Null) | None => String::new(),
+                Some(v) => v.to_string(),
+            }))
+            .map_err(|_| AppError::InternalError)?;
+    }
+    writer.into_inner().map_err(|_| AppError::InternalError)
+}
+
 async fn batch_predict_ml_model(
     State(_state): State<AppState>,
     _auth_user: AuthUser, // Require auth
@@ -1842,14 +1934,14 @@ async fn batch_predict_ml_model(
         return Err(AppError::BadRequest("No data rows found".into()));
     }
 
-    // Call ML Service
+    // Call ML Service (cuerpo CSV columnar, respuesta float32 empaquetada)
     let client = reqwest::Client::new();
     let response = client
         .post("http://ccb_ml_service:8000/predict")
-        .json(&json!({
-            "model_id": model_id,
-            "data": data_rows
-        }))
+        .query(&[("model_id", &model_id)])
+        .header("Content-Type", "text/csv")
+        .header("Accept", "application/octet-stream")
+        .body(rows_to_csv(&data_rows)?)
         .send()
         .await
         .map_err(|_| AppError::InternalError)?;
@@ -1866,11 +1958,14 @@ async fn batch_predict_ml_model(
         return Err(AppError::BadRequest(msg.into()));
     }
 
-    let result: Value = response.json().await.map_err(|_| AppError::InternalError)?;
-    let predictions = result
-        .get("predictions")
-        .and_then(|v| v.as_array())
-        .ok_or(AppError::InternalError)?;
+    let packed = response
+        .bytes()
+        .await
+        .map_err(|_| AppError::InternalError)?;
+    let predictions: Vec<f64> = packed
+        .chunks_exact(4)
+        .map(|b| f32::from_le_bytes([b[0], b[1], b[2], b[3]]) as f64)
+        .collect();
 
     // Create Excel Output
     let mut workbook = Workbook::new();
@@ -1922,8 +2017,7 @@ async fn batch_predict_ml_model(
             }
         }
         // Write Prediction
-        if let Some(pred) = predictions.get(i) {
-            let p = pred.as_f64().unwrap_or(0.0);
+        if let Some(&p) = predictions.get(i) {
             worksheet
                 .write_number((i + 1) as u32, headers.len() as u16, p)
                 .map_err(|_| AppError::InternalError)?;
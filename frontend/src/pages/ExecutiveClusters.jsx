@@ -190,6 +190,9 @@ export default function ExecutiveClusters() {
                                                         <div style={{ background: '#1e293b', padding: '0.75rem', border: '1px solid #475569', borderRadius: '8px', color: '#fff' }}>
                                                             <strong style={{ color: COLORS[data.cluster % COLORS.length] }}>{clusterName}</strong>
                                                             <div style={{ marginTop: '0.25rem' }}>{data.label}</div>
+                                                            {data.count > 1 && (
+                                                                <div style={{ marginTop: '0.25rem', color: '#94a3b8' }}>{data.count.toLocaleString()} registros en esta zona</div>
+                                                            )}
                                                         </div>
                                                     );
                                                 }
@@ -0,0 +1,19 @@
+-- Migration: Cola de entrenamientos en segundo plano del ML Service
+CREATE TABLE IF NOT EXISTS ml_training_jobs (
+    id UUID PRIMARY KEY,
+    job_type VARCHAR(50) NOT NULL, -- 'train' | 'clustering' | 'search'
+    schema_id UUID NOT NULL REFERENCES ml_schemas(id) ON DELETE CASCADE,
+    request JSONB NOT NULL, -- Payload original para poder reejecutar tras un reinicio
+    status VARCHAR(20) NOT NULL DEFAULT 'queued', -- 'queued', 'running', 'completed', 'failed'
+    progress JSONB, -- {stage, epoch, epochs, loss}
+    result JSONB,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP WITH TIME ZONE,
+    finished_at TIMESTAMP WITH TIME ZONE,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX idx_ml_training_jobs_status ON ml_training_jobs(status);
+CREATE INDEX idx_ml_training_jobs_schema ON ml_training_jobs(schema_id);
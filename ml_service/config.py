@@ -0,0 +1,102 @@
+"""
+Configuración compartida del servicio (API y workers de entrenamiento)
+"""
+import os
+import logging
+import torch
+
+logger = logging.getLogger(__name__)
+
+# Configurar dispositivo (GPU/CPU)
+ML_DEVICE_ENV = os.getenv("ML_DEVICE", "auto").lower()
+
+if ML_DEVICE_ENV == "auto":
+    CUDA_AVAILABLE = torch.cuda.is_available()
+    DEVICE = torch.device("cuda" if CUDA_AVAILABLE else "cpu")
+elif ML_DEVICE_ENV == "cuda":
+    DEVICE = torch.device("cuda")
+    CUDA_AVAILABLE = True
+else:
+    DEVICE = torch.device("cpu")
+    CUDA_AVAILABLE = False
+
+# DB Settings
+DB_URL = os.getenv("DATABASE_URL", "postgres://user:password@db:5432/ml_db")
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_HEALTHCHECK_SECONDS = float(os.getenv("DB_POOL_HEALTHCHECK_SECONDS", "30"))
+
+# Lectura de ml_data en streaming
+ML_FETCH_CHUNK_SIZE = int(os.getenv("ML_FETCH_CHUNK_SIZE", "5000"))
+ML_CLUSTERING_MAX_ROWS = int(os.getenv("ML_CLUSTERING_MAX_ROWS", "5000"))
+# Tope de filas de /train y /train/search sin `max_rows` explícito (0 = todas)
+ML_TRAIN_MAX_ROWS = int(os.getenv("ML_TRAIN_MAX_ROWS", "100000"))
+# Vida media (días) del peso por antigüedad del muestreo 'recent'
+ML_SAMPLE_HALF_LIFE_DAYS = float(os.getenv("ML_SAMPLE_HALF_LIFE_DAYS", "30"))
+# Tipos y medias de columnas con agregados SQL sobre el JSONB (GET /schemas/{id}/profile)
+ML_PROFILE_IN_DB = os.getenv("ML_PROFILE_IN_DB", "true").lower() == "true"
+
+# Reducción de puntos en respuestas (clustering y scatter de regresión)
+ML_PAYLOAD_MAX_POINTS = int(os.getenv("ML_PAYLOAD_MAX_POINTS", "5000"))  # 0 = todos
+ML_PAYLOAD_MODE = os.getenv("ML_PAYLOAD_MODE", "sample").lower()  # sample | grid | none
+ML_SCATTER_MAX_POINTS = int(os.getenv("ML_SCATTER_MAX_POINTS", "300"))
+
+# model_type "auto": ridge en forma cerrada si el schema es chico o si no pierde más de
+# ML_AUTO_LINEAR_TOLERANCE de R² frente al MLP
+ML_AUTO_LINEAR_MAX_ROWS = int(os.getenv("ML_AUTO_LINEAR_MAX_ROWS", "2000"))
+ML_AUTO_LINEAR_MAX_FEATURES = int(os.getenv("ML_AUTO_LINEAR_MAX_FEATURES", "0"))  # 0 = sin umbral
+ML_AUTO_LINEAR_TOLERANCE = float(os.getenv("ML_AUTO_LINEAR_TOLERANCE", "0.01"))
+
+# Reentrenamiento incremental (hyperparameters.warm_start)
+ML_WARM_START_EPOCHS = int(os.getenv("ML_WARM_START_EPOCHS", "10"))
+ML_WARM_START_REPLAY_ROWS = int(os.getenv("ML_WARM_START_REPLAY_ROWS", "5000"))
+
+# Búsqueda de hiperparámetros (/train/search)
+ML_SEARCH_WORKERS = int(os.getenv("ML_SEARCH_WORKERS", "2"))
+ML_SEARCH_THREADS = int(os.getenv("ML_SEARCH_THREADS", "0"))  # hilos a repartir entre workers; 0 = los del trabajo
+ML_SEARCH_MAX_TRIALS = int(os.getenv("ML_SEARCH_MAX_TRIALS", "64"))
+ML_SEARCH_PRUNE_WARMUP_EPOCHS = int(os.getenv("ML_SEARCH_PRUNE_WARMUP_EPOCHS", "5"))
+ML_SEARCH_PRUNE_MIN_TRIALS = int(os.getenv("ML_SEARCH_PRUNE_MIN_TRIALS", "2"))
+
+# Almacenamiento de modelos
+MODELS_DIR = os.getenv("MODELS_DIR", "/app/models")
+
+# Caché LRU de modelos cargados para inferencia
+MODEL_CACHE_MAX_ENTRIES = int(os.getenv("MODEL_CACHE_MAX_ENTRIES", "32"))
+MODEL_CACHE_MAX_MB = int(os.getenv("MODEL_CACHE_MAX_MB", "512"))
+
+# Caché en disco de features preparadas (0 MB = desactivada)
+ML_FEATURE_CACHE_DIR = os.getenv("ML_FEATURE_CACHE_DIR", os.path.join(MODELS_DIR, "feature_cache"))
+ML_FEATURE_CACHE_MAX_MB = int(os.getenv("ML_FEATURE_CACHE_MAX_MB", "2048"))
+ML_FEATURE_CACHE_MAX_AGE_HOURS = float(os.getenv("ML_FEATURE_CACHE_MAX_AGE_HOURS", "168"))
+
+# Artefactos de inferencia: TorchScript congelado (BatchNorm fusionado) y variante int8 (sólo CPU)
+ML_INFERENCE_TORCHSCRIPT = os.getenv("ML_INFERENCE_TORCHSCRIPT", "true").lower() == "true"
+ML_INFERENCE_QUANTIZED = os.getenv("ML_INFERENCE_QUANTIZED", "false").lower() == "true"
+
+# Cola de entrenamiento en segundo plano
+ML_JOB_EXECUTOR = os.getenv("ML_JOB_EXECUTOR", "thread").lower()  # thread | process
+ML_JOB_WORKERS = int(os.getenv("ML_JOB_WORKERS", "2"))
+ML_JOB_MAX_ATTEMPTS = int(os.getenv("ML_JOB_MAX_ATTEMPTS", "2"))
+ML_JOB_PROGRESS_INTERVAL = float(os.getenv("ML_JOB_PROGRESS_INTERVAL", "1.0"))
+# Hilos de CPU de los entrenamientos; 0 = núcleos. Con ML_JOB_EXECUTOR=process se reparten entre los
+# ML_JOB_WORKERS; con thread los límites de torch/BLAS son del proceso, así que es un tope total
+# compartido por todos los trabajos y por /predict
+ML_CPU_BUDGET = int(os.getenv("ML_CPU_BUDGET", "0"))
+ML_JOB_INTEROP_THREADS = int(os.getenv("ML_JOB_INTEROP_THREADS", "1"))
+
+# Pronóstico incremental de series de tiempo (/forecast)
+ML_FORECAST_MAX_HORIZON = int(os.getenv("ML_FORECAST_MAX_HORIZON", "365"))
+ML_FORECAST_MAX_SAMPLES = int(os.getenv("ML_FORECAST_MAX_SAMPLES", "1000"))
+ML_FORECAST_REANCHOR_STEPS = int(os.getenv("ML_FORECAST_REANCHOR_STEPS", "0"))  # 0 = sequence_length
+
+# Micro-batching de /predict
+ML_PREDICT_BATCH_WINDOW_MS = float(os.getenv("ML_PREDICT_BATCH_WINDOW_MS", "5"))  # 0 = desactivado
+ML_PREDICT_MAX_BATCH_ROWS = int(os.getenv("ML_PREDICT_MAX_BATCH_ROWS", "4096"))
+ML_PREDICT_STREAM_CHUNK_ROWS = int(os.getenv("ML_PREDICT_STREAM_CHUNK_ROWS", "5000"))
+
+# Métricas por etapa (GET /metrics, formato Prometheus): límites de los buckets en segundos
+ML_METRICS_BUCKETS = tuple(
+    float(b) for b in os.getenv("ML_METRICS_BUCKETS", "0.005,0.01,0.05,0.1,0.5,1,5,10,30,60,300,1800").split(",") if b.strip()
+)
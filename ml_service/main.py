@@ -1,17 +1,35 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import ORJSONResponse
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, ValidationError
 import torch
+import numpy as np
+import pandas as pd
 import os
-import json
-import uuid
-from typing import List, Dict, Any
+import time
+import orjson
+from typing import List, Dict, Any, Optional, Union
 import logging
-import psycopg2
-from datetime import datetime
-import pandas as pd
-from trainers.regression import RegressionTrainer, SimpleRegressionModel
-from trainers.timeseries import TimeSeriesTrainer, LSTMModel
-from trainers.clustering import ClusteringTrainer
+import config
+from config import DEVICE, CUDA_AVAILABLE
+from trainers.regression import LinearRegressionModel, SimpleRegressionModel
+from trainers.timeseries import LSTMModel
+from trainers.preprocessing import TabularPipeline
+from services.model_cache import ModelCache, CachedModel
+from services.db import get_pool
+from services.jobs import JobQueue
+from services.batching import PredictionBatcher
+from services.columnar import PACKED_MEDIA_TYPE, decode_frame, encode_predictions, is_columnar, media_type
+from services.streaming import STREAM_MEDIA_TYPES, BodyStreamingResponse, iter_chunks
+from services.feature_cache import get_feature_cache
+from services.instrumentation import METRICS, PROMETHEUS_CONTENT_TYPE
+from services.profiling import cached_profile_schema
+from services.search import SEARCH_MODEL_TYPES, build_trials
+from services.training import SUPPORTED_MODEL_TYPES, TrainingError, fetch_schema, parse_sampling, parse_series_options
+from services.forecasting import ForecastState, ForecastError
+from trainers.payload import POINT_MODES
+from trainers.export import artifact_paths, export_regression_model
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -19,23 +37,25 @@ logger = logging.getLogger(__name__)
 
 app = FastAPI(title="CCB ML Service", version="1.0.0")
 
-# Configurar dispositivo (GPU/CPU)
-ML_DEVICE_ENV = os.getenv("ML_DEVICE", "auto").lower()
+logger.info(f"Usando dispositivo: {DEVICE}")
 
-if ML_DEVICE_ENV == "auto":
-    CUDA_AVAILABLE = torch.cuda.is_available()
-    DEVICE = torch.device("cuda" if CUDA_AVAILABLE else "cpu")
-elif ML_DEVICE_ENV == "cuda":
-    DEVICE = torch.device("cuda")
-    CUDA_AVAILABLE = True
-else:
-    DEVICE = torch.device("cpu")
-    CUDA_AVAILABLE = False
+# Pool de conexiones compartido por todos los endpoints
+db_pool = get_pool()
 
-logger.info(f"Usando dispositivo: {DEVICE}")
+# Cola de entrenamientos en segundo plano
+job_queue = JobQueue(
+    executor=config.ML_JOB_EXECUTOR,
+    max_workers=config.ML_JOB_WORKERS,
+    max_attempts=config.ML_JOB_MAX_ATTEMPTS,
+    cpu_threads=config.ML_CPU_BUDGET,
+    interop_threads=config.ML_JOB_INTEROP_THREADS
+)
 
-# DB Settings
-DB_URL = os.getenv("DATABASE_URL", "postgres://user:password@db:5432/ml_db")
+# Caché de modelos para inferencia
+model_cache = ModelCache(
+    max_entries=config.MODEL_CACHE_MAX_ENTRIES,
+    max_bytes=config.MODEL_CACHE_MAX_MB * 1024 * 1024
+)
 
 # Pydantic Models
 class TrainRequest(BaseModel):
@@ -43,14 +63,37 @@ class TrainRequest(BaseModel):
     model_type: str = "regression"
     hyperparameters: Dict[str, Any] = {}
 
+class SearchRequest(BaseModel):
+    schema_id: str
+    model_type: str = "regression"          # regression | linear
+    hyperparameters: Dict[str, Any] = {}    # valores fijos de todos los trials
+    space: Dict[str, Any]                   # parámetro -> lista de valores o rango {min, max, log}
+    strategy: str = "grid"                  # grid | random
+    n_trials: int = 10                      # sólo random
+    workers: Optional[int] = None
+    prune: bool = True
+    seed: int = 42
+
 class ClusteringRequest(BaseModel):
     schema_id: str
     n_clusters: int = 3
+    max_rows: Optional[int] = None
+    sampling: Optional[str] = None     # reservoir | head | random | recent | stratified (con max_rows)
+    stratify_column: Optional[str] = None
+    recency_half_life_days: Optional[float] = None
+    max_points: Optional[int] = None   # tope de puntos devueltos (0 = todos)
+    point_mode: Optional[str] = None   # sample | grid | none
 
 class PredictRequest(BaseModel):
     model_id: str
     data: List[Dict[str, Any]]
 
+class ForecastRequest(BaseModel):
+    model_id: str
+    observations: List[float] = []
+    horizon: int = 30
+    samples: int = 0
+
 @app.get("/")
 async def root():
     return {"service": "CCB ML Service", "cuda": CUDA_AVAILABLE, "device": str(DEVICE)}
@@ -59,247 +102,393 @@ async def root():
 async def health():
     return {"status": "healthy", "device": str(DEVICE)}
 
-@app.post("/train")
-async def train_model(request: TrainRequest):
-    try:
-        conn = psycopg2.connect(DB_URL)
-        cursor = conn.cursor()
-        
-        # 1. Obtener datos y client_id
-        cursor.execute("SELECT client_id, columns FROM ml_schemas WHERE id = %s", (request.schema_id,))
-        schema_info = cursor.fetchone()
-        if not schema_info:
-            raise HTTPException(status_code=404, detail="Schema no encontrado")
-        
-        client_id, columns = schema_info
-        
-        cursor.execute("SELECT data FROM ml_data WHERE schema_id = %s LIMIT 10000", (request.schema_id,))
-        data = [row[0] for row in cursor.fetchall()]
-        
-        if not data:
-            raise HTTPException(status_code=404, detail="No hay datos")
+@app.on_event("startup")
+def startup():
+    job_queue.start()
 
-        target_column = request.hyperparameters.get("target_column") or columns[-1]
-        
-        # 2. Entrenar
-        if request.model_type == "regression":
-            trainer = RegressionTrainer(DEVICE)
-            X, y, feature_names = trainer.prepare_data(data, target_column)
-            
-            epochs = int(request.hyperparameters.get("epochs", 100))
-            lr = float(request.hyperparameters.get("learning_rate", 0.001))
-            bs = int(request.hyperparameters.get("batch_size", 32))
-            
-            model, metrics = trainer.train(X, y, epochs=epochs, learning_rate=lr, batch_size=bs)
-        
-        elif request.model_type == "time_series":
-            trainer = TimeSeriesTrainer(DEVICE)
-            
-            # Para series de tiempo necesitamos una columna de fecha
-            date_column = request.hyperparameters.get("date_column")
-            if not date_column:
-                 # Intentar inferir
-                 for col in data[0].keys(): # Ver primer registro
-                     if 'date' in col.lower() or 'fecha' in col.lower():
-                         date_column = col
-                         break
-            
-            if not date_column:
-                raise HTTPException(status_code=400, detail="Se requiere una columna de fecha para series de tiempo")
+@app.on_event("shutdown")
+def shutdown():
+    job_queue.shutdown()
+    db_pool.close()
 
-            seq_len = int(request.hyperparameters.get("sequence_length", 30))
-            
-            X, y, feature_names = trainer.prepare_data(data, target_column, date_column, seq_len)
-            
-            epochs = int(request.hyperparameters.get("epochs", 100))
-            lr = float(request.hyperparameters.get("learning_rate", 0.001))
-            bs = int(request.hyperparameters.get("batch_size", 32))
-            
-            model, metrics = trainer.train(X, y, epochs=epochs, learning_rate=lr, batch_size=bs)
-            
-        else:
-             raise HTTPException(status_code=400, detail="Tipo de modelo no soportado")
-            
-        # 3. Guardar en disco
-        model_id = str(uuid.uuid4())
-        model_path = f"/app/models/{model_id}.pt"
-        os.makedirs("/app/models", exist_ok=True)
-        
-        torch.save({
-            'model_state': model.state_dict(),
-            'feature_names': feature_names,
-            'target_column': target_column,
-            'metadata': trainer.feature_metadata
-        }, model_path)
-        
-        # 4. Registrar en DB
-        cursor.execute("""
-            INSERT INTO ml_models (id, schema_id, client_id, model_type, model_path, metrics, feature_metadata, target_column)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-        """, (
-            model_id, request.schema_id, client_id, request.model_type, 
-            model_path, json.dumps(metrics), json.dumps(trainer.feature_metadata), target_column
-        ))
-        conn.commit()
-        
-        cursor.close()
-        conn.close()
-        
-        return {"model_id": model_id, "metrics": metrics, "device": str(DEVICE)}
-        
+@app.get("/stats")
+async def stats():
+    return {
+        "model_cache": model_cache.stats(),
+        "db_pool": db_pool.stats(),
+        "jobs": job_queue.stats(),
+        "predict_batching": prediction_batcher.stats(),
+        "feature_cache": get_feature_cache().stats()
+    }
+
+@app.get("/metrics")
+def metrics():
+    """Histogramas de tiempo por etapa y contadores de /train, /train/clustering, /train/search y /predict (Prometheus)"""
+    return Response(content=METRICS.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+@app.post("/train", status_code=202)
+def train_model(request: TrainRequest):
+    """Encola el entrenamiento y devuelve el id del trabajo (consultar GET /jobs/{id})"""
+    if request.model_type not in SUPPORTED_MODEL_TYPES:
         raise HTTPException(status_code=400, detail="Tipo de modelo no soportado")
+    try:
+        parse_sampling(request.hyperparameters)
+        if request.model_type == "time_series":
+            parse_series_options(request.hyperparameters)
+        fetch_schema(request.schema_id)
+        job_id = job_queue.submit("train", request.schema_id, request.model_dump())
+        return {"job_id": job_id, "status": "queued"}
+    except TrainingError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         logger.error(f"Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/predict")
-async def predict(request: PredictRequest):
-    try:
-        conn = psycopg2.connect(DB_URL)
-        cursor = conn.cursor()
-        cursor.execute("SELECT model_path, feature_metadata, target_column FROM ml_models WHERE id = %s", (request.model_id,))
+def load_model(model_id: str) -> CachedModel:
+    """Carga desde DB + disco un modelo listo para inferencia (usado por la caché)"""
+    with db_pool.connection() as conn, conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT model_path, model_type, feature_metadata, target_column, metrics->'fan_chart_data'
+            FROM ml_models WHERE id = %s
+        """, (model_id,))
         row = cursor.fetchone()
-        if not row:
-            raise HTTPException(status_code=404, detail="Modelo no encontrado")
-        
-        model_path, metadata, target_col = row
-        checkpoint = torch.load(model_path, map_location=DEVICE)
-        
-        # Reconstruir modelo
-        feature_names = checkpoint['feature_names']
-        input_dim = len(feature_names)
-        model = SimpleRegressionModel(input_dim).to(DEVICE)
-        model.load_state_dict(checkpoint['model_state'])
-        model.load_state_dict(checkpoint['model_state'])
-        model.eval()
-        
-        # Lógica de inferencia específica por tipo (simple para regresión, compleja para TS)
-        # Por ahora asumimos regresión si no es TS
-        
-        # Preprocesar input
-        df = pd.DataFrame(request.data)
-        
-        # ... (resto de predict) ...
 
+    if not row:
+        raise HTTPException(status_code=404, detail="Modelo no encontrado")
 
-        # Normalizar nombres de columnas a lo que espera el modelo
-        # (Intentar mapear insensible a mayúsculas/minúsculas)
-        cols_lower = {c.lower(): c for c in df.columns}
-        
-        # Aplicar mismas transformaciones que en el entrenamiento
-        for col, meta in metadata.items():
-            if col == 'stats': continue
-            
-            # Buscar la columna original en el input (fiel o insensible)
-            orig_col = None
-            if col in df.columns:
-                orig_col = col
-            elif col.lower() in cols_lower:
-                orig_col = cols_lower[col.lower()]
-                df[col] = df[orig_col] # Renombrar internamente para coincidir con modelo
-            
-            if meta['type'] == 'categorical' and col in df.columns:
-                uniques = meta['uniques']
-                df[col] = df[col].apply(lambda x: uniques.index(x) if x in uniques else -1)
-        
-        # Manejar fechas (expandir antes de seleccionar features)
-        for col in list(df.columns):
-            if 'fecha' in col.lower() or 'date' in col.lower():
-                dates = pd.to_datetime(df[col], errors='coerce')
-                # Usar el nombre de columna que el modelo espera si es posible
-                model_col = next((fn for fn in feature_names if fn.lower().startswith(col.lower())), col)
-                if '_' in model_col:
-                    base_name = model_col.split('_')[0]
-                else:
-                    base_name = col
-                    
-                df[f'{base_name}_month'] = dates.dt.month.fillna(1)
-                df[f'{base_name}_day'] = dates.dt.dayofweek.fillna(0)
+    model_path, model_type, metadata, target_col, fan_chart = row
+    checkpoint = torch.load(model_path, map_location=DEVICE)
+    feature_names = checkpoint['feature_names']
 
-        # Seleccionar features y normalizar
-        stats = metadata['stats']
-        
-        # Asegurar que todas las features existen, si faltan, rellenar con 0 (o media si es común)
-        for col in feature_names:
-            if col not in df.columns:
-                logger.warning(f"Feature '{col}' faltante en input, rellenando con 0")
-                df[col] = 0
-                
-        X_df = df[feature_names].astype('float32')
-        for col in feature_names:
-            mean = stats['mean'].get(col, 0)
-            std = stats['std'].get(col, 1)
-            X_df[col] = (X_df[col] - mean) / (std + 1e-8)
-            
-        X_tensor = torch.from_numpy(X_df.values).to(DEVICE)
+    if model_type == "time_series":
+        return load_forecaster(model_id, checkpoint, metadata, target_col, fan_chart)
+
+    # Reconstruir modelo (el lineal es una sola capa: no necesita artefacto TorchScript)
+    model_class = LinearRegressionModel if model_type == "linear" else SimpleRegressionModel
+    model = model_class(len(feature_names)).to(DEVICE)
+    model.load_state_dict(checkpoint['model_state'])
+    model.eval()
+    nbytes = None
+    if model_type == "regression" and config.ML_INFERENCE_TORCHSCRIPT:
+        artifact = load_inference_artifact(model, len(feature_names), model_path)
+        if artifact is not None:
+            model, nbytes = artifact
+
+    # Pipeline de preprocesamiento (los checkpoints antiguos sólo traen feature_metadata)
+    if 'pipeline' in checkpoint:
+        pipeline = TabularPipeline.from_dict(checkpoint['pipeline'])
+    else:
+        pipeline = TabularPipeline.from_feature_metadata(metadata, feature_names)
+
+    logger.info(f"Modelo {model_id} cargado en caché")
+    return CachedModel(model, model_type, feature_names, metadata, target_col, pipeline, nbytes=nbytes)
+
+def load_inference_artifact(model: torch.nn.Module, input_dim: int, model_path: str):
+    """
+    Carga el TorchScript congelado (o su variante int8 en CPU) exportado junto al checkpoint.
+    Los modelos anteriores a la exportación se exportan aquí la primera vez que se cargan.
+    Devuelve (módulo, bytes) o None para seguir con el modelo eager.
+    """
+    quantized = config.ML_INFERENCE_QUANTIZED and DEVICE.type == "cpu"
+    path = artifact_paths(model_path)["int8" if quantized else "torchscript"]
+    try:
+        if not os.path.exists(path):
+            export_regression_model(model, input_dim, model_path, quantize=quantized)
+        module = torch.jit.load(path, map_location=DEVICE)
+        return module, os.path.getsize(path)
+    except Exception as e:
+        logger.warning(f"Artefacto de inferencia no disponible ({e}), se usa el modelo eager")
+        return None
+
+def load_forecaster(model_id: str, checkpoint: Dict[str, Any], metadata: Dict[str, Any], target_col: str, fan_chart: Optional[Dict[str, Any]]) -> CachedModel:
+    """Reconstruye un LSTMModel y su estado de pronóstico a partir del checkpoint"""
+    feature_names = checkpoint['feature_names']
+    model = LSTMModel(input_dim=len(feature_names)).to(DEVICE)
+    model.load_state_dict(checkpoint['model_state'])
+    model.eval()
+
+    stats = checkpoint['metadata']['stats']
+    seq_len = int(stats['sequence_length'])
+    context = checkpoint.get('forecast')
+    if context:
+        window, sigma = context['last_window'], context['sigma']
+    else:
+        # Checkpoints antiguos: la historia del fan chart son los últimos valores reales de la serie
+        history = (fan_chart or {}).get('history') or []
+        window = [(v - stats['target_mean']) / stats['target_std'] for v in history[-seq_len:]]
+        sigma = float((fan_chart or {}).get('sigma_real', 0.0)) / stats['target_std']
+
+    forecaster = ForecastState(
+        model, DEVICE,
+        target_mean=stats['target_mean'],
+        target_std=stats['target_std'],
+        sequence_length=seq_len,
+        window=window,
+        sigma=sigma,
+        reanchor_steps=config.ML_FORECAST_REANCHOR_STEPS
+    )
+    logger.info(f"Modelo de series de tiempo {model_id} cargado en caché")
+    return CachedModel(model, "time_series", feature_names, metadata, target_col, forecaster=forecaster)
+
+def run_prediction(cached: CachedModel, rows: Union[List[Dict[str, Any]], pd.DataFrame]) -> np.ndarray:
+    """Preprocesa un lote de filas con el pipeline del entrenamiento y hace una pasada del modelo"""
+    with METRICS.timed("predict", cached.model_type, "preprocess"):
+        X = cached.pipeline.transform(rows)
+        X_tensor = torch.from_numpy(X).to(DEVICE)
+    with METRICS.timed("predict", cached.model_type, "forward"), torch.no_grad():
+        return cached.model(X_tensor).cpu().numpy().reshape(-1)
+
+# Agrupa peticiones concurrentes del mismo modelo en una sola pasada
+prediction_batcher = PredictionBatcher(
+    run_prediction,
+    window_ms=config.ML_PREDICT_BATCH_WINDOW_MS,
+    max_batch_rows=config.ML_PREDICT_MAX_BATCH_ROWS
+)
+
+PREDICT_BODY_DOC = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {"schema": PredictRequest.model_json_schema()},
+            "text/csv": {"schema": {"type": "string"}},
+            "application/vnd.apache.arrow.stream": {"schema": {"type": "string", "format": "binary"}}
+        }
+    }
+}
+
+@app.post("/predict", openapi_extra=PREDICT_BODY_DOC)
+async def predict(request: Request, model_id: Optional[str] = None):
+    """
+    Predicción por lote. El cuerpo puede ser JSON (`PredictRequest`) o columnar
+    (CSV / Arrow IPC, con `model_id` como query param). La entrada columnar se
+    responde con las predicciones como float32 empaquetados (octet-stream), salvo
+    que se pida `Accept: application/json`; la JSON, al revés.
+    """
+    started = time.perf_counter()
+    body = await request.body()
+    columnar = is_columnar(request.headers.get("content-type"))
+    accept = request.headers.get("accept", "")
+    packed = PACKED_MEDIA_TYPE in accept if not columnar else "application/json" not in accept
+
+    if columnar:
+        if not model_id:
+            raise HTTPException(status_code=400, detail="model_id es requerido como query param")
+        try:
+            rows = await run_in_threadpool(decode_frame, body, request.headers["content-type"])
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Cuerpo columnar inválido: {e}")
+    else:
+        try:
+            payload = PredictRequest.model_validate_json(body)
+        except ValidationError as e:
+            raise RequestValidationError(e.errors())
+        model_id, rows = payload.model_id, payload.data
+
+    model_type = None
+    try:
+        load_started = time.perf_counter()
+        cached = await run_in_threadpool(model_cache.get_or_load, model_id, load_model)
+        model_type = cached.model_type
+        METRICS.observe("predict", model_type, "model_load", time.perf_counter() - load_started)
+        if cached.forecaster is not None:
+            raise HTTPException(status_code=400, detail="Los modelos de series de tiempo se consultan con /forecast")
         
-        with torch.no_grad():
-            preds = model(X_tensor).cpu().numpy().flatten().tolist()
-            
-        cursor.close()
-        conn.close()
-        return {"predictions": preds, "model_id": request.model_id}
+        if columnar:
+            # Ya viene como lote columnar: una sola pasada, sin pasar por el agrupador
+            preds = await run_in_threadpool(run_prediction, cached, rows)
+        else:
+            preds = await prediction_batcher.submit(model_id, cached, rows)
+
+        with METRICS.timed("predict", model_type, "serialize"):
+            if packed:
+                response = Response(
+                    content=encode_predictions(preds),
+                    media_type=PACKED_MEDIA_TYPE,
+                    headers={"X-Model-Id": model_id, "X-Rows": str(len(preds))}
+                )
+            else:
+                response = {"predictions": preds.tolist(), "model_id": model_id}
+        METRICS.observe("predict", model_type, "total", time.perf_counter() - started)
+        METRICS.count("predict", model_type, "completed")
+        return response
         
+    except HTTPException:
+        METRICS.count("predict", model_type, "failed")
+        raise
     except Exception as e:
+        METRICS.count("predict", model_type, "failed")
         logger.error(f"Error predicción: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/train/clustering")
-async def train_clustering(request: ClusteringRequest):
+@app.post("/predict/stream")
+async def predict_stream(request: Request, model_id: str):
+    """
+    Predicción en streaming: el cuerpo (NDJSON o CSV) se procesa en lotes de
+    ML_PREDICT_STREAM_CHUNK_ROWS filas a medida que llega, y cada lote se responde
+    apenas se calcula. La memoria no depende del tamaño del archivo.
+
+    Respuesta NDJSON: una línea {"offset", "predictions"} por lote y al final {"rows", "done"};
+    si un lote falla se emite {"error", "offset"} y se corta. Con Accept: application/octet-stream
+    se devuelven float32 empaquetados.
+    """
+    kind = media_type(request.headers.get("content-type"))
+    if kind not in STREAM_MEDIA_TYPES:
+        raise HTTPException(status_code=415, detail=f"Content-Type debe ser uno de {STREAM_MEDIA_TYPES}")
+
     try:
-        conn = psycopg2.connect(DB_URL)
-        cursor = conn.cursor()
-        
-        # Obtener datos
-        cursor.execute("SELECT data FROM ml_data WHERE schema_id = %s LIMIT 5000", (request.schema_id,))
-        rows = cursor.fetchall()
-        
-        if not rows:
-            raise HTTPException(status_code=404, detail="No hay datos para agrupar")
-            
-        data = [r[0] for r in rows]
-        
-        trainer = ClusteringTrainer()
-        result = trainer.train(data, n_clusters=request.n_clusters)
-        
-        return result
-        
+        cached = await run_in_threadpool(model_cache.get_or_load, model_id, load_model)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error cargando modelo: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    if cached.forecaster is not None:
+        raise HTTPException(status_code=400, detail="Los modelos de series de tiempo se consultan con /forecast")
+
+    packed = PACKED_MEDIA_TYPE in request.headers.get("accept", "")
+
+    async def generate():
+        offset = 0
+        try:
+            async for rows in iter_chunks(request.stream(), kind, config.ML_PREDICT_STREAM_CHUNK_ROWS):
+                preds = await run_in_threadpool(run_prediction, cached, rows)
+                if packed:
+                    yield encode_predictions(preds)
+                else:
+                    yield orjson.dumps({"offset": offset, "predictions": preds}, option=orjson.OPT_SERIALIZE_NUMPY) + b"\n"
+                offset += len(preds)
+        except Exception as e:
+            # El status 200 ya se envió: el error viaja en el propio stream
+            logger.error(f"Error predicción en streaming (fila {offset}): {e}")
+            if not packed:
+                yield orjson.dumps({"error": str(e), "offset": offset}) + b"\n"
+            return
+        if not packed:
+            yield orjson.dumps({"rows": offset, "done": True}) + b"\n"
+
+    return BodyStreamingResponse(
+        generate(),
+        media_type=PACKED_MEDIA_TYPE if packed else "application/x-ndjson",
+        headers={"X-Model-Id": model_id}
+    )
+
+@app.post("/forecast")
+def forecast(request: ForecastRequest):
+    """
+    Agrega observaciones nuevas al estado cacheado del modelo LSTM y proyecta `horizon` pasos.
+    Las observaciones persisten en la caché: la siguiente llamada continúa desde ellas. No se
+    guardan en disco: si el modelo sale de la caché o el servicio se reinicia, se vuelve a la
+    ventana del checkpoint.
+    """
+    if not 1 <= request.horizon <= config.ML_FORECAST_MAX_HORIZON:
+        raise HTTPException(status_code=400, detail=f"horizon debe estar entre 1 y {config.ML_FORECAST_MAX_HORIZON}")
+    if not 0 <= request.samples <= config.ML_FORECAST_MAX_SAMPLES:
+        raise HTTPException(status_code=400, detail=f"samples debe estar entre 0 y {config.ML_FORECAST_MAX_SAMPLES}")
+    try:
+        cached = model_cache.get_or_load(request.model_id, load_model)
+        if cached.forecaster is None:
+            raise HTTPException(status_code=400, detail="El modelo no es de series de tiempo")
+
+        appended, state, window = cached.forecaster.append_and_snapshot(request.observations)
+        result = cached.forecaster.forecast(request.horizon, request.samples, state=state)
+        return {
+            "model_id": request.model_id,
+            "observations_appended": appended,
+            "history": cached.forecaster.history(window),
+            **result
+        }
+
+    except HTTPException:
+        raise
+    except ForecastError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error pronóstico: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/train/search", status_code=202)
+def train_search(request: SearchRequest):
+    """Encola una búsqueda de hiperparámetros; sólo se registra el mejor modelo (consultar GET /jobs/{id})"""
+    try:
+        if request.model_type not in SEARCH_MODEL_TYPES:
+            raise TrainingError(f"model_type debe ser uno de {SEARCH_MODEL_TYPES}")
+        build_trials(request.space, request.strategy, request.n_trials, request.seed)
+        fetch_schema(request.schema_id)
+        job_id = job_queue.submit("search", request.schema_id, request.model_dump())
+        return {"job_id": job_id, "status": "queued"}
+    except TrainingError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error search: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/train/clustering", status_code=202)
+def train_clustering(request: ClusteringRequest):
+    """Encola el clustering y devuelve el id del trabajo (consultar GET /jobs/{id})"""
+    if request.point_mode and request.point_mode not in POINT_MODES:
+        raise HTTPException(status_code=400, detail=f"point_mode debe ser uno de {POINT_MODES}")
+    try:
+        parse_sampling(request.model_dump())
+        fetch_schema(request.schema_id)
+        job_id = job_queue.submit("clustering", request.schema_id, request.model_dump())
+        return {"job_id": job_id, "status": "queued"}
+    except TrainingError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         logger.error(f"Error clustering: {e}")
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        if 'conn' in locals(): conn.close()
-        if 'cursor' in locals(): cursor.close()
+
+@app.get("/schemas/{schema_id}/profile", response_class=ORJSONResponse)
+def schema_profile(schema_id: str):
+    """Perfil de columnas del schema (tipo inferido, nulos, media/desvío, cardinalidad) calculado en Postgres"""
+    try:
+        fetch_schema(schema_id)
+        return {"schema_id": schema_id, "columns": cached_profile_schema(schema_id)}
+    except TrainingError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error perfilando schema: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    try:
+        job = job_queue.get(job_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if not job:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    # El resultado de un clustering puede traer cientos de miles de puntos: se serializa con orjson directo
+    return ORJSONResponse(job)
 
 @app.get("/models")
-async def list_models(client_id: str = None):
+def list_models(client_id: str = None):
     try:
-        conn = psycopg2.connect(DB_URL)
-        cursor = conn.cursor()
-        if client_id:
-            cursor.execute("SELECT id, schema_id, model_type, metrics, target_column, created_at FROM ml_models WHERE client_id = %s ORDER BY created_at DESC", (client_id,))
-        else:
-            cursor.execute("SELECT id, schema_id, model_type, metrics, target_column, created_at FROM ml_models ORDER BY created_at DESC")
+        with db_pool.connection() as conn, conn.cursor() as cursor:
+            if client_id:
+                cursor.execute("SELECT id, schema_id, model_type, metrics, target_column, created_at FROM ml_models WHERE client_id = %s ORDER BY created_at DESC", (client_id,))
+            else:
+                cursor.execute("SELECT id, schema_id, model_type, metrics, target_column, created_at FROM ml_models ORDER BY created_at DESC")
+            rows = cursor.fetchall()
         
         models = []
-        for r in cursor.fetchall():
+        for r in rows:
+            # La metadata de features (categorías incluidas) se consulta en /models/{id}
+            metrics = {k: v for k, v in (r[3] or {}).items() if k != 'metadata'}
             models.append({
                 "id": r[0], "schema_id": r[1], "type": r[2], 
-                "metrics": r[3], "target": r[4], "created_at": r[5].isoformat()
+                "metrics": metrics, "target": r[4], "created_at": r[5].isoformat()
             })
-        cursor.close()
-        conn.close()
-        return {"models": models}
+        return ORJSONResponse({"models": models})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/models/{model_id}")
-async def get_model_details(model_id: str):
+def get_model_details(model_id: str):
     try:
-        conn = psycopg2.connect(DB_URL)
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, schema_id, model_type, metrics, feature_metadata, target_column, created_at FROM ml_models WHERE id = %s", (model_id,))
-        r = cursor.fetchone()
+        with db_pool.connection() as conn, conn.cursor() as cursor:
+            cursor.execute("SELECT id, schema_id, model_type, metrics, feature_metadata, target_column, created_at FROM ml_models WHERE id = %s", (model_id,))
+            r = cursor.fetchone()
         if not r:
             raise HTTPException(status_code=404, detail="Modelo no encontrado")
         
@@ -307,26 +496,26 @@ async def get_model_details(model_id: str):
             "id": r[0], "schema_id": r[1], "type": r[2], 
             "metrics": r[3], "feature_metadata": r[4], "target": r[5], "created_at": r[6].isoformat()
         }
-        cursor.close()
-        conn.close()
         return res
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/models/{model_id}")
-async def delete_model(model_id: str):
+def delete_model(model_id: str):
     try:
-        conn = psycopg2.connect(DB_URL)
-        cursor = conn.cursor()
-        cursor.execute("SELECT model_path FROM ml_models WHERE id = %s", (model_id,))
-        row = cursor.fetchone()
-        if row and os.path.exists(row[0]):
-            os.remove(row[0])
-        
-        cursor.execute("DELETE FROM ml_models WHERE id = %s", (model_id,))
-        conn.commit()
-        cursor.close()
-        conn.close()
+        with db_pool.connection() as conn, conn.cursor() as cursor:
+            cursor.execute("SELECT model_path FROM ml_models WHERE id = %s", (model_id,))
+            row = cursor.fetchone()
+            if row:
+                for path in [row[0], *artifact_paths(row[0]).values()]:
+                    if os.path.exists(path):
+                        os.remove(path)
+            
+            cursor.execute("DELETE FROM ml_models WHERE id = %s", (model_id,))
+            conn.commit()
+        model_cache.invalidate(model_id)
         return {"success": True}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,131 @@
+"""
+Agrupación dinámica de peticiones /predict concurrentes (micro-batching)
+"""
+import asyncio
+import threading
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+BatchFn = Callable[[Any, List[Dict[str, Any]]], np.ndarray]
+
+
+class _PendingBatch:
+    """Filas acumuladas para un modelo mientras la ventana está abierta"""
+
+    def __init__(self, cached: Any):
+        self.cached = cached
+        self.rows: List[Dict[str, Any]] = []
+        self.waiters: List[Tuple[asyncio.Future, int, int]] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+    def add(self, rows: List[Dict[str, Any]], future: asyncio.Future):
+        start = len(self.rows)
+        self.rows.extend(rows)
+        self.waiters.append((future, start, len(self.rows)))
+
+
+class PredictionBatcher:
+    """
+    Encola las filas de cada /predict por model_id durante `window_ms` (o hasta
+    `max_batch_rows`) y ejecuta una sola pasada de `run_batch` para todas; luego
+    reparte las predicciones a cada petición. window_ms = 0 desactiva la espera.
+    """
+
+    def __init__(self, run_batch: BatchFn, window_ms: float = 5.0, max_batch_rows: int = 4096):
+        self.run_batch = run_batch
+        self.window = window_ms / 1000.0
+        self.max_batch_rows = max_batch_rows
+        self._pending: Dict[str, _PendingBatch] = {}
+        self._tasks: set = set()
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.batches = 0
+        self.rows = 0
+        self.fallbacks = 0
+
+    async def submit(self, model_id: str, cached: Any, rows: List[Dict[str, Any]]) -> np.ndarray:
+        if self.window <= 0 or len(rows) >= self.max_batch_rows:
+            self._count(1, len(rows))
+            return await run_in_threadpool(self.run_batch, cached, rows)
+
+        loop = asyncio.get_running_loop()
+        batch = self._pending.get(model_id)
+        # Si el modelo se recargó (otra entrada de caché) no se mezcla con el lote anterior
+        if batch is not None and (batch.cached is not cached or len(batch.rows) + len(rows) > self.max_batch_rows):
+            self._flush(model_id, batch)
+            batch = None
+        if batch is None:
+            batch = _PendingBatch(cached)
+            self._pending[model_id] = batch
+            batch.timer = loop.call_later(self.window, self._flush, model_id, batch)
+
+        future = loop.create_future()
+        batch.add(rows, future)
+        if len(batch.rows) >= self.max_batch_rows:
+            self._flush(model_id, batch)
+        return await future
+
+    def _flush(self, model_id: str, batch: _PendingBatch):
+        if self._pending.get(model_id) is batch:
+            del self._pending[model_id]
+        if batch.timer is not None:
+            batch.timer.cancel()
+        task = asyncio.ensure_future(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: _PendingBatch):
+        self._count(len(batch.waiters), len(batch.rows))
+        try:
+            preds = await run_in_threadpool(self.run_batch, batch.cached, batch.rows)
+        except Exception as e:
+            if len(batch.waiters) == 1:
+                self._resolve(batch.waiters[0][0], exception=e)
+                return
+            # Una petición con datos inválidos no debe tumbar a las demás: reintentar por separado
+            logger.warning(f"Lote de {len(batch.waiters)} peticiones falló ({e}), reintentando por separado")
+            with self._lock:
+                self.fallbacks += 1
+            for future, start, end in batch.waiters:
+                try:
+                    result = await run_in_threadpool(self.run_batch, batch.cached, batch.rows[start:end])
+                    self._resolve(future, result=result)
+                except Exception as single_error:
+                    self._resolve(future, exception=single_error)
+            return
+
+        for future, start, end in batch.waiters:
+            self._resolve(future, result=preds[start:end])
+
+    @staticmethod
+    def _resolve(future: asyncio.Future, result: Any = None, exception: Optional[Exception] = None):
+        # La petición pudo haberse cancelado (cliente desconectado)
+        if future.done():
+            return
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+
+    def _count(self, requests: int, rows: int):
+        with self._lock:
+            self.requests += requests
+            self.batches += 1
+            self.rows += rows
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "window_ms": self.window * 1000.0,
+                "max_batch_rows": self.max_batch_rows,
+                "requests": self.requests,
+                "batches": self.batches,
+                "rows": self.rows,
+                "avg_requests_per_batch": round(self.requests / self.batches, 2) if self.batches else 0.0,
+                "fallbacks": self.fallbacks
+            }
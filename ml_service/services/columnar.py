@@ -0,0 +1,42 @@
+"""
+Formatos columnares para /predict: CSV o Arrow IPC de entrada y float32 empaquetado de salida
+"""
+import io
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+CSV_MEDIA_TYPES = ("text/csv",)
+ARROW_MEDIA_TYPES = ("application/vnd.apache.arrow.stream", "application/vnd.apache.arrow.file")
+PACKED_MEDIA_TYPE = "application/octet-stream"
+
+
+def media_type(content_type: Optional[str]) -> str:
+    """Tipo de contenido sin parámetros (charset, etc.)"""
+    return (content_type or "").split(";")[0].strip().lower()
+
+
+def is_columnar(content_type: Optional[str]) -> bool:
+    return media_type(content_type) in CSV_MEDIA_TYPES + ARROW_MEDIA_TYPES
+
+
+def decode_frame(body: bytes, content_type: str) -> pd.DataFrame:
+    """
+    Decodifica el cuerpo directamente a columnas, sin pasar por un dict por fila.
+    En CSV las celdas vacías se mantienen como texto vacío, igual que llegan en JSON.
+    """
+    kind = media_type(content_type)
+    if kind in CSV_MEDIA_TYPES:
+        return pd.read_csv(io.BytesIO(body), keep_default_na=False, na_values=[])
+    if kind == "application/vnd.apache.arrow.file":
+        return pa.ipc.open_file(pa.py_buffer(body)).read_all().to_pandas()
+    if kind in ARROW_MEDIA_TYPES:
+        return pa.ipc.open_stream(pa.py_buffer(body)).read_all().to_pandas()
+    raise ValueError(f"Formato columnar no soportado: {content_type}")
+
+
+def encode_predictions(predictions: np.ndarray) -> bytes:
+    """Predicciones como float32 little-endian contiguos (4 bytes por fila)"""
+    return np.ascontiguousarray(predictions, dtype="<f4").tobytes()
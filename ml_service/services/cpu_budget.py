@@ -0,0 +1,69 @@
+"""
+Reparto de núcleos entre trabajos de entrenamiento concurrentes (sin sobresuscripción de hilos)
+"""
+import os
+import logging
+from typing import Any, Dict
+
+import torch
+from threadpoolctl import threadpool_limits
+
+logger = logging.getLogger(__name__)
+
+# Variables que leen los runtimes nativos (OpenMP, MKL, OpenBLAS, numexpr) al iniciarse
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "NUMEXPR_NUM_THREADS")
+
+
+class CpuBudget:
+    """
+    Presupuesto de `total_threads` hilos repartido en partes iguales entre `max_jobs` trabajos
+    simultáneos. La cola de trabajos admite como mucho `max_jobs` a la vez (el resto espera en
+    la cola del executor) y, con procesos worker, cada uno corre con `threads_per_job` hilos
+    intra-op de torch y el mismo tope para BLAS/OpenMP (numpy, scikit-learn). Con hilos esos
+    límites son del proceso entero: sólo se aplica el total (`per_job = False`).
+    """
+
+    def __init__(self, total_threads: int, max_jobs: int, interop_threads: int = 1, per_job: bool = True):
+        self.total_threads = total_threads if total_threads > 0 else (os.cpu_count() or 1)
+        self.max_jobs = max(max_jobs, 1)
+        self.threads_per_job = max(self.total_threads // self.max_jobs, 1)
+        self.interop_threads = max(interop_threads, 1)
+        self.per_job = per_job
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "total_threads": self.total_threads,
+            "max_jobs": self.max_jobs,
+            "threads_per_job": self.threads_per_job if self.per_job else None,
+            "interop_threads": self.interop_threads,
+            "per_job": self.per_job
+        }
+
+
+def init_process_threads(threads: int, interop_threads: int = 1):
+    """
+    Para procesos worker: fija las variables de entorno (las heredan sus propios subprocesos)
+    y los hilos inter-op de torch, que sólo se pueden fijar antes del primer uso.
+    """
+    for var in THREAD_ENV_VARS:
+        os.environ[var] = str(threads)
+    set_thread_limits(threads)
+    set_interop_threads(interop_threads)
+
+
+def set_thread_limits(threads: int):
+    """
+    Fija a `threads` los hilos intra-op de torch y los pools BLAS/OpenMP del proceso y no los
+    restaura: son globales, así que restaurarlos al terminar un trabajo los levantaría para los
+    que siguen corriendo.
+    """
+    torch.set_num_threads(threads)
+    threadpool_limits(limits=threads)
+
+
+def set_interop_threads(interop_threads: int):
+    """Hilos inter-op de torch del proceso; sólo se pueden fijar antes de su primer uso"""
+    try:
+        torch.set_num_interop_threads(interop_threads)
+    except RuntimeError:
+        logger.warning(f"El pool inter-op de torch ya estaba creado; se mantienen {torch.get_num_interop_threads()} hilos")
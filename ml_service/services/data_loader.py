@@ -0,0 +1,499 @@
+"""
+Carga en streaming de ml_data a columnas (memoria acotada, sin lista de dicts intermedia)
+"""
+import io
+import json
+import math
+import random
+import logging
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import orjson
+import pandas as pd
+import pyarrow as pa
+import pyarrow.json as pa_json
+
+import config
+from services.db import get_pool
+from services.instrumentation import stage
+
+logger = logging.getLogger(__name__)
+
+# reservoir: muestra uniforme en Python sobre el stream; head: primeras N filas;
+# random / recent / stratified: la muestra se arma en Postgres y sólo viajan `max_rows` filas
+SAMPLING_STRATEGIES = ("reservoir", "head", "random", "recent", "stratified")
+SQL_SAMPLING_STRATEGIES = ("random", "recent", "stratified")
+
+# Texto que pd.to_numeric aceptaría (aproximación en regex de Postgres)
+NUMERIC_PATTERN = r'^\s*[-+]?([0-9]+(\.[0-9]*)?|\.[0-9]+)([eE][-+]?[0-9]{1,3})?\s*$'
+# Fechas ISO (YYYY-MM-DD...): su orden como texto es el cronológico
+ISO_DATE_PATTERN = r'^[0-9]{4}-(0[1-9]|1[0-2])-(0[1-9]|[12][0-9]|3[01])'
+
+# Remuestreo de series: frecuencia -> frecuencia de pandas (períodos rotulados por su inicio)
+SERIES_FREQUENCIES = {"day": "D", "week": "W-MON", "month": "MS"}
+SERIES_AGGREGATIONS = ("sum", "mean")
+
+# Filas más antiguas y más nuevas que se miran para descubrir las claves de un schema
+DATA_KEYS_SAMPLE_ROWS = 1000
+
+# Columnas de números JSON según pd.api.types.infer_dtype: se pasan a float64 (int64 los enteros
+# sin nulos), como hacía pd.DataFrame sobre la lista de dicts
+_NUMERIC_DTYPES = ("integer", "floating", "mixed-integer-float")
+
+
+# Bloque decodificado: {clave: array de objetos} con una posición por fila
+Columns = Dict[str, np.ndarray]
+
+
+def decode_row(text: str) -> Dict[str, Any]:
+    """JSON de una fila con orjson; json de la stdlib sólo para enteros de más de 64 bits"""
+    try:
+        return orjson.loads(text)
+    except orjson.JSONDecodeError:
+        return json.loads(text)
+
+
+def rows_to_columns(rows: List[Dict[str, Any]]) -> Columns:
+    """Columnas de un bloque de filas ya decodificadas, con las claves en orden de aparición"""
+    # Las filas que no son objetos JSON quedan sin claves (nulos) para no desalinear el bloque
+    rows = [row if isinstance(row, dict) else {} for row in rows]
+    # Lo habitual es que la primera fila tenga todas las claves
+    keys = dict.fromkeys(rows[0]) if rows else {}
+    if set().union(*rows).difference(keys):
+        keys = dict.fromkeys(key for row in rows for key in row)
+    return {key: np.fromiter((row.get(key) for row in rows), dtype=object, count=len(rows)) for key in keys}
+
+
+def _arrow_to_objects(column: pa.ChunkedArray) -> np.ndarray:
+    """Columna de Arrow como array de objetos Python (nulos como None, o NaN en los números)"""
+    if pa.types.is_nested(column.type):
+        return np.fromiter(column.to_pylist(), dtype=object, count=len(column))
+    return column.to_numpy(zero_copy_only=False).astype(object, copy=False)
+
+
+class ChunkDecoder:
+    """
+    Decodifica cada bloque de un stream de una sola vez con el lector NDJSON de pyarrow, que
+    arma las columnas en C sin crear un dict por fila.
+
+    pyarrow infiere timestamps a partir de textos ISO: esas claves se vuelven a leer como texto
+    (y se fijan así para los bloques siguientes) para conservar el valor original. Si una clave
+    mezcla tipos en el bloque (p.ej. número y texto) ese bloque se decodifica fila a fila.
+    """
+
+    def __init__(self):
+        self.text_columns: Dict[str, None] = {}
+        self.key_order: Dict[str, None] = {}
+
+    def _read(self, payload: bytes) -> pa.Table:
+        schema = pa.schema([(key, pa.string()) for key in self.text_columns]) if self.text_columns else None
+        return pa_json.read_json(
+            io.BytesIO(payload),
+            read_options=pa_json.ReadOptions(block_size=len(payload) + 1),
+            parse_options=pa_json.ParseOptions(explicit_schema=schema, unexpected_field_behavior="infer")
+        )
+
+    def decode(self, texts: List[str]) -> Columns:
+        payload = "\n".join(texts).encode()
+        try:
+            table = self._read(payload)
+            inferred = [field.name for field in table.schema if pa.types.is_temporal(field.type)]
+            if inferred:
+                self.key_order.update(dict.fromkeys(table.column_names))
+                self.text_columns.update(dict.fromkeys(inferred))
+                table = self._read(payload)
+        except pa.ArrowInvalid:
+            columns = rows_to_columns([decode_row(text) for text in texts])
+            self.key_order.update(dict.fromkeys(columns))
+            return columns
+
+        # Las claves fijadas como texto van primero en la tabla (y aparecen aunque el bloque no las
+        # tenga): se descartan las vacías y se respeta el orden de aparición
+        names = [
+            name for name in table.column_names
+            if name not in self.text_columns or table.column(name).null_count < table.num_rows
+        ]
+        self.key_order.update(dict.fromkeys(names))
+        names.sort(key=list(self.key_order).index)
+        return {name: _arrow_to_objects(table.column(name)) for name in names}
+
+
+class ColumnarBuffer:
+    """
+    Arrays de objetos preasignados, uno por clave JSON. Los bloques decodificados se copian
+    columna por columna (append_columns) y las filas sueltas del muestreo se escriben en su
+    posición. Al armar el DataFrame las columnas que sólo tienen números se convierten a float64.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = max(int(capacity), 1)
+        self.size = 0
+        self.columns: Dict[str, np.ndarray] = {}
+
+    def _column(self, key: str) -> np.ndarray:
+        column = self.columns.get(key)
+        if column is None:
+            # Clave nueva: las filas anteriores quedan como None (nulo)
+            column = np.full(self.capacity, None, dtype=object)
+            self.columns[key] = column
+        return column
+
+    def _grow(self):
+        self.capacity *= 2
+        for key, column in self.columns.items():
+            grown = np.full(self.capacity, None, dtype=object)
+            grown[:len(column)] = column
+            self.columns[key] = grown
+
+    def append_columns(self, columns: Columns, n: int):
+        """Agrega un bloque de `n` filas con una copia por clave en lugar de una escritura por valor"""
+        if n <= 0:
+            return
+        start = self.size
+        while start + n > self.capacity:
+            self._grow()
+        # Las claves ausentes del bloque quedan en None: esas posiciones nunca se escribieron
+        for key, values in columns.items():
+            self._column(key)[start:start + n] = values
+        self.size = start + n
+
+    def replace_rows(self, positions: np.ndarray, columns: Columns, indices: np.ndarray):
+        """Reemplaza las filas en `positions` por las filas `indices` de un bloque (muestreo)"""
+        if len(positions) == 0:
+            return
+        for key, column in self.columns.items():
+            if key not in columns:
+                column[positions] = None
+        for key, values in columns.items():
+            self._column(key)[positions] = values[indices]
+
+    def to_frame(self) -> pd.DataFrame:
+        """DataFrame con los mismos dtypes que pd.DataFrame(lista de dicts)"""
+        return pd.DataFrame({key: _typed(column[:self.size]) for key, column in self.columns.items()}, copy=False)
+
+
+def _typed(values: np.ndarray) -> np.ndarray:
+    """
+    Tipo de una columna de objetos: enteros sin nulos a int64, números a float64 y booleanos sin
+    nulos a bool; los textos, mezclas y columnas con nulos no numéricos siguen siendo de objetos.
+    """
+    kind = pd.api.types.infer_dtype(values, skipna=True)
+    if kind not in _NUMERIC_DTYPES and kind != "boolean":
+        return values
+    has_nulls = bool(pd.isna(values).any())
+    if kind == "boolean":
+        return values.astype(np.bool_) if not has_nulls else values
+    if kind == "integer" and not has_nulls:
+        try:
+            return values.astype(np.int64)
+        except OverflowError:
+            # Enteros de más de 64 bits: como en pandas, quedan de objetos
+            return values
+    return values.astype(np.float64)
+
+
+def _created_filter(schema_id: str, created_after: Optional[datetime] = None,
+                    created_until: Optional[datetime] = None) -> Tuple[str, tuple]:
+    """
+    WHERE de ml_data por schema y, opcionalmente, por rango de created_at (after, until]. Sólo las
+    filas cuyo `data` es un objeto JSON (un array o escalar no tiene columnas).
+    """
+    where = "schema_id = %s AND jsonb_typeof(data) = 'object'"
+    params: tuple = (schema_id,)
+    if created_after is not None:
+        where += " AND created_at > %s"
+        params += (created_after,)
+    if created_until is not None:
+        where += " AND created_at <= %s"
+        params += (created_until,)
+    return where, params
+
+
+def count_rows(schema_id: str, created_after: Optional[datetime] = None,
+               created_until: Optional[datetime] = None) -> int:
+    where, params = _created_filter(schema_id, created_after, created_until)
+    with get_pool().connection() as conn, conn.cursor() as cursor, stage("fetch"):
+        cursor.execute(f"SELECT COUNT(*) FROM ml_data WHERE {where}", params)
+        return cursor.fetchone()[0]
+
+
+def data_fingerprint(schema_id: str) -> Tuple[int, Optional[str]]:
+    """Versión de los datos del schema: (filas, último created_at); cambia con cada carga"""
+    with get_pool().connection() as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*), MAX(created_at) FROM ml_data WHERE schema_id = %s", (schema_id,))
+        count, last_created = cursor.fetchone()
+    return count, last_created.isoformat() if last_created is not None else None
+
+
+def data_keys(schema_id: str) -> List[str]:
+    """
+    Claves JSON de las filas del schema, en el orden en que aparecerían como columnas al cargarlo
+    (las de las filas más antiguas primero). A diferencia de ml_schemas.columns, que guarda la
+    lista de la primera carga, refleja también las claves agregadas después. Para no recorrer todo
+    el schema sólo mira las DATA_KEYS_SAMPLE_ROWS filas más antiguas y las más nuevas.
+    """
+    with get_pool().connection() as conn, conn.cursor() as cursor, stage("fetch"):
+        cursor.execute("""
+            WITH sampled AS (
+                (SELECT data, created_at FROM ml_data WHERE schema_id = %(schema_id)s
+                 ORDER BY created_at LIMIT %(rows)s)
+                UNION ALL
+                (SELECT data, created_at FROM ml_data WHERE schema_id = %(schema_id)s
+                 ORDER BY created_at DESC LIMIT %(rows)s)
+            )
+            SELECT k.key
+            FROM sampled d, jsonb_object_keys(d.data) WITH ORDINALITY AS k(key, position)
+            WHERE jsonb_typeof(d.data) = 'object'
+            GROUP BY k.key
+            ORDER BY MIN(d.created_at), MIN(k.position)
+        """, {"schema_id": schema_id, "rows": DATA_KEYS_SAMPLE_ROWS})
+        return [row[0] for row in cursor.fetchall()]
+
+
+def stream_chunks(schema_id: str, chunk_size: Optional[int] = None, query: Optional[str] = None,
+                  params: tuple = ()) -> Iterator[Tuple[int, Columns]]:
+    """
+    Itera los valores `data` del schema en bloques (n, columnas) usando un cursor con nombre
+    (server-side), de modo que Postgres no envía todo el resultado de una vez.
+    `query` debe devolver el JSON como texto (`data::text`): cada bloque se decodifica de una vez
+    a columnas con ChunkDecoder en vez del conversor de jsonb de psycopg2.
+    """
+    chunk_size = chunk_size or config.ML_FETCH_CHUNK_SIZE
+    sql = query or "SELECT data::text FROM ml_data WHERE schema_id = %s AND jsonb_typeof(data) = 'object'"
+    sql_params = params or (schema_id,)
+    decoder = ChunkDecoder()
+
+    with get_pool().connection() as conn:
+        with conn.cursor(name=f"ml_data_stream_{id(conn)}") as cursor:
+            cursor.itersize = chunk_size
+            with stage("fetch"):
+                cursor.execute(sql, sql_params)
+            while True:
+                with stage("fetch"):
+                    rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                with stage("decode"):
+                    columns = decoder.decode([r[0] for r in rows])
+                yield len(rows), columns
+
+
+def stream_frames(schema_id: str, chunk_size: Optional[int] = None) -> Iterator[pd.DataFrame]:
+    """Como stream_chunks, pero cada bloque ya armado como DataFrame columnar (números en float64)"""
+    for n, columns in stream_chunks(schema_id, chunk_size):
+        with stage("decode"):
+            buffer = ColumnarBuffer(n)
+            buffer.append_columns(columns, n)
+            frame = buffer.to_frame()
+        yield frame
+
+
+def sample_query(
+    where: str,
+    params: tuple,
+    strategy: str,
+    max_rows: int,
+    total: int,
+    stratify_column: Optional[str] = None,
+    half_life_days: float = 30.0
+) -> Tuple[str, tuple]:
+    """
+    SELECT data::text con una muestra de hasta `max_rows` de las `total` filas que cumplen `where`.
+
+    random:     uniforme. Filtro Bernoulli por fila sobre el índice del schema (TABLESAMPLE
+                muestrea la tabla compartida entera) y un tope exacto entre los elegidos.
+    recent:     ponderada por antigüedad (peso 2^(-edad / half_life_days) respecto de la fila
+                más nueva), sin reemplazo: top-k de log(peso) + ruido Gumbel.
+    stratified: proporcional por valor de `stratify_column`; cada estrato conserva al menos
+                una fila y, si eso excede el tope, se recortan primero los rangos más altos.
+    """
+    if strategy == "random":
+        # Holgura de ~4 desvíos para que el filtro casi nunca deje menos de max_rows
+        fraction = min(1.0, (max_rows + 4 * math.sqrt(max_rows) + 10) / max(total, 1))
+        sql = f"""
+            SELECT d.data::text FROM ml_data d JOIN (
+                SELECT id FROM ml_data WHERE {where} AND random() < %s ORDER BY random() LIMIT %s
+            ) s USING (id)"""
+        return sql, params + (fraction, max_rows)
+
+    if strategy == "recent":
+        decay = math.log(2) / (half_life_days * 86400)
+        sql = f"""
+            SELECT d.data::text FROM ml_data d JOIN (
+                SELECT id FROM ml_data, (SELECT MAX(created_at) AS newest FROM ml_data WHERE {where}) n
+                WHERE {where}
+                ORDER BY -ln(-ln(GREATEST(random(), 1e-12))) - EXTRACT(EPOCH FROM n.newest - created_at) * %s DESC
+                LIMIT %s
+            ) s USING (id)"""
+        return sql, params + params + (decay, max_rows)
+
+    if strategy == "stratified":
+        fraction = max_rows / max(total, 1)
+        sql = f"""
+            SELECT d.data::text FROM ml_data d JOIN (
+                SELECT id FROM (
+                    SELECT id,
+                           ROW_NUMBER() OVER (PARTITION BY data->>%s ORDER BY random()) AS rank,
+                           COUNT(*) OVER (PARTITION BY data->>%s) AS stratum_rows
+                    FROM ml_data WHERE {where}
+                ) r
+                WHERE rank <= GREATEST(1, ROUND(stratum_rows * %s))
+                ORDER BY rank
+                LIMIT %s
+            ) s USING (id)"""
+        return sql, (stratify_column, stratify_column) + params + (fraction, max_rows)
+
+    raise ValueError(f"Estrategia de muestreo SQL desconocida: {strategy}")
+
+
+def load_frame(
+    schema_id: str,
+    max_rows: Optional[int] = None,
+    sample: bool = False,
+    chunk_size: Optional[int] = None,
+    seed: Optional[int] = None,
+    created_after: Optional[datetime] = None,
+    created_until: Optional[datetime] = None,
+    strategy: Optional[str] = None,
+    stratify_column: Optional[str] = None,
+    half_life_days: Optional[float] = None
+) -> pd.DataFrame:
+    """
+    Carga los datos del schema como DataFrame columnar.
+
+    max_rows: tope de filas (None = todas).
+    sample:   con tope, en lugar de las primeras N filas se toma una muestra
+              uniforme de todo el schema (reservoir sampling sobre el stream).
+    strategy: estrategia de muestreo con tope (SAMPLING_STRATEGIES); por defecto la que indica
+              `sample`. Las de SQL_SAMPLING_STRATEGIES se resuelven en Postgres (sample_query).
+    created_after / created_until: sólo filas con created_at en (after, until].
+    """
+    strategy = strategy or ("reservoir" if sample else "head")
+    if strategy not in SAMPLING_STRATEGIES:
+        raise ValueError(f"strategy debe ser uno de {SAMPLING_STRATEGIES}")
+    sample = strategy == "reservoir"
+
+    where, params = _created_filter(schema_id, created_after, created_until)
+    total = count_rows(schema_id, created_after, created_until)
+    capacity = min(total, max_rows) if max_rows else total
+    buffer = ColumnarBuffer(capacity)
+    rng = random.Random(seed)
+
+    query, query_params = f"SELECT data::text FROM ml_data WHERE {where}", params
+    if max_rows and total > max_rows and strategy in SQL_SAMPLING_STRATEGIES:
+        query, query_params = sample_query(
+            where, params, strategy, max_rows, total,
+            stratify_column=stratify_column,
+            half_life_days=half_life_days or config.ML_SAMPLE_HALF_LIFE_DAYS
+        )
+        logger.info(f"Schema {schema_id}: muestreo '{strategy}' de {max_rows} de {total} filas en la DB")
+
+    seen = 0
+    for n, columns in stream_chunks(schema_id, chunk_size, query=query, params=query_params):
+        with stage("decode"):
+            # Mientras haya lugar el bloque se copia entero, columna por columna
+            room = min(n, max(max_rows - buffer.size, 0)) if max_rows else n
+            buffer.append_columns({key: values[:room] for key, values in columns.items()}, room)
+            seen += room
+            if sample:
+                # Algoritmo R: la fila i reemplaza una posición al azar con prob. max_rows / i;
+                # si dos filas del bloque caen en la misma posición queda la última
+                replaced: Dict[int, int] = {}
+                for i in range(room, n):
+                    j = rng.randint(0, seen)
+                    if j < max_rows:
+                        replaced[j] = i
+                    seen += 1
+                buffer.replace_rows(
+                    np.fromiter(replaced.keys(), dtype=np.int64, count=len(replaced)),
+                    columns,
+                    np.fromiter(replaced.values(), dtype=np.int64, count=len(replaced))
+                )
+        if not sample and max_rows and buffer.size >= max_rows:
+            break
+
+    if max_rows and seen > buffer.size:
+        logger.info(f"Schema {schema_id}: muestreadas {buffer.size} de {seen} filas")
+    logger.info(f"Cargadas {buffer.size} filas, {len(buffer.columns)} columnas del schema {schema_id}")
+    with stage("decode"):
+        return buffer.to_frame()
+
+
+def load_series(
+    schema_id: str,
+    date_column: str,
+    target_column: str,
+    max_points: Optional[int] = None,
+    frequency: Optional[str] = None,
+    aggregation: str = "sum"
+) -> pd.DataFrame:
+    """
+    Serie [date_column, target_column] ordenada por fecha, con los últimos `max_points` puntos.
+    Postgres extrae sólo esas dos claves del JSONB, descarta objetivos no numéricos, ordena y
+    limita; con `frequency` (SERIES_FREQUENCIES) suma y cuenta por día en la DB y pandas agrega
+    por período con `aggregation`; los períodos vacíos se completan (0 en sum, el valor anterior
+    en mean). Las fechas con forma ISO pero imposibles (p.ej. 2023-02-30) se descartan con aviso.
+
+    El orden en la DB sólo es válido con fechas ISO: si alguna fecha no lo es, devuelve una serie
+    vacía para que el llamador ordene en pandas en lugar de descartar esas filas.
+    """
+    keys = {"date": date_column, "target": target_column, "iso": ISO_DATE_PATTERN, "numeric": NUMERIC_PATTERN}
+    with get_pool().connection() as conn, conn.cursor() as cursor, stage("fetch"):
+        cursor.execute("""
+            SELECT COUNT(*) FROM ml_data
+            WHERE schema_id = %(schema_id)s AND data->>%(date)s IS NOT NULL AND data->>%(date)s !~ %(iso)s
+        """, {**keys, "schema_id": schema_id})
+        non_iso = cursor.fetchone()[0]
+    if non_iso:
+        logger.warning(f"Schema {schema_id}: {non_iso} filas con '{date_column}' fuera de formato ISO")
+        return pd.DataFrame({date_column: pd.Series(dtype="datetime64[ns, UTC]"), target_column: pd.Series(dtype="float64")})
+
+    where = """schema_id = %(schema_id)s
+               AND data->>%(date)s ~ %(iso)s
+               AND (jsonb_typeof(data->%(target)s) = 'number' OR data->>%(target)s ~ %(numeric)s)"""
+    limit = "LIMIT %(limit)s" if max_points else ""
+
+    if frequency:
+        # Se agrupa por el texto YYYY-MM-DD sin convertirlo a date en la DB: una fecha imposible
+        # abortaría la consulta. La frecuencia mínima es el día.
+        sql = f"""
+            SELECT LEFT(data->>%(date)s, 10) AS day, SUM((data->>%(target)s)::float8), COUNT(*)
+            FROM ml_data WHERE {where}
+            GROUP BY 1 ORDER BY 1"""
+    else:
+        sql = f"""
+            SELECT date_text, value FROM (
+                SELECT data->>%(date)s AS date_text, (data->>%(target)s)::float8 AS value
+                FROM ml_data WHERE {where}
+                ORDER BY 1 DESC {limit}
+            ) s ORDER BY date_text"""
+
+    with get_pool().connection() as conn, conn.cursor() as cursor, stage("fetch"):
+        cursor.execute(sql, {**keys, "schema_id": schema_id, "limit": max_points})
+        rows = cursor.fetchall()
+
+    dates = pd.to_datetime([r[0] for r in rows], errors="coerce", utc=True, format="%Y-%m-%d" if frequency else "ISO8601")
+    invalid = int(dates.isna().sum())
+    if invalid:
+        logger.warning(f"Schema {schema_id}: se descartan {invalid} {'días' if frequency else 'filas'} con fechas inválidas en '{date_column}'")
+
+    if frequency:
+        sums = pd.Series([r[1] for r in rows], index=dates, dtype="float64")[dates.notna()]
+        counts = pd.Series([r[2] for r in rows], index=dates, dtype="float64")[dates.notna()]
+        if len(sums):
+            # Suma y conteo por período: la media sale de los totales, no de las medias diarias
+            resampler = dict(rule=SERIES_FREQUENCIES[frequency], label="left", closed="left")
+            sums, counts = sums.resample(**resampler).sum(), counts.resample(**resampler).sum()
+            series = sums if aggregation == "sum" else (sums / counts.where(counts > 0)).ffill()
+        else:
+            series = sums
+        if max_points:
+            series = series.iloc[-max_points:]
+    else:
+        series = pd.Series([r[1] for r in rows], index=dates, dtype="float64")
+        series = series[series.index.notna()]
+
+    logger.info(f"Serie del schema {schema_id}: {len(series)} puntos ({frequency or 'sin remuestreo'})")
+    return pd.DataFrame({date_column: series.index, target_column: series.to_numpy()})
@@ -0,0 +1,200 @@
+"""
+Pool compartido de conexiones a PostgreSQL para el servicio de ML
+"""
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from typing import Any, Dict
+
+import orjson
+import psycopg2
+from psycopg2 import extensions, extras
+from psycopg2.pool import ThreadedConnectionPool
+
+import config
+from services.instrumentation import stage
+
+logger = logging.getLogger(__name__)
+
+# Decodificar JSON/JSONB con orjson (ml_data, métricas y resultados de trabajos)
+extras.register_default_json(globally=True, loads=orjson.loads)
+extras.register_default_jsonb(globally=True, loads=orjson.loads)
+
+
+class PoolTimeoutError(Exception):
+    """No se obtuvo una conexión libre dentro del tiempo de espera"""
+
+
+class ConnectionPool:
+    """
+    Envoltorio sobre ThreadedConnectionPool que:
+    - bloquea (con timeout) cuando se alcanza max_size en vez de fallar
+    - verifica conexiones que llevan tiempo ociosas antes de entregarlas
+    - garantiza que la conexión vuelve al pool aunque el endpoint lance excepción
+    """
+
+    def __init__(
+        self,
+        dsn: str,
+        min_size: int = 1,
+        max_size: int = 10,
+        timeout: float = 30.0,
+        health_check_interval: float = 30.0
+    ):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+
+        self._pool = None
+        self._init_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._stats_lock = threading.Lock()
+        self._last_used: Dict[int, float] = {}
+
+        self.in_use = 0
+        self.acquisitions = 0
+        self.timeouts = 0
+        self.discarded = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    def _get_pool(self) -> ThreadedConnectionPool:
+        # Creación perezosa: el servicio puede arrancar aunque la DB aún no esté lista
+        if self._pool is None:
+            with self._init_lock:
+                if self._pool is None:
+                    self._pool = ThreadedConnectionPool(self.min_size, self.max_size, self.dsn)
+                    logger.info(f"Pool de conexiones creado (min={self.min_size}, max={self.max_size})")
+        return self._pool
+
+    def _is_healthy(self, conn) -> bool:
+        if conn.closed:
+            return False
+        last_used = self._last_used.get(id(conn), 0.0)
+        if time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _checkout(self):
+        pool = self._get_pool()
+        # Si la conexión está caída se descarta y se pide otra (máx. max_size intentos)
+        for _ in range(self.max_size + 1):
+            conn = pool.getconn()
+            if self._is_healthy(conn):
+                return conn
+            logger.warning("Conexión inválida descartada del pool")
+            self._last_used.pop(id(conn), None)
+            pool.putconn(conn, close=True)
+            with self._stats_lock:
+                self.discarded += 1
+        raise psycopg2.OperationalError("No se pudo obtener una conexión sana del pool")
+
+    def _release(self, conn, broken: bool):
+        pool = self._get_pool()
+        if not broken and not conn.closed:
+            # Dejar la conexión limpia para el siguiente usuario
+            if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    broken = True
+        if broken or conn.closed:
+            self._last_used.pop(id(conn), None)
+            pool.putconn(conn, close=True)
+            with self._stats_lock:
+                self.discarded += 1
+        else:
+            self._last_used[id(conn)] = time.monotonic()
+            pool.putconn(conn)
+
+    @contextmanager
+    def connection(self):
+        """Presta una conexión del pool; siempre se devuelve al salir del bloque"""
+        start = time.monotonic()
+        with stage("db_connect"):
+            if not self._slots.acquire(timeout=self.timeout):
+                with self._stats_lock:
+                    self.timeouts += 1
+                raise PoolTimeoutError(f"Sin conexiones libres tras {self.timeout}s")
+
+            try:
+                conn = self._checkout()
+            except Exception:
+                self._slots.release()
+                raise
+
+        waited = time.monotonic() - start
+        with self._stats_lock:
+            self.in_use += 1
+            self.acquisitions += 1
+            self.wait_time_total += waited
+            self.wait_time_max = max(self.wait_time_max, waited)
+
+        broken = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            try:
+                self._release(conn, broken)
+            finally:
+                with self._stats_lock:
+                    self.in_use -= 1
+                self._slots.release()
+
+    def close(self):
+        with self._init_lock:
+            if self._pool is not None:
+                self._pool.closeall()
+                self._pool = None
+                self._last_used.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            idle = len(self._pool._pool) if self._pool is not None else 0
+            return {
+                "in_use": self.in_use,
+                "idle": idle,
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "acquisitions": self.acquisitions,
+                "timeouts": self.timeouts,
+                "discarded": self.discarded,
+                "wait_time_total_s": round(self.wait_time_total, 6),
+                "wait_time_avg_s": round(self.wait_time_total / self.acquisitions, 6) if self.acquisitions else 0.0,
+                "wait_time_max_s": round(self.wait_time_max, 6)
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """
+    Pool del proceso actual. Los workers de entrenamiento en modo proceso
+    crean el suyo propio al primer uso (las conexiones no cruzan procesos).
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    config.DB_URL,
+                    min_size=config.DB_POOL_MIN_SIZE,
+                    max_size=config.DB_POOL_MAX_SIZE,
+                    timeout=config.DB_POOL_TIMEOUT,
+                    health_check_interval=config.DB_POOL_HEALTHCHECK_SECONDS
+                )
+    return _pool
@@ -0,0 +1,162 @@
+"""
+Caché en disco de features preparadas (X, y y pipeline) para repetir entrenamientos sin preprocesar
+"""
+import os
+import time
+import uuid
+import shutil
+import hashlib
+import threading
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+import orjson
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class FeatureCache:
+    """
+    Cada entrada es un directorio `<clave>/` con X.npy, y.npy (float32) y meta.json (pipeline).
+    La clave combina schema, huella de los datos y configuración de preprocesamiento, así que
+    una entrada nunca queda desactualizada: cuando cambian los datos simplemente deja de usarse
+    y la expulsión por tamaño (`max_bytes`, las menos usadas primero) o por tiempo sin uso
+    (`max_age_seconds`) la borra.
+
+    Los .npy se abren con np.load(mmap_mode='c'): sin copia al cargar, copy-on-write si el
+    entrenamiento los modifica. Las entradas se escriben en un directorio temporal y se
+    publican con un rename, por lo que varios procesos pueden compartir la caché.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, max_age_seconds: float):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @staticmethod
+    def make_key(schema_id: str, fingerprint: Any, options: Dict[str, Any]) -> str:
+        payload = orjson.dumps([schema_id, fingerprint, options], default=str, option=orjson.OPT_SORT_KEYS)
+        return hashlib.sha256(payload).hexdigest()[:32]
+
+    def get(self, key: str) -> Optional[Tuple[np.ndarray, np.ndarray, Dict[str, Any]]]:
+        """(X, y, meta) mapeados desde disco, o None si la entrada no existe o venció"""
+        path = os.path.join(self.directory, key)
+        try:
+            if self.max_age_seconds > 0 and time.time() - os.stat(path).st_mtime > self.max_age_seconds:
+                raise FileNotFoundError(path)
+            with open(os.path.join(path, "meta.json"), "rb") as f:
+                meta = orjson.loads(f.read())
+            X = np.load(os.path.join(path, "X.npy"), mmap_mode="c")
+            y = np.load(os.path.join(path, "y.npy"), mmap_mode="c")
+        except (FileNotFoundError, NotADirectoryError, ValueError):
+            self._count(hit=False)
+            return None
+
+        # La fecha de modificación del directorio marca el último uso (orden de expulsión)
+        os.utime(path)
+        self._count(hit=True)
+        return X, y, meta
+
+    def put(self, key: str, X: np.ndarray, y: np.ndarray, meta: Dict[str, Any]):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = os.path.join(self.directory, f".tmp-{uuid.uuid4().hex}")
+        os.makedirs(tmp_path)
+        try:
+            np.save(os.path.join(tmp_path, "X.npy"), np.ascontiguousarray(X, dtype=np.float32))
+            np.save(os.path.join(tmp_path, "y.npy"), np.ascontiguousarray(y, dtype=np.float32))
+            with open(os.path.join(tmp_path, "meta.json"), "wb") as f:
+                f.write(orjson.dumps({**meta, "created": time.time()}, option=orjson.OPT_SERIALIZE_NUMPY))
+            path = os.path.join(self.directory, key)
+            shutil.rmtree(path, ignore_errors=True)
+            os.rename(tmp_path, path)
+        except OSError as e:
+            # Otro proceso publicó la misma entrada o el disco está lleno: la caché es opcional
+            logger.warning(f"No se pudo guardar la entrada {key} de la caché de features: {e}")
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            return
+        self.evict()
+
+    def evict(self):
+        """Borra entradas sin uso hace más de `max_age_seconds` y, si se excede `max_bytes`, las de uso más antiguo"""
+        now = time.time()
+        entries = []
+        for entry in self._entries():
+            if self.max_age_seconds > 0 and now - entry["mtime"] > self.max_age_seconds:
+                self._remove(entry["path"])
+            else:
+                entries.append(entry)
+
+        total = sum(entry["bytes"] for entry in entries)
+        for entry in sorted(entries, key=lambda e: e["mtime"]):
+            if total <= self.max_bytes:
+                break
+            self._remove(entry["path"])
+            total -= entry["bytes"]
+
+    def _entries(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        for name in names:
+            path = os.path.join(self.directory, name)
+            # Los .tmp-* huérfanos (proceso caído a mitad de escritura) también vencen por antigüedad
+            try:
+                size = sum(e.stat().st_size for e in os.scandir(path) if e.is_file())
+                yield {"path": path, "bytes": size, "mtime": os.stat(path).st_mtime}
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+
+    def _remove(self, path: str):
+        shutil.rmtree(path, ignore_errors=True)
+        with self._lock:
+            self.evictions += 1
+
+    def _count(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self) -> Dict[str, Any]:
+        entries = list(self._entries()) if self.enabled else []
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "entries": len(entries),
+                "bytes": sum(entry["bytes"] for entry in entries),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_feature_cache() -> FeatureCache:
+    """Caché del proceso actual (el directorio se comparte entre procesos)"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = FeatureCache(
+                    config.ML_FEATURE_CACHE_DIR,
+                    max_bytes=config.ML_FEATURE_CACHE_MAX_MB * 1024 * 1024,
+                    max_age_seconds=config.ML_FEATURE_CACHE_MAX_AGE_HOURS * 3600
+                )
+    return _cache
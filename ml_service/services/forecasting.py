@@ -0,0 +1,197 @@
+"""
+Inferencia incremental para modelos de series de tiempo (LSTM)
+"""
+import threading
+import logging
+from collections import deque
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import torch
+
+from trainers.timeseries import LSTMModel
+
+logger = logging.getLogger(__name__)
+
+# Cuantiles normales de ±1σ y ±2σ para las bandas de los caminos simulados
+BAND_QUANTILES = (0.0228, 0.1587, 0.5, 0.8413, 0.9772)
+
+
+class ForecastError(ValueError):
+    """Petición de pronóstico inválida para el estado actual del modelo"""
+
+
+class ForecastState:
+    """
+    Última ventana observada de un modelo LSTM y su estado oculto (h, c).
+
+    Agregar una observación cuesta un solo paso de la LSTM partiendo del (h, c)
+    guardado, en lugar de recorrer de nuevo toda la ventana. Como el modelo se
+    entrenó sobre ventanas de largo fijo, cada `reanchor_steps` observaciones el
+    estado se recalcula desde la ventana para no acumular contexto de más.
+
+    Las observaciones agregadas viven sólo en memoria: si el modelo sale de la caché o el
+    servicio se reinicia, el estado vuelve a la ventana guardada en el checkpoint.
+    """
+
+    def __init__(
+        self,
+        model: LSTMModel,
+        device: torch.device,
+        target_mean: float,
+        target_std: float,
+        sequence_length: int,
+        window: Optional[Sequence[float]] = None,
+        sigma: float = 0.0,
+        reanchor_steps: int = 0
+    ):
+        self.model = model
+        self.device = device
+        self.target_mean = float(target_mean)
+        self.target_std = float(target_std)
+        self.sequence_length = int(sequence_length)
+        self.sigma = float(sigma)
+        self.reanchor_steps = int(reanchor_steps) if reanchor_steps else self.sequence_length
+        # Ventana en escala normalizada
+        self.window: deque = deque(window or [], maxlen=self.sequence_length)
+        self.observations = 0
+        self._state = None
+        self._steps_since_anchor = 0
+        self._lock = threading.Lock()
+
+        if self.ready:
+            self._anchor()
+
+    @property
+    def ready(self) -> bool:
+        return len(self.window) == self.sequence_length
+
+    def _normalize(self, values: Sequence[float]) -> np.ndarray:
+        return (np.asarray(values, dtype=np.float32) - self.target_mean) / self.target_std
+
+    def _denormalize(self, values: torch.Tensor) -> np.ndarray:
+        return values.cpu().numpy() * self.target_std + self.target_mean
+
+    @torch.no_grad()
+    def _anchor(self):
+        """Recalcula (h, c) recorriendo la ventana completa"""
+        seq = torch.tensor(list(self.window), dtype=torch.float32, device=self.device).view(1, -1, 1)
+        _, self._state = self.model.lstm(seq)
+        self._steps_since_anchor = 0
+
+    def _validate(self, values: Sequence[float]) -> np.ndarray:
+        norm = self._normalize(values)
+        if not np.isfinite(norm).all():
+            raise ForecastError("Las observaciones deben ser numéricas y finitas")
+        return norm
+
+    @torch.no_grad()
+    def _append_locked(self, norm: np.ndarray):
+        """Avanza ventana y estado oculto; el llamador tiene el lock"""
+        if not len(norm):
+            return
+        was_ready = self.ready
+        self.window.extend(norm.tolist())
+        self.observations += len(norm)
+
+        if not self.ready:
+            return
+
+        if not was_ready or self._steps_since_anchor + len(norm) >= self.reanchor_steps:
+            self._anchor()
+        else:
+            # Una sola llamada a la LSTM para los k pasos nuevos desde el estado guardado
+            steps = torch.from_numpy(norm).to(self.device).view(1, -1, 1)
+            _, self._state = self.model.lstm(steps, self._state)
+            self._steps_since_anchor += len(norm)
+
+    def _snapshot_locked(self):
+        if not self.ready:
+            raise ForecastError(
+                f"Se necesitan al menos {self.sequence_length} observaciones "
+                f"(hay {len(self.window)})"
+            )
+        return self._state, list(self.window)
+
+    def append(self, values: Sequence[float]) -> int:
+        """Agrega observaciones nuevas (escala real) y avanza el estado oculto"""
+        norm = self._validate(values)
+        with self._lock:
+            self._append_locked(norm)
+        return len(norm)
+
+    def append_and_snapshot(self, values: Sequence[float]):
+        """
+        Agrega observaciones y toma el estado (h, c) y la ventana resultantes bajo un mismo lock,
+        para que la proyección y el historial de una petición no mezclen observaciones de otra.
+        Devuelve (agregadas, estado, ventana normalizada).
+        """
+        norm = self._validate(values)
+        with self._lock:
+            self._append_locked(norm)
+            state, window = self._snapshot_locked()
+        return len(norm), state, window
+
+    @torch.no_grad()
+    def forecast(self, horizon: int, samples: int = 0, state=None) -> Dict[str, Any]:
+        """
+        Proyecta `horizon` pasos desde `state` (de append_and_snapshot) o el estado actual.
+        Con `samples` > 0 se simulan caminos con ruido N(0, sigma) en un solo lote y las bandas
+        salen de sus cuantiles; si no, se usa la proyección determinista con bandas sigma·sqrt(paso).
+        """
+        if state is None:
+            with self._lock:
+                state, _ = self._snapshot_locked()
+        h, c = state
+
+        batch = max(int(samples), 1)
+        h = h.expand(-1, batch, -1).contiguous()
+        c = c.expand(-1, batch, -1).contiguous()
+        noise = self.sigma if samples else 0.0
+
+        paths = torch.empty(batch, horizon, device=self.device)
+        for step in range(horizon):
+            pred = self.model.fc(h[-1])  # [batch, 1]
+            if noise:
+                pred = pred + torch.randn_like(pred) * noise
+            paths[:, step] = pred[:, 0]
+            _, (h, c) = self.model.lstm(pred.unsqueeze(1), (h, c))
+
+        real = self._denormalize(paths)
+        sigma_real = self.sigma * self.target_std
+        chart_data: List[Dict[str, Any]] = []
+
+        if samples:
+            lower_2, lower_1, median, upper_1, upper_2 = np.quantile(real, BAND_QUANTILES, axis=0)
+            for i in range(horizon):
+                chart_data.append({
+                    "step": i + 1,
+                    "type": "forecast",
+                    "value": float(median[i]),
+                    "upper_1sigma": float(upper_1[i]),
+                    "lower_1sigma": float(lower_1[i]),
+                    "upper_2sigma": float(upper_2[i]),
+                    "lower_2sigma": float(lower_2[i])
+                })
+        else:
+            # Mismo criterio que el fan chart del entrenamiento: la incertidumbre crece con sqrt(t)
+            for i, value in enumerate(real[0].tolist()):
+                uncertainty = sigma_real * np.sqrt(i + 1)
+                chart_data.append({
+                    "step": i + 1,
+                    "type": "forecast",
+                    "value": value,
+                    "upper_1sigma": value + uncertainty,
+                    "lower_1sigma": value - uncertainty,
+                    "upper_2sigma": value + uncertainty * 1.96,
+                    "lower_2sigma": value - uncertainty * 1.96
+                })
+
+        return {"forecast": chart_data, "sigma_real": sigma_real}
+
+    def history(self, window: Optional[Sequence[float]] = None) -> List[float]:
+        """Ventana en escala real: la de un snapshot o la actual"""
+        if window is None:
+            with self._lock:
+                window = list(self.window)
+        return (np.asarray(window, dtype=np.float64) * self.target_std + self.target_mean).tolist()
@@ -0,0 +1,176 @@
+"""
+Tiempos por etapa de entrenamiento y predicción: desglose por trabajo e histogramas de Prometheus
+"""
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import config
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class StageTimer:
+    """
+    Acumula segundos y llamadas por etapa de un trabajo. Las funciones de servicios lo usan
+    con `stage(nombre)` sin recibirlo como parámetro: el trabajo lo activa con `activate()`
+    y queda en un ContextVar del hilo (o proceso) que lo ejecuta.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, List[float]] = {}
+        # Duraciones individuales de las etapas que se observan por llamada (p.ej. cada época)
+        self.samples: Dict[str, List[float]] = {}
+
+    def add(self, name: str, seconds: float, calls: int = 1, keep_sample: bool = False):
+        entry = self.stages.setdefault(name, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += calls
+        if keep_sample:
+            self.samples.setdefault(name, []).append(seconds)
+
+    @contextmanager
+    def activate(self) -> Iterator["StageTimer"]:
+        token = _current.set(self)
+        try:
+            yield self
+        finally:
+            _current.reset(token)
+
+    def breakdown(self, samples: bool = False) -> Dict[str, Any]:
+        """
+        {etapa: {seconds, calls}} y `total` (tiempo de pared desde que se creó). Con `samples`
+        las etapas por llamada traen además la duración de cada una (para los histogramas).
+        """
+        stages = {name: {"seconds": round(seconds, 6), "calls": calls} for name, (seconds, calls) in self.stages.items()}
+        if samples:
+            for name, values in self.samples.items():
+                stages[name]["samples"] = [round(v, 6) for v in values]
+        return {"stages": stages, "total_seconds": round(time.perf_counter() - self.started, 6)}
+
+
+_current: ContextVar[Optional[StageTimer]] = ContextVar("stage_timer", default=None)
+
+
+def current_timer() -> Optional[StageTimer]:
+    return _current.get()
+
+
+@contextmanager
+def stage(name: str):
+    """Suma la duración del bloque a la etapa `name` del trabajo en curso (si no hay, no registra nada)"""
+    timer = _current.get()
+    if timer is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(name, time.perf_counter() - start)
+
+
+def track_epochs(progress: Optional[Callable[[int, int, float], None]]):
+    """
+    Envuelve el progress_callback de un trainer: el tiempo entre llamadas (una por época) va a
+    la etapa 'train_epoch', que guarda la duración de cada época. Devuelve (callback, finish); `finish()` tras train() suma lo que
+    resta desde la última época (métricas finales) a la etapa 'metrics'.
+    """
+    timer = _current.get()
+    if timer is None:
+        return progress, lambda: None
+    mark = [time.perf_counter()]
+
+    def callback(epoch: int, epochs: int, loss: float):
+        now = time.perf_counter()
+        timer.add("train_epoch", now - mark[0], keep_sample=True)
+        if progress:
+            progress(epoch, epochs, loss)
+        mark[0] = time.perf_counter()
+
+    def finish():
+        timer.add("metrics", time.perf_counter() - mark[0])
+
+    return callback, finish
+
+
+class MetricsRegistry:
+    """
+    Histogramas de latencia por (endpoint, model_type, stage) y contadores de peticiones por
+    (endpoint, model_type, status), en el formato de texto de Prometheus. Vive en el proceso
+    de la API: los trabajos que corren en procesos worker reportan su desglose al terminar.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._histograms: Dict[Tuple[str, str, str], List[float]] = {}
+        self._counters: Dict[Tuple[str, str, str], int] = {}
+
+    def observe(self, endpoint: str, model_type: str, stage_name: str, seconds: float):
+        key = (endpoint, model_type or "", stage_name)
+        with self._lock:
+            # [conteo por bucket..., suma, conteo total]
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram[i] += 1
+            histogram[-2] += seconds
+            histogram[-1] += 1
+
+    def count(self, endpoint: str, model_type: str, status: str):
+        key = (endpoint, model_type or "", status)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+
+    def observe_breakdown(self, endpoint: str, model_type: str, breakdown: Dict[str, Any], status: str):
+        """
+        Registra el desglose de un StageTimer: cada etapa como una observación (o una por llamada
+        si trae `samples`, como las épocas) y el total
+        """
+        for name, entry in breakdown.get("stages", {}).items():
+            for seconds in entry.get("samples", [entry["seconds"]]):
+                self.observe(endpoint, model_type, name, seconds)
+        self.observe(endpoint, model_type, "total", breakdown.get("total_seconds", 0.0))
+        self.count(endpoint, model_type, status)
+
+    @contextmanager
+    def timed(self, endpoint: str, model_type: str, stage_name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(endpoint, model_type, stage_name, time.perf_counter() - start)
+
+    def render(self) -> str:
+        with self._lock:
+            histograms = {key: list(values) for key, values in self._histograms.items()}
+            counters = dict(self._counters)
+
+        lines = [
+            "# HELP ml_stage_seconds Duración de cada etapa de entrenamiento o predicción",
+            "# TYPE ml_stage_seconds histogram"
+        ]
+        for (endpoint, model_type, stage_name), values in sorted(histograms.items()):
+            labels = f'endpoint="{endpoint}",model_type="{model_type}",stage="{stage_name}"'
+            for bound, bucket_count in zip(self.buckets, values):
+                lines.append(f'ml_stage_seconds_bucket{{{labels},le="{bound:g}"}} {bucket_count:g}')
+            lines.append(f'ml_stage_seconds_bucket{{{labels},le="+Inf"}} {values[-1]:g}')
+            lines.append(f"ml_stage_seconds_sum{{{labels}}} {values[-2]:.6f}")
+            lines.append(f"ml_stage_seconds_count{{{labels}}} {values[-1]:g}")
+
+        lines += [
+            "# HELP ml_requests_total Peticiones y trabajos terminados por estado",
+            "# TYPE ml_requests_total counter"
+        ]
+        for (endpoint, model_type, status), value in sorted(counters.items()):
+            lines.append(f'ml_requests_total{{endpoint="{endpoint}",model_type="{model_type}",status="{status}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+METRICS = MetricsRegistry(config.ML_METRICS_BUCKETS)
@@ -0,0 +1,250 @@
+"""
+Cola de entrenamientos en segundo plano con estado persistido en ml_training_jobs
+"""
+import json
+import time
+import uuid
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Any, Dict, Optional
+
+import orjson
+
+import config
+from services.db import get_pool
+from services import search, training
+from services.cpu_budget import CpuBudget, init_process_threads, set_interop_threads, set_thread_limits
+from services.instrumentation import METRICS, StageTimer
+
+logger = logging.getLogger(__name__)
+
+JOB_HANDLERS = {
+    "train": training.train_model,
+    "clustering": training.train_clustering,
+    "search": search.run_search,
+}
+
+JOB_COLUMNS = "id, job_type, schema_id, status, progress, result, error, attempts, created_at, started_at, finished_at"
+
+
+class ProgressReporter:
+    """Callback de progreso que persiste (epoch, loss) como mucho cada `interval` segundos"""
+
+    def __init__(self, job_id: str, interval: float):
+        self.job_id = job_id
+        self.interval = interval
+        self._last_write = 0.0
+        self.progress: Dict[str, Any] = {"stage": "running"}
+
+    def __call__(self, epoch: int, epochs: int, loss: float):
+        self.progress = {"stage": "training", "epoch": epoch, "epochs": epochs, "loss": float(loss)}
+        now = time.monotonic()
+        if epoch == epochs or now - self._last_write >= self.interval:
+            self._last_write = now
+            _update_job(self.job_id, "progress = %s", (json.dumps(self.progress),))
+
+
+def _update_job(job_id: str, assignments: str, params: tuple):
+    with get_pool().connection() as conn, conn.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE ml_training_jobs SET {assignments}, updated_at = NOW() WHERE id = %s",
+            params + (job_id,)
+        )
+        conn.commit()
+
+
+def execute_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Ejecuta un trabajo encolado. Corre en un hilo o proceso del pool de workers (que ya
+    tiene fijada su parte del presupuesto de hilos), por lo que sólo recibe el id y lee el resto de la DB.
+    Devuelve el desglose de tiempos por etapa para las métricas del proceso de la API
+    (None si otro worker ya había tomado el trabajo).
+    """
+    # Reclamar el trabajo de forma atómica: evita ejecutarlo dos veces
+    with get_pool().connection() as conn, conn.cursor() as cursor:
+        cursor.execute("""
+            UPDATE ml_training_jobs
+            SET status = 'running', attempts = attempts + 1, started_at = NOW(), updated_at = NOW()
+            WHERE id = %s AND status = 'queued'
+            RETURNING job_type, request
+        """, (job_id,))
+        row = cursor.fetchone()
+        conn.commit()
+
+    if not row:
+        return
+
+    job_type, request = row
+    reporter = ProgressReporter(job_id, config.ML_JOB_PROGRESS_INTERVAL)
+    timer = StageTimer()
+    summary = {"endpoint": job_type, "model_type": request.get("model_type", job_type)}
+    logger.info(f"Trabajo {job_id} ({job_type}) iniciado")
+
+    try:
+        with timer.activate():
+            result = JOB_HANDLERS[job_type](request, reporter)
+    except Exception as e:
+        logger.error(f"Trabajo {job_id} falló: {e}")
+        _update_job(
+            job_id,
+            "status = 'failed', error = %s, progress = %s, finished_at = NOW()",
+            (str(e), json.dumps(reporter.progress))
+        )
+        return {**summary, "breakdown": timer.breakdown(samples=True), "status": "failed"}
+
+    # El desglose por etapa viaja también en el resultado del trabajo
+    result["timing"] = timer.breakdown()
+    # "auto" se etiqueta con el tipo que se terminó entrenando
+    summary["model_type"] = result.get("model_type", summary["model_type"])
+    reporter.progress["stage"] = "completed"
+    _update_job(
+        job_id,
+        "status = 'completed', result = %s, progress = %s, finished_at = NOW()",
+        (orjson.dumps(result, option=orjson.OPT_SERIALIZE_NUMPY).decode(), json.dumps(reporter.progress))
+    )
+    logger.info(f"Trabajo {job_id} completado")
+    return {**summary, "breakdown": timer.breakdown(samples=True), "status": "completed"}
+
+
+def _init_worker(threads: int, interop_threads: int):
+    logging.basicConfig(level=logging.INFO)
+    init_process_threads(threads, interop_threads)
+
+
+def _serialize_job(row) -> Dict[str, Any]:
+    return {
+        "id": str(row[0]),
+        "type": row[1],
+        "schema_id": str(row[2]),
+        "status": row[3],
+        "progress": row[4],
+        "result": row[5],
+        "error": row[6],
+        "attempts": row[7],
+        "created_at": row[8].isoformat() if row[8] else None,
+        "started_at": row[9].isoformat() if row[9] else None,
+        "finished_at": row[10].isoformat() if row[10] else None,
+    }
+
+
+class JobQueue:
+    """
+    Encola entrenamientos y los ejecuta en un pool de hilos o de procesos.
+    Todo el estado vive en ml_training_jobs, así que los trabajos pendientes
+    o interrumpidos se retoman al reiniciar el servicio.
+
+    `max_workers` es también el límite de admisión del presupuesto de CPU: cada trabajo
+    corre con `cpu_threads // max_workers` hilos y los demás esperan en la cola.
+    """
+
+    def __init__(self, executor: str = "thread", max_workers: int = 2, max_attempts: int = 2,
+                 cpu_threads: int = 0, interop_threads: int = 1):
+        self.executor_kind = executor
+        self.max_workers = max_workers
+        self.max_attempts = max_attempts
+        self.budget = CpuBudget(cpu_threads, max_workers, interop_threads, per_job=executor == "process")
+        self._executor = None
+        self._lock = threading.Lock()
+        self.submitted = 0
+
+    def start(self):
+        if self.executor_kind == "process":
+            # 'spawn' para no heredar conexiones de DB ni el contexto CUDA del proceso padre
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.budget.threads_per_job, self.budget.interop_threads)
+            )
+        else:
+            # Los hilos comparten el proceso de la API: un límite por trabajo acotaría también a
+            # /predict y a los demás trabajos, así que se fija una vez el presupuesto total
+            set_thread_limits(self.budget.total_threads)
+            set_interop_threads(self.budget.interop_threads)
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="train-job")
+        share = f"x {self.budget.threads_per_job} hilos" if self.budget.per_job else "compartiendo"
+        logger.info(
+            f"Cola de entrenamiento iniciada ({self.executor_kind}, {self.max_workers} workers "
+            f"{share} de {self.budget.total_threads})"
+        )
+
+        try:
+            self.recover()
+        except Exception as e:
+            logger.error(f"No se pudieron recuperar trabajos pendientes: {e}")
+
+    def recover(self):
+        """Reencola trabajos que quedaron pendientes o a medias en un reinicio anterior"""
+        with get_pool().connection() as conn, conn.cursor() as cursor:
+            cursor.execute("""
+                UPDATE ml_training_jobs
+                SET status = 'failed', error = 'Interrumpido por reinicio del servicio', finished_at = NOW(), updated_at = NOW()
+                WHERE status = 'running' AND attempts >= %s
+            """, (self.max_attempts,))
+            cursor.execute("""
+                UPDATE ml_training_jobs SET status = 'queued', updated_at = NOW()
+                WHERE status = 'running'
+            """)
+            cursor.execute("SELECT id FROM ml_training_jobs WHERE status = 'queued' ORDER BY created_at")
+            pending = [str(r[0]) for r in cursor.fetchall()]
+            conn.commit()
+
+        for job_id in pending:
+            self._dispatch(job_id)
+        if pending:
+            logger.info(f"{len(pending)} trabajos pendientes reencolados")
+
+    def _dispatch(self, job_id: str):
+        future = self._executor.submit(execute_job, job_id)
+        future.add_done_callback(self._job_finished)
+        with self._lock:
+            self.submitted += 1
+
+    @staticmethod
+    def _job_finished(future):
+        exc = future.exception()
+        if exc is not None:
+            logger.error(f"Worker de entrenamiento terminó con error: {exc}")
+            return
+        # Se registra en el proceso de la API aunque el trabajo haya corrido en un proceso worker
+        summary = future.result()
+        if summary:
+            METRICS.observe_breakdown(**summary)
+
+    def submit(self, job_type: str, schema_id: str, request: Dict[str, Any]) -> str:
+        if job_type not in JOB_HANDLERS:
+            raise ValueError(f"Tipo de trabajo desconocido: {job_type}")
+
+        job_id = str(uuid.uuid4())
+        with get_pool().connection() as conn, conn.cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO ml_training_jobs (id, job_type, schema_id, request, status)
+                VALUES (%s, %s, %s, %s, 'queued')
+            """, (job_id, job_type, schema_id, json.dumps(request)))
+            conn.commit()
+
+        self._dispatch(job_id)
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with get_pool().connection() as conn, conn.cursor() as cursor:
+            cursor.execute(f"SELECT {JOB_COLUMNS} FROM ml_training_jobs WHERE id = %s", (job_id,))
+            row = cursor.fetchone()
+        return _serialize_job(row) if row else None
+
+    def shutdown(self):
+        if self._executor is not None:
+            # Los trabajos en curso quedan 'running' y se reencolan en el próximo arranque
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "executor": self.executor_kind,
+                "workers": self.max_workers,
+                "submitted": self.submitted,
+                "cpu_budget": self.budget.stats()
+            }
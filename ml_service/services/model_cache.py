@@ -0,0 +1,142 @@
+"""
+Caché LRU en memoria de modelos listos para inferencia
+"""
+import threading
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+import torch.nn as nn
+
+logger = logging.getLogger(__name__)
+
+
+def module_nbytes(module: nn.Module) -> int:
+    """Bytes ocupados por parámetros y buffers de un módulo"""
+    total = 0
+    for tensor in list(module.parameters()) + list(module.buffers()):
+        total += tensor.numel() * tensor.element_size()
+    return total
+
+
+class CachedModel:
+    """Modelo en modo eval() junto a los metadatos que necesita la inferencia"""
+
+    def __init__(
+        self,
+        model: nn.Module,
+        model_type: str,
+        feature_names: List[str],
+        feature_metadata: Dict[str, Any],
+        target_column: str,
+        pipeline: Any = None,
+        forecaster: Any = None,
+        nbytes: Optional[int] = None
+    ):
+        self.model = model
+        self.model_type = model_type
+        self.feature_names = feature_names
+        self.feature_metadata = feature_metadata
+        self.target_column = target_column
+        self.pipeline = pipeline
+        # Estado incremental de /forecast (sólo modelos de series de tiempo)
+        self.forecaster = forecaster
+        # Los módulos TorchScript congelados no exponen parámetros: se usa el tamaño del artefacto
+        self.nbytes = nbytes if nbytes is not None else module_nbytes(model)
+
+
+class ModelCache:
+    """
+    Caché de modelos por model_id acotada por número de entradas y bytes.
+    Expulsa el modelo usado menos recientemente cuando se supera algún límite.
+    """
+
+    def __init__(self, max_entries: int = 32, max_bytes: int = 512 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, CachedModel]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # Un lock por modelo para que peticiones concurrentes no carguen el mismo .pt varias veces
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, model_id: str):
+        with self._lock:
+            entry = self._entries.get(model_id)
+            if entry is not None:
+                self._entries.move_to_end(model_id)
+                self.hits += 1
+            return entry
+
+    def get_or_load(self, model_id: str, loader: Callable[[str], CachedModel]) -> CachedModel:
+        """Devuelve el modelo cacheado o lo carga con `loader` (una sola vez por model_id)"""
+        entry = self.get(model_id)
+        if entry is not None:
+            return entry
+
+        with self._lock:
+            load_lock = self._load_locks.setdefault(model_id, threading.Lock())
+
+        with load_lock:
+            # Otro hilo pudo haberlo cargado mientras esperábamos
+            with self._lock:
+                entry = self._entries.get(model_id)
+                if entry is not None:
+                    self._entries.move_to_end(model_id)
+                    self.hits += 1
+                    return entry
+                self.misses += 1
+
+            try:
+                entry = loader(model_id)
+                self.put(model_id, entry)
+            finally:
+                with self._lock:
+                    self._load_locks.pop(model_id, None)
+            return entry
+
+    def put(self, model_id: str, entry: CachedModel):
+        if entry.nbytes > self.max_bytes:
+            logger.warning(f"Modelo {model_id} ({entry.nbytes} bytes) excede el límite de la caché, no se cachea")
+            return
+
+        with self._lock:
+            old = self._entries.pop(model_id, None)
+            if old is not None:
+                self._bytes -= old.nbytes
+            self._entries[model_id] = entry
+            self._bytes += entry.nbytes
+
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                evicted_id, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self.evictions += 1
+                logger.info(f"Modelo {evicted_id} expulsado de la caché")
+
+    def invalidate(self, model_id: str) -> bool:
+        with self._lock:
+            entry = self._entries.pop(model_id, None)
+            if entry is None:
+                return False
+            self._bytes -= entry.nbytes
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
@@ -0,0 +1,142 @@
+"""
+Perfil de columnas de un schema calculado con agregados SQL sobre el JSONB de ml_data
+"""
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import config
+from services.data_loader import NUMERIC_PATTERN, data_fingerprint
+from services.db import get_pool
+from services.instrumentation import stage
+from trainers.preprocessing import is_date_column
+
+logger = logging.getLogger(__name__)
+
+# Texto que pd.to_datetime aceptaría (aproximación en regex de Postgres)
+DATE_PATTERN = r'^\s*([0-9]{4}-[0-9]{1,2}-[0-9]{1,2}|[0-9]{1,2}/[0-9]{1,2}/[0-9]{2,4})'
+
+# Una fila por clave JSON: sólo este resumen viaja desde Postgres, no las filas.
+# Los distintos se cuentan sólo para texto/booleanos (lo que se codifica como categoría) y con
+# un GROUP BY previo: un HashAggregate es varias veces más rápido que COUNT(DISTINCT), que
+# ordena cada grupo
+PROFILE_SQL = """
+WITH kv AS (
+    SELECT e.key, jsonb_typeof(e.value) AS kind, e.value #>> '{}' AS text_value
+    FROM ml_data d CROSS JOIN LATERAL jsonb_each(d.data) e
+    WHERE d.schema_id = %(schema_id)s
+), typed AS (
+    SELECT key, kind,
+           kind = 'string' AND text_value ~ %(date)s AS date_string,
+           CASE
+               WHEN kind = 'number' THEN text_value::float8
+               WHEN kind = 'string' AND text_value ~ %(numeric)s THEN text_value::float8
+           END AS num
+    FROM kv
+), stats AS (
+    SELECT key,
+           COUNT(*) AS present,
+           COUNT(*) FILTER (WHERE kind = 'null') AS nulls,
+           COUNT(*) FILTER (WHERE kind = 'number') AS numbers,
+           COUNT(*) FILTER (WHERE kind = 'string') AS strings,
+           COUNT(*) FILTER (WHERE kind = 'boolean') AS booleans,
+           COUNT(*) FILTER (WHERE kind = 'string' AND num IS NOT NULL) AS numeric_strings,
+           COUNT(*) FILTER (WHERE date_string) AS date_strings,
+           AVG(num) AS mean,
+           STDDEV_SAMP(num) AS std,
+           MIN(num) AS min,
+           MAX(num) AS max
+    FROM typed
+    GROUP BY key
+), distinct_values AS (
+    SELECT key, COUNT(*) AS distinct_values
+    FROM (SELECT key, text_value FROM kv WHERE kind IN ('string', 'boolean') GROUP BY key, text_value) v
+    GROUP BY key
+)
+SELECT s.*,
+       COALESCE(v.distinct_values, 0) AS distinct_values,
+       (SELECT COUNT(*) FROM ml_data WHERE schema_id = %(schema_id)s) AS total_rows
+FROM stats s LEFT JOIN distinct_values v USING (key)
+ORDER BY s.key
+"""
+
+PROFILE_FIELDS = (
+    "present", "nulls", "numbers", "strings", "booleans", "numeric_strings", "date_strings",
+    "mean", "std", "min", "max", "distinct_values", "total_rows"
+)
+
+
+def infer_type(column: str, stats: Dict[str, Any]) -> str:
+    """
+    Tipo que le daría TabularPipeline.fit: fecha si el nombre lo indica y hay valores
+    interpretables como fecha, numérica si algún valor lo es y categórica en otro caso.
+    """
+    numeric_values = stats["numbers"] + stats["numeric_strings"] + stats["booleans"]
+    if is_date_column(column) and stats["date_strings"] + numeric_values > 0:
+        return "date"
+    if numeric_values > 0:
+        return "numeric"
+    return "categorical"
+
+
+def profile_schema(schema_id: str) -> Dict[str, Dict[str, Any]]:
+    """
+    {columna: {type, present, nulls, missing, numbers, strings, ..., mean, std, min, max,
+    distinct_values}} para todas las claves del schema. `missing` cuenta filas sin la clave o
+    con null; mean/std/min/max son sobre los valores numéricos (o texto numérico) y
+    distinct_values sobre los de texto o booleanos.
+    """
+    with get_pool().connection() as conn, conn.cursor() as cursor:
+        cursor.execute(PROFILE_SQL, {"schema_id": schema_id, "numeric": NUMERIC_PATTERN, "date": DATE_PATTERN})
+        rows = cursor.fetchall()
+
+    profile: Dict[str, Dict[str, Any]] = {}
+    for key, *values in rows:
+        stats = dict(zip(PROFILE_FIELDS, values))
+        for field in ("mean", "std", "min", "max"):
+            stats[field] = float(stats[field]) if stats[field] is not None else None
+        stats["missing"] = stats["total_rows"] - stats["present"] + stats["nulls"]
+        stats["type"] = infer_type(key, stats)
+        profile[key] = stats
+    logger.info(f"Perfil del schema {schema_id}: {len(profile)} columnas")
+    return profile
+
+
+# Perfiles recientes por schema, válidos mientras no cambie la huella de sus datos
+_profiles: "OrderedDict[str, tuple]" = OrderedDict()
+_profiles_lock = threading.Lock()
+MAX_CACHED_PROFILES = 32
+
+
+def cached_profile_schema(schema_id: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Como profile_schema, pero reutiliza el último perfil del schema (entrenamiento, clustering,
+    búsqueda y el endpoint de perfil) si sus datos no cambiaron desde entonces.
+    """
+    fingerprint = data_fingerprint(schema_id)
+    with _profiles_lock:
+        cached = _profiles.get(schema_id)
+        if cached is not None and cached[0] == fingerprint:
+            _profiles.move_to_end(schema_id)
+            return cached[1]
+
+    with stage("profile"):
+        profile = profile_schema(schema_id)
+    with _profiles_lock:
+        _profiles[schema_id] = (fingerprint, profile)
+        _profiles.move_to_end(schema_id)
+        while len(_profiles) > MAX_CACHED_PROFILES:
+            _profiles.popitem(last=False)
+    return profile
+
+
+def try_profile_schema(schema_id: str) -> Optional[Dict[str, Dict[str, Any]]]:
+    """Perfil para los trainers; None (detección en pandas) si está desactivado o falla"""
+    if not config.ML_PROFILE_IN_DB:
+        return None
+    try:
+        return cached_profile_schema(schema_id)
+    except Exception as e:
+        logger.warning(f"No se pudo perfilar el schema {schema_id} en la DB, se detecta en pandas: {e}")
+        return None
@@ -0,0 +1,273 @@
+"""
+Búsqueda de hiperparámetros (grid / random) con trials en paralelo y poda por mediana
+"""
+import os
+import time
+import random
+import logging
+import tempfile
+import threading
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from statistics import median
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import torch
+
+import config
+from services.cpu_budget import init_process_threads
+from services.instrumentation import stage
+from services.training import (
+    ProgressCallback, TrainingError, fetch_schema, parse_fit_options, parse_max_rows, parse_sampling, prepare_tabular, save_model
+)
+from trainers.regression import LinearRegressionModel, RegressionTrainer, SimpleRegressionModel
+
+logger = logging.getLogger(__name__)
+
+SEARCH_STRATEGIES = ("grid", "random")
+SEARCH_MODEL_TYPES = ("regression", "linear")
+SEARCHABLE_PARAMETERS = (
+    "epochs", "learning_rate", "batch_size", "early_stopping_patience", "min_delta", "lr_scheduler", "alpha"
+)
+INT_PARAMETERS = ("epochs", "batch_size", "early_stopping_patience")
+
+
+def build_trials(space: Dict[str, Any], strategy: str = "grid", n_trials: int = 10, seed: int = 42) -> List[Dict[str, Any]]:
+    """
+    Configuraciones a probar. En `grid` cada parámetro es una lista de valores y se prueban
+    todas las combinaciones; en `random` se sortean `n_trials` combinaciones, donde cada
+    parámetro es una lista (elección) o un rango {"min", "max", "log"} (uniforme o log-uniforme).
+    """
+    if strategy not in SEARCH_STRATEGIES:
+        raise TrainingError(f"strategy debe ser uno de {SEARCH_STRATEGIES}")
+    if not space:
+        raise TrainingError("El espacio de búsqueda está vacío")
+    unknown = sorted(set(space) - set(SEARCHABLE_PARAMETERS))
+    if unknown:
+        raise TrainingError(f"Parámetros no buscables: {unknown} (permitidos: {SEARCHABLE_PARAMETERS})")
+
+    for name, values in space.items():
+        if isinstance(values, dict):
+            if strategy == "grid":
+                raise TrainingError(f"'{name}': los rangos sólo se admiten con strategy 'random'")
+            if "min" not in values or "max" not in values or values["min"] > values["max"]:
+                raise TrainingError(f"'{name}': el rango necesita 'min' <= 'max'")
+            if values.get("log") and values["min"] <= 0:
+                raise TrainingError(f"'{name}': un rango logarítmico necesita 'min' > 0")
+        elif not isinstance(values, list) or not values:
+            raise TrainingError(f"'{name}' debe ser una lista no vacía de valores")
+
+    if strategy == "grid":
+        names = list(space)
+        trials = [dict(zip(names, combo)) for combo in itertools.product(*(space[n] for n in names))]
+    else:
+        rng = random.Random(seed)
+        trials = [{name: _draw(rng, name, values) for name, values in space.items()} for _ in range(max(n_trials, 1))]
+
+    if len(trials) > config.ML_SEARCH_MAX_TRIALS:
+        raise TrainingError(f"La búsqueda genera {len(trials)} trials (máximo {config.ML_SEARCH_MAX_TRIALS})")
+    return trials
+
+
+def _draw(rng: random.Random, name: str, values: Any) -> Any:
+    if isinstance(values, list):
+        return rng.choice(values)
+    low, high = float(values["min"]), float(values["max"])
+    value = float(np.exp(rng.uniform(np.log(low), np.log(high)))) if values.get("log") else rng.uniform(low, high)
+    return int(round(value)) if name in INT_PARAMETERS else value
+
+
+class MedianPruner:
+    """
+    Poda un trial cuando, pasadas `warmup_epochs`, su mejor val_loss es peor que la mediana
+    de lo que llevaban los demás trials en esa misma época (con al menos `min_trials` de
+    referencia). El historial se comparte entre procesos con un dict y un lock de un Manager.
+    """
+
+    def __init__(self, history, lock, warmup_epochs: int, min_trials: int):
+        self.history = history
+        self.lock = lock
+        self.warmup_epochs = warmup_epochs
+        self.min_trials = min_trials
+        self.best = float("inf")
+        self.pruned_at: Optional[int] = None
+
+    def __call__(self, epoch: int, val_loss: float) -> bool:
+        self.best = min(self.best, val_loss)
+        with self.lock:
+            others = self.history.get(epoch, [])
+            self.history[epoch] = others + [self.best]
+
+        if epoch < self.warmup_epochs or len(others) < self.min_trials:
+            return False
+        if self.best > median(others):
+            self.pruned_at = epoch
+            return True
+        return False
+
+
+def _init_search_worker(threads: int):
+    logging.basicConfig(level=logging.INFO)
+    # Cada proceso usa su parte de los núcleos para no competir con los demás trials
+    init_process_threads(threads)
+
+
+def run_trial(task: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Entrena una configuración sobre X, y mapeados desde `data_dir` (escritos una sola vez por
+    el proceso que lanza la búsqueda). Devuelve métricas, tiempo y pesos (en CPU).
+    """
+    started = time.perf_counter()
+    params = task["params"]
+    result = {"trial": task["index"], "params": params}
+    try:
+        X = torch.from_numpy(np.load(os.path.join(task["data_dir"], "X.npy"), mmap_mode="c")).to(config.DEVICE)
+        y = torch.from_numpy(np.load(os.path.join(task["data_dir"], "y.npy"), mmap_mode="c")).to(config.DEVICE)
+        trainer = RegressionTrainer(config.DEVICE, scatter_points=config.ML_SCATTER_MAX_POINTS, point_mode=config.ML_PAYLOAD_MODE)
+        hyperparameters = {**task["base"], **params}
+        epochs, lr, bs, fit_options = parse_fit_options(hyperparameters)
+
+        pruner = None
+        if task["model_type"] == "linear":
+            model, metrics = trainer.train_linear(
+                X, y, alpha=float(hyperparameters.get("alpha", 1.0)), validation_split=fit_options["validation_split"]
+            )
+        else:
+            if task["prune"]:
+                pruner = MedianPruner(task["history"], task["lock"], config.ML_SEARCH_PRUNE_WARMUP_EPOCHS, config.ML_SEARCH_PRUNE_MIN_TRIALS)
+            model, metrics = trainer.train(
+                X, y, epochs=epochs, learning_rate=lr, batch_size=bs, prune_callback=pruner, **fit_options
+            )
+
+        metrics.pop("metadata", None)
+        result.update({
+            "status": "pruned" if pruner is not None and pruner.pruned_at else "completed",
+            "metrics": metrics,
+            "state": {k: v.detach().cpu() for k, v in model.state_dict().items()}
+        })
+        if pruner is not None and pruner.pruned_at:
+            result["pruned_at_epoch"] = pruner.pruned_at
+    except Exception as e:
+        logger.warning(f"Trial {task['index']} falló: {e}")
+        result.update({"status": "failed", "error": str(e)})
+
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    return result
+
+
+def run_search(request: Dict[str, Any], progress: Optional[ProgressCallback] = None) -> Dict[str, Any]:
+    """
+    Prepara los datos del schema una vez, entrena los trials en `workers` procesos (repartiendo
+    los hilos de torch) y registra sólo el mejor modelo (menor MSE de validación).
+    El progreso del trabajo se reporta como (trials terminados, trials, mejor MSE).
+    """
+    started = time.perf_counter()
+    schema_id = request["schema_id"]
+    model_type = request.get("model_type", "regression")
+    base = request.get("hyperparameters") or {}
+    if model_type not in SEARCH_MODEL_TYPES:
+        raise TrainingError(f"model_type debe ser uno de {SEARCH_MODEL_TYPES}")
+
+    strategy = request.get("strategy", "grid")
+    trials = build_trials(request.get("space") or {}, strategy, int(request.get("n_trials", 10)), int(request.get("seed", 42)))
+    for params in trials:
+        parse_fit_options({**base, **params})
+
+    client_id, columns = fetch_schema(schema_id)
+    target_column = base.get("target_column") or columns[-1]
+    max_rows = parse_max_rows(base)
+
+    # 1. Datos preparados una sola vez (o desde la caché de features)
+    trainer = RegressionTrainer(config.DEVICE, scatter_points=config.ML_SCATTER_MAX_POINTS, point_mode=config.ML_PAYLOAD_MODE)
+    # La normalización excluye la validación del espacio base (trials con otro validation_split
+    # la comparten igual, porque los datos se preparan una sola vez)
+    validation_split = parse_fit_options(base)[3]["validation_split"]
+    X, y, feature_names = prepare_tabular(trainer, schema_id, target_column, max_rows, parse_sampling(base), validation_split)
+
+    workers = int(request.get("workers") or config.ML_SEARCH_WORKERS)
+    workers = max(1, min(workers, len(trials)))
+    # Sin ML_SEARCH_THREADS se reparten los hilos que la cola asignó a este trabajo
+    threads = max(1, (config.ML_SEARCH_THREADS or torch.get_num_threads()) // workers)
+    logger.info(f"Búsqueda {strategy}: {len(trials)} trials en {workers} procesos x {threads} hilos")
+
+    results: List[Dict[str, Any]] = []
+    best_mse = float("inf")
+
+    def collect(result: Dict[str, Any]):
+        nonlocal best_mse
+        results.append(result)
+        if result["status"] == "completed":
+            best_mse = min(best_mse, result["metrics"]["mse"])
+        if progress:
+            progress(len(results), len(trials), best_mse if best_mse < float("inf") else 0.0)
+
+    # 2. Trials: X, y se escriben una vez y cada proceso los mapea sin copiarlos
+    with tempfile.TemporaryDirectory(prefix="search-", dir=config.MODELS_DIR if os.path.isdir(config.MODELS_DIR) else None) as data_dir, \
+            stage("trials"):
+        np.save(os.path.join(data_dir, "X.npy"), X.cpu().numpy())
+        np.save(os.path.join(data_dir, "y.npy"), y.cpu().numpy())
+        base_task = {"data_dir": data_dir, "model_type": model_type, "base": base, "prune": bool(request.get("prune", True))}
+
+        if workers == 1:
+            history, lock = {}, threading.Lock()
+            for index, params in enumerate(trials):
+                collect(run_trial({**base_task, "index": index, "params": params, "history": history, "lock": lock}))
+        else:
+            context = multiprocessing.get_context("spawn")
+            with context.Manager() as manager:
+                history, lock = manager.dict(), manager.Lock()
+                with ProcessPoolExecutor(
+                    max_workers=workers, mp_context=context,
+                    initializer=_init_search_worker, initargs=(threads,)
+                ) as pool:
+                    futures = [
+                        pool.submit(run_trial, {**base_task, "index": index, "params": params, "history": history, "lock": lock})
+                        for index, params in enumerate(trials)
+                    ]
+                    for future in as_completed(futures):
+                        collect(future.result())
+
+    # 3. Registrar sólo el mejor trial completo
+    results.sort(key=lambda r: r["trial"])
+    completed = [r for r in results if r["status"] == "completed"]
+    if not completed:
+        errors = {r["trial"]: r.get("error") for r in results if r["status"] == "failed"}
+        raise TrainingError(f"Ningún trial terminó correctamente: {errors}", status_code=500)
+    best = min(completed, key=lambda r: r["metrics"]["mse"])
+
+    model_class = LinearRegressionModel if model_type == "linear" else SimpleRegressionModel
+    model = model_class(len(feature_names))
+    model.load_state_dict(best["state"])
+    model.eval()
+
+    metrics = {**best["metrics"], "metadata": trainer.feature_metadata}
+    metrics["search"] = {
+        "strategy": strategy,
+        "trials": len(trials),
+        "pruned": sum(r["status"] == "pruned" for r in results),
+        "failed": sum(r["status"] == "failed" for r in results),
+        "best_trial": best["trial"],
+        "best_params": best["params"]
+    }
+    model_id = save_model(schema_id, client_id, model_type, model, trainer, feature_names, target_column, metrics)
+
+    report = []
+    for r in results:
+        entry = {k: v for k, v in r.items() if k not in ("state", "metrics")}
+        if "metrics" in r:
+            entry["metrics"] = {k: v for k, v in r["metrics"].items() if k != "scatter_data"}
+        report.append(entry)
+
+    return {
+        "model_id": model_id,
+        "model_type": model_type,
+        "metrics": metrics,
+        "best_params": best["params"],
+        "trials": report,
+        "workers": workers,
+        "threads_per_worker": threads,
+        "seconds": round(time.perf_counter() - started, 3),
+        "device": str(config.DEVICE)
+    }
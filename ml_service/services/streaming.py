@@ -0,0 +1,88 @@
+"""
+Lectura incremental de cuerpos NDJSON / CSV para /predict/stream
+"""
+import io
+import logging
+from typing import Any, AsyncIterator, Dict, List, Union
+
+import orjson
+import pandas as pd
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+NDJSON_MEDIA_TYPES = ("application/x-ndjson", "application/jsonl", "application/ndjson")
+CSV_MEDIA_TYPES = ("text/csv",)
+STREAM_MEDIA_TYPES = NDJSON_MEDIA_TYPES + CSV_MEDIA_TYPES
+
+
+async def iter_lines(stream: AsyncIterator[bytes], csv_quotes: bool = False) -> AsyncIterator[bytes]:
+    """
+    Corta el stream en líneas completas a medida que llegan los bytes.
+    Con `csv_quotes` un salto de línea dentro de un campo entre comillas no corta el registro
+    (con comillas escapadas como "" la cantidad de comillas de un registro completo es par).
+    """
+    buffer = b""
+    record = b""
+    async for data in stream:
+        *lines, buffer = (buffer + data).split(b"\n")
+        for line in lines:
+            record += line + b"\n"
+            if csv_quotes and record.count(b'"') % 2:
+                continue
+            if record.strip():
+                yield record
+            record = b""
+    record += buffer
+    if record.strip():
+        yield record if record.endswith(b"\n") else record + b"\n"
+
+
+async def iter_chunks(
+    stream: AsyncIterator[bytes],
+    content_type: str,
+    chunk_rows: int
+) -> AsyncIterator[Union[List[Dict[str, Any]], pd.DataFrame]]:
+    """Agrupa el cuerpo en lotes de `chunk_rows` filas (lista de dicts para NDJSON, DataFrame para CSV)"""
+    if content_type in NDJSON_MEDIA_TYPES:
+        rows: List[Dict[str, Any]] = []
+        async for line in iter_lines(stream):
+            rows.append(orjson.loads(line))
+            if len(rows) >= chunk_rows:
+                yield rows
+                rows = []
+        if rows:
+            yield rows
+        return
+
+    header = None
+    lines: List[bytes] = []
+    async for line in iter_lines(stream, csv_quotes=True):
+        if header is None:
+            header = line
+            continue
+        lines.append(line)
+        if len(lines) >= chunk_rows:
+            yield _read_csv(header, lines)
+            lines = []
+    if lines:
+        yield _read_csv(header, lines)
+
+
+def _read_csv(header: bytes, lines: List[bytes]) -> pd.DataFrame:
+    # Mismo criterio que el cuerpo columnar de /predict: celdas vacías como texto vacío
+    return pd.read_csv(io.BytesIO(header + b"".join(lines)), keep_default_na=False, na_values=[])
+
+
+class BodyStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse que no escucha desconexiones del cliente en paralelo: esa escucha
+    consume los mensajes `http.request`, y aquí el generador todavía está leyendo el
+    cuerpo de la petición. Una desconexión se detecta igual al leer request.stream().
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
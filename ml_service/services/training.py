@@ -0,0 +1,469 @@
+"""
+Lógica de entrenamiento compartida por la API y los workers de la cola de trabajos
+"""
+import os
+import json
+import uuid
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+import pandas as pd
+import torch
+
+import config
+from services.db import get_pool
+from services.data_loader import (
+    SAMPLING_STRATEGIES, SERIES_AGGREGATIONS, SERIES_FREQUENCIES,
+    count_rows, data_fingerprint, data_keys, load_frame, load_series, stream_frames
+)
+from services.feature_cache import get_feature_cache
+from services.instrumentation import stage, track_epochs
+from services.profiling import try_profile_schema
+from trainers.preprocessing import TabularPipeline
+from trainers.regression import RegressionTrainer, SimpleRegressionModel
+from trainers.timeseries import TimeSeriesTrainer
+from trainers.clustering import ClusteringTrainer
+from trainers.export import export_regression_model
+from trainers.early_stopping import LR_SCHEDULERS
+
+logger = logging.getLogger(__name__)
+
+TABULAR_MODEL_TYPES = ("regression", "linear", "auto")
+SUPPORTED_MODEL_TYPES = TABULAR_MODEL_TYPES + ("time_series",)
+
+ProgressCallback = Callable[[int, int, float], None]
+
+
+class TrainingError(Exception):
+    """Error de validación de un entrenamiento (se reporta tal cual al cliente)"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def fetch_schema(schema_id: str):
+    """Devuelve (client_id, columns) del schema o lanza TrainingError 404"""
+    with get_pool().connection() as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT client_id, columns FROM ml_schemas WHERE id = %s", (schema_id,))
+        schema_info = cursor.fetchone()
+    if not schema_info:
+        raise TrainingError("Schema no encontrado", status_code=404)
+    return schema_info
+
+
+def train_model(request: Dict[str, Any], progress: Optional[ProgressCallback] = None) -> Dict[str, Any]:
+    """Entrena un modelo supervisado, lo guarda en disco y lo registra en ml_models"""
+    schema_id = request["schema_id"]
+    model_type = request.get("model_type", "regression")
+    hyperparameters = request.get("hyperparameters") or {}
+
+    # 1. Obtener datos y client_id (la conexión se libera antes de entrenar)
+    client_id, columns = fetch_schema(schema_id)
+
+    # Warm start: partir del último checkpoint compatible del schema (si no hay, entrenamiento completo)
+    previous = None
+    if hyperparameters.get("warm_start"):
+        previous = find_warm_start_model(schema_id, model_type, hyperparameters.get("target_column"))
+
+    target_column = previous["target_column"] if previous else hyperparameters.get("target_column") or columns[-1]
+    max_rows = parse_max_rows(hyperparameters)
+    sampling = parse_sampling(hyperparameters)
+
+    # Los modelos tabulares sin warm start leen sus features con prepare_tabular (caché de features)
+    # y las series de tiempo sólo su fecha y objetivo con load_time_series
+    data = None
+    if previous:
+        new_rows = count_rows(schema_id, created_after=previous["created_at"])
+        if new_rows == 0:
+            # Sin datos nuevos no hay nada que ajustar: no se registra un modelo repetido
+            raise TrainingError(f"No hay filas nuevas desde el modelo {previous['id']}", status_code=409)
+
+        if previous["model_type"] == "linear":
+            # El ridge no parte de sus pesos: se vuelve a resolver sobre todo el schema (acotado por
+            # max_rows) para no olvidar las filas que vio la resolución anterior
+            data = load_frame(schema_id, max_rows=max_rows, **sampling)
+            logger.info(f"Warm start desde {previous['id']}: {new_rows} filas nuevas, ridge reajustado con {len(data)} filas")
+        else:
+            data = load_frame(schema_id, max_rows=max_rows, created_after=previous["created_at"], **sampling)
+            new_rows = len(data)
+            replay_rows = int(hyperparameters.get("replay_rows", config.ML_WARM_START_REPLAY_ROWS))
+            if replay_rows > 0:
+                # Muestra uniforme armada en Postgres: sólo viajan las `replay_rows` filas de repaso
+                replay = load_frame(schema_id, max_rows=replay_rows, strategy="random", created_until=previous["created_at"])
+                data = pd.concat([data, replay], ignore_index=True)
+            logger.info(f"Warm start desde {previous['id']}: {new_rows} filas nuevas + {len(data) - new_rows} de repaso")
+
+    epochs, lr, bs, fit_options = parse_fit_options(hyperparameters)
+
+    # 2. Entrenar
+    if model_type in TABULAR_MODEL_TYPES:
+        trainer = RegressionTrainer(config.DEVICE, scatter_points=config.ML_SCATTER_MAX_POINTS, point_mode=config.ML_PAYLOAD_MODE)
+        if previous:
+            with stage("prepare_data"):
+                X, y, feature_names = trainer.prepare_data(data, target_column, pipeline=previous["pipeline"])
+        else:
+            X, y, feature_names = prepare_tabular(
+                trainer, schema_id, target_column, max_rows, sampling, fit_options["validation_split"]
+            )
+        alpha = float(hyperparameters.get("alpha", 1.0))
+        if alpha < 0:
+            raise TrainingError("alpha debe ser >= 0")
+
+        # Desde acá el tiempo entre llamadas de progreso es el de cada época
+        progress, finish_epochs = track_epochs(progress)
+        if previous:
+            # El ridge se vuelve a resolver (es una sola resolución); el MLP se ajusta unas pocas épocas
+            model_type = previous["model_type"]
+            if model_type == "linear":
+                model, metrics = trainer.train_linear(X, y, alpha=alpha, validation_split=fit_options["validation_split"], progress_callback=progress)
+                replay = {"refit_rows": len(data)}
+            else:
+                warm_epochs = int(hyperparameters.get("warm_start_epochs", config.ML_WARM_START_EPOCHS))
+                model, metrics = trainer.train(
+                    X, y, epochs=warm_epochs, learning_rate=lr, batch_size=bs,
+                    progress_callback=progress, model=previous["model"], **fit_options
+                )
+                replay = {"replay_rows": len(data) - new_rows}
+            metrics["warm_start"] = {"from_model": previous["id"], "new_rows": new_rows, **replay}
+        elif model_type == "regression":
+            model, metrics = trainer.train(X, y, epochs=epochs, learning_rate=lr, batch_size=bs, progress_callback=progress, **fit_options)
+        elif model_type == "linear":
+            model, metrics = trainer.train_linear(X, y, alpha=alpha, validation_split=fit_options["validation_split"], progress_callback=progress)
+        else:
+            model_type, model, metrics = select_regression_model(
+                trainer, X, y, alpha, progress,
+                epochs=epochs, learning_rate=lr, batch_size=bs, **fit_options
+            )
+        finish_epochs()
+
+    elif model_type == "time_series":
+        trainer = TimeSeriesTrainer(config.DEVICE)
+        seq_len = int(hyperparameters.get("sequence_length", 30))
+        data, date_column, ordered = load_time_series(schema_id, target_column, max_rows, hyperparameters)
+        with stage("prepare_data"):
+            X, y, feature_names = trainer.prepare_data(data, target_column, date_column, seq_len, ordered=ordered)
+        progress, finish_epochs = track_epochs(progress)
+        model, metrics = trainer.train(X, y, epochs=epochs, learning_rate=lr, batch_size=bs, progress_callback=progress, **fit_options)
+        finish_epochs()
+
+    else:
+        raise TrainingError("Tipo de modelo no soportado")
+
+    # 3. Guardar en disco y registrar en DB
+    model_id = save_model(schema_id, client_id, model_type, model, trainer, feature_names, target_column, metrics)
+    return {"model_id": model_id, "model_type": model_type, "metrics": metrics, "device": str(config.DEVICE)}
+
+
+def parse_fit_options(hyperparameters: Dict[str, Any]):
+    """(epochs, learning_rate, batch_size, fit_options) validados a partir de los hiperparámetros"""
+    epochs = int(hyperparameters.get("epochs", 100))
+    lr = float(hyperparameters.get("learning_rate", 0.001))
+    bs = int(hyperparameters.get("batch_size", 32))
+
+    # Validación y early stopping (patience 0 = entrenar siempre las `epochs` completas)
+    fit_options = {
+        "validation_split": float(hyperparameters.get("validation_split", 0.2)),
+        "patience": int(hyperparameters.get("early_stopping_patience", 10)),
+        "min_delta": float(hyperparameters.get("min_delta", 1e-4)),
+        "lr_scheduler": hyperparameters.get("lr_scheduler")
+    }
+    if fit_options["lr_scheduler"] and fit_options["lr_scheduler"] not in LR_SCHEDULERS:
+        raise TrainingError(f"lr_scheduler debe ser uno de {LR_SCHEDULERS}")
+    return epochs, lr, bs, fit_options
+
+
+def parse_series_options(hyperparameters: Dict[str, Any]):
+    """(resample, resample_agg) validados para series de tiempo"""
+    frequency = hyperparameters.get("resample")
+    aggregation = hyperparameters.get("resample_agg", "sum")
+    if frequency and frequency not in SERIES_FREQUENCIES:
+        raise TrainingError(f"resample debe ser uno de {tuple(SERIES_FREQUENCIES)}")
+    if aggregation not in SERIES_AGGREGATIONS:
+        raise TrainingError(f"resample_agg debe ser uno de {SERIES_AGGREGATIONS}")
+    return frequency or None, aggregation
+
+
+def load_time_series(
+    schema_id: str,
+    target_column: str,
+    max_points: Optional[int],
+    hyperparameters: Dict[str, Any]
+):
+    """
+    (data, date_column, ordered) para TimeSeriesTrainer: los últimos `max_points` puntos
+    ordenados por fecha, extraídos y (opcionalmente) remuestreados en Postgres. Si alguna fecha
+    no está en formato ISO se cae a cargar el schema y ordenar en pandas (ordered = False).
+    """
+    date_column = hyperparameters.get("date_column")
+    if not date_column:
+        # Intentar inferir de las claves de los datos (ml_schemas.columns puede no incluir las nuevas)
+        date_column = next((col for col in data_keys(schema_id) if 'date' in col.lower() or 'fecha' in col.lower()), None)
+    if not date_column:
+        raise TrainingError("Se requiere una columna de fecha para series de tiempo")
+
+    frequency, aggregation = parse_series_options(hyperparameters)
+    series = load_series(schema_id, date_column, target_column, max_points, frequency, aggregation)
+    if len(series) > 0:
+        return series, date_column, True
+
+    if frequency:
+        raise TrainingError(f"resample requiere que todas las fechas de '{date_column}' sean ISO (YYYY-MM-DD)")
+    logger.info(f"'{date_column}' no tiene sólo fechas ISO: se ordena la serie en pandas")
+    data = load_frame(schema_id)
+    if len(data) == 0:
+        raise TrainingError("No hay datos", status_code=404)
+    if max_points:
+        data[date_column] = pd.to_datetime(data[date_column], errors='coerce')
+        data = data.dropna(subset=[date_column]).sort_values(by=date_column).tail(max_points)
+    return data, date_column, False
+
+
+def parse_max_rows(options: Dict[str, Any]) -> Optional[int]:
+    """Tope de filas: `max_rows` de los hiperparámetros o ML_TRAIN_MAX_ROWS; 0 = todas (None)"""
+    max_rows = options.get("max_rows")
+    max_rows = int(max_rows) if max_rows is not None else config.ML_TRAIN_MAX_ROWS
+    return max_rows if max_rows > 0 else None
+
+
+def parse_sampling(options: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Opciones de muestreo de load_frame (strategy, stratify_column, half_life_days) validadas a
+    partir de los hiperparámetros o de la petición. Sólo aplican con un tope `max_rows`.
+    """
+    strategy = options.get("sampling") or ("reservoir" if options.get("sample", True) else "head")
+    if strategy not in SAMPLING_STRATEGIES:
+        raise TrainingError(f"sampling debe ser uno de {SAMPLING_STRATEGIES}")
+
+    stratify_column = options.get("stratify_column")
+    if strategy == "stratified" and not stratify_column:
+        raise TrainingError("sampling 'stratified' necesita stratify_column")
+
+    half_life_days = options.get("recency_half_life_days")
+    half_life_days = float(half_life_days) if half_life_days is not None else config.ML_SAMPLE_HALF_LIFE_DAYS
+    if half_life_days <= 0:
+        raise TrainingError("recency_half_life_days debe ser > 0")
+
+    return {
+        "strategy": strategy,
+        "stratify_column": stratify_column if strategy == "stratified" else None,
+        "half_life_days": half_life_days if strategy == "recent" else None
+    }
+
+
+def prepare_tabular(
+    trainer: RegressionTrainer,
+    schema_id: str,
+    target_column: str,
+    max_rows: Optional[int],
+    sampling: Dict[str, Any],
+    validation_split: float = 0.0
+):
+    """
+    X, y y feature_names del schema para un modelo tabular. Con los mismos datos y
+    preprocesamiento se leen de la caché de features sin tocar ml_data.
+    La normalización se ajusta sin las filas de validación de `validation_split`.
+    """
+    cache = get_feature_cache()
+    cache_key = None
+    if cache.enabled:
+        cache_key = cache.make_key(schema_id, data_fingerprint(schema_id), {
+            "target_column": target_column,
+            "max_rows": max_rows,
+            "sampling": sampling,
+            # La normalización depende de qué filas quedan para validación
+            "validation_split": validation_split,
+            # Los tipos y rellenos salen del perfil en Postgres o de pandas según el flag
+            "profile_in_db": config.ML_PROFILE_IN_DB,
+            "pipeline_version": TabularPipeline.VERSION
+        })
+        with stage("feature_cache"):
+            prepared = cache.get(cache_key)
+        if prepared is not None:
+            X_cached, y_cached, meta = prepared
+            return trainer.load_prepared(X_cached, y_cached, TabularPipeline.from_dict(meta["pipeline"]))
+
+    data = load_frame(schema_id, max_rows=max_rows, **sampling)
+    if len(data) == 0:
+        raise TrainingError("No hay datos", status_code=404)
+
+    profile = try_profile_schema(schema_id)
+    with stage("prepare_data"):
+        X, y, feature_names = trainer.prepare_data(data, target_column, profile=profile, validation_split=validation_split)
+    if cache_key:
+        with stage("feature_cache"):
+            cache.put(cache_key, X.cpu().numpy(), y.cpu().numpy(), {"pipeline": trainer.pipeline.to_dict()})
+    return X, y, feature_names
+
+
+def save_model(
+    schema_id: str,
+    client_id: str,
+    model_type: str,
+    model: torch.nn.Module,
+    trainer: Any,
+    feature_names: List[str],
+    target_column: str,
+    metrics: Dict[str, Any]
+) -> str:
+    """Guarda el checkpoint (y artefactos de inferencia) en disco, lo registra en ml_models y devuelve su id"""
+    model_id = str(uuid.uuid4())
+    model_path = os.path.join(config.MODELS_DIR, f"{model_id}.pt")
+    os.makedirs(config.MODELS_DIR, exist_ok=True)
+
+    checkpoint = {
+        'model_state': model.state_dict(),
+        'feature_names': feature_names,
+        'target_column': target_column,
+        'metadata': trainer.feature_metadata
+    }
+    if getattr(trainer, 'pipeline', None) is not None:
+        checkpoint['pipeline'] = trainer.pipeline.to_dict()
+    if getattr(trainer, 'forecast_context', None) is not None:
+        checkpoint['forecast'] = trainer.forecast_context
+    with stage("save"):
+        torch.save(checkpoint, model_path)
+
+        # Artefactos optimizados para /predict (TorchScript congelado y, opcional, int8)
+        if model_type == "regression" and config.ML_INFERENCE_TORCHSCRIPT:
+            try:
+                export_regression_model(model, len(feature_names), model_path, quantize=config.ML_INFERENCE_QUANTIZED)
+            except Exception as e:
+                logger.warning(f"No se pudieron exportar artefactos de inferencia: {e}")
+
+    with get_pool().connection() as conn, conn.cursor() as cursor, stage("db_insert"):
+        cursor.execute("""
+            INSERT INTO ml_models (id, schema_id, client_id, model_type, model_path, metrics, feature_metadata, target_column)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        """, (
+            model_id, schema_id, client_id, model_type,
+            model_path, json.dumps(metrics), json.dumps(trainer.feature_metadata), target_column
+        ))
+        conn.commit()
+    return model_id
+
+
+def find_warm_start_model(schema_id: str, model_type: str, target_column: Optional[str]) -> Optional[Dict[str, Any]]:
+    """
+    Último modelo tabular del schema compatible con `model_type` (y `target_column`, si se indica),
+    con su pipeline y, para el MLP, sus pesos. None si no hay ninguno o su checkpoint no está.
+    """
+    compatible = {"regression": ("regression",), "linear": ("linear",), "auto": ("regression", "linear")}
+    if model_type not in compatible:
+        raise TrainingError("warm_start sólo está disponible para modelos tabulares (regression, linear, auto)")
+
+    query = "SELECT id, model_type, model_path, target_column, created_at FROM ml_models WHERE schema_id = %s AND model_type IN %s"
+    params: tuple = (schema_id, compatible[model_type])
+    if target_column:
+        query += " AND target_column = %s"
+        params += (target_column,)
+    with get_pool().connection() as conn, conn.cursor() as cursor:
+        cursor.execute(query + " ORDER BY created_at DESC LIMIT 1", params)
+        row = cursor.fetchone()
+
+    if not row:
+        logger.info(f"warm_start: el schema {schema_id} no tiene un modelo previo compatible, entrenamiento completo")
+        return None
+
+    previous_id, previous_type, model_path, previous_target, created_at = row
+    try:
+        checkpoint = torch.load(model_path, map_location=config.DEVICE)
+    except FileNotFoundError:
+        logger.warning(f"warm_start: checkpoint de {previous_id} no encontrado, entrenamiento completo")
+        return None
+
+    feature_names = checkpoint['feature_names']
+    if 'pipeline' in checkpoint:
+        pipeline = TabularPipeline.from_dict(checkpoint['pipeline'])
+    else:
+        pipeline = TabularPipeline.from_feature_metadata(checkpoint['metadata'], feature_names)
+    pipeline.target_column = previous_target
+
+    model = None
+    if previous_type == "regression":
+        model = SimpleRegressionModel(len(feature_names))
+        model.load_state_dict(checkpoint['model_state'])
+
+    return {
+        "id": str(previous_id),
+        "model_type": previous_type,
+        "target_column": previous_target,
+        "created_at": created_at,
+        "pipeline": pipeline,
+        "model": model
+    }
+
+
+def select_regression_model(
+    trainer: RegressionTrainer,
+    X: torch.Tensor,
+    y: torch.Tensor,
+    alpha: float,
+    progress: Optional[ProgressCallback],
+    **mlp_options
+):
+    """
+    model_type "auto": el ridge (una sola resolución lineal) se elige directamente si el schema
+    tiene pocas filas o features; si no, se entrena también el MLP y el ridge se queda si su R²
+    de validación no es peor que el del MLP en más de ML_AUTO_LINEAR_TOLERANCE.
+    Devuelve (model_type elegido, modelo, métricas); las métricas incluyen `model_selection`.
+    """
+    n_samples, n_features = X.shape
+    linear_model, linear_metrics = trainer.train_linear(
+        X, y, alpha=alpha, validation_split=mlp_options["validation_split"], progress_callback=progress
+    )
+    selection = {"mode": "auto", "linear_r2": linear_metrics["r2_score"]}
+
+    max_rows, max_features = config.ML_AUTO_LINEAR_MAX_ROWS, config.ML_AUTO_LINEAR_MAX_FEATURES
+    if (max_rows > 0 and n_samples <= max_rows) or (max_features > 0 and n_features <= max_features):
+        selection["reason"] = "small_schema"
+        chosen = ("linear", linear_model, linear_metrics)
+    else:
+        mlp_model, mlp_metrics = trainer.train(X, y, progress_callback=progress, **mlp_options)
+        selection["mlp_r2"] = mlp_metrics["r2_score"]
+        if linear_metrics["r2_score"] >= mlp_metrics["r2_score"] - config.ML_AUTO_LINEAR_TOLERANCE:
+            selection["reason"] = "within_tolerance"
+            chosen = ("linear", linear_model, linear_metrics)
+        else:
+            selection["reason"] = "mlp_better"
+            chosen = ("regression", mlp_model, mlp_metrics)
+
+    selection["chosen"] = chosen[0]
+    chosen[2]["model_selection"] = selection
+    logger.info(f"model_type auto: {selection}")
+    return chosen
+
+
+def train_clustering(request: Dict[str, Any], progress: Optional[ProgressCallback] = None) -> Dict[str, Any]:
+    """
+    Ejecuta K-Means + PCA sobre los datos del schema.
+
+    Hasta ML_CLUSTERING_MAX_ROWS filas (o con `max_rows` explícito, que muestrea) se usa
+    el ajuste completo en memoria; por encima, el modo incremental recorre todo el schema.
+    """
+    schema_id = request["schema_id"]
+    n_clusters = int(request.get("n_clusters", 3))
+    max_points = request.get("max_points")
+    trainer = ClusteringTrainer(
+        max_points=int(max_points) if max_points is not None else config.ML_PAYLOAD_MAX_POINTS,
+        point_mode=request.get("point_mode") or config.ML_PAYLOAD_MODE,
+        profile=try_profile_schema(schema_id)
+    )
+
+    sampling = parse_sampling(request)
+    max_rows = request.get("max_rows")
+    if not max_rows:
+        limit = config.ML_CLUSTERING_MAX_ROWS
+        if limit > 0 and count_rows(schema_id) > limit:
+            sample = load_frame(schema_id, max_rows=limit, **sampling)
+            with stage("train"):
+                return trainer.train_streaming(sample, lambda: stream_frames(schema_id), n_clusters=n_clusters)
+        max_rows = limit
+
+    data = load_frame(schema_id, max_rows=int(max_rows) if int(max_rows) > 0 else None, **sampling)
+
+    if len(data) == 0:
+        raise TrainingError("No hay datos para agrupar", status_code=404)
+
+    with stage("train"):
+        return trainer.train(data, n_clusters=n_clusters)
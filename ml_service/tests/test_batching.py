@@ -0,0 +1,120 @@
+"""
+Tests del micro-batching de /predict de services/batching.py
+"""
+import asyncio
+import time
+
+import numpy as np
+import pytest
+
+from services.batching import PredictionBatcher
+
+
+def double_values(cached, rows):
+    if any(row.get("v") is None for row in rows):
+        raise ValueError("fila inválida")
+    return np.array([row["v"] * 2.0 for row in rows], dtype=np.float32)
+
+
+def rows_of(*values):
+    return [{"v": v} for v in values]
+
+
+def test_results_are_scattered_to_each_request():
+    batcher = PredictionBatcher(double_values, window_ms=20)
+    cached = object()
+
+    async def run():
+        return await asyncio.gather(
+            batcher.submit("m", cached, rows_of(1, 2, 3)),
+            batcher.submit("m", cached, rows_of(10)),
+            batcher.submit("m", cached, rows_of(100, 200)),
+        )
+
+    results = asyncio.run(run())
+
+    assert [r.tolist() for r in results] == [[2, 4, 6], [20], [200, 400]]
+    stats = batcher.stats()
+    assert stats["batches"] == 1 and stats["requests"] == 3 and stats["rows"] == 6
+
+
+def test_models_are_batched_separately():
+    seen = []
+
+    def run_batch(cached, rows):
+        seen.append((cached, len(rows)))
+        return double_values(cached, rows)
+
+    batcher = PredictionBatcher(run_batch, window_ms=20)
+    a, b = object(), object()
+
+    async def run():
+        return await asyncio.gather(
+            batcher.submit("a", a, rows_of(1)),
+            batcher.submit("b", b, rows_of(2, 3)),
+            batcher.submit("a", a, rows_of(4)),
+        )
+
+    results = asyncio.run(run())
+
+    assert [r.tolist() for r in results] == [[2], [4, 6], [8]]
+    assert sorted((id(c), n) for c, n in seen) == sorted([(id(a), 2), (id(b), 2)])
+
+
+def test_flush_waits_for_the_window():
+    batcher = PredictionBatcher(double_values, window_ms=80)
+
+    async def run():
+        started = time.perf_counter()
+        result = await batcher.submit("m", object(), rows_of(1))
+        return result, time.perf_counter() - started
+
+    result, elapsed = asyncio.run(run())
+
+    assert result.tolist() == [2]
+    assert 0.07 <= elapsed < 1.0
+
+
+def test_full_batch_flushes_before_the_window():
+    batcher = PredictionBatcher(double_values, window_ms=10_000, max_batch_rows=4)
+    cached = object()
+
+    async def run():
+        started = time.perf_counter()
+        results = await asyncio.gather(
+            batcher.submit("m", cached, rows_of(1, 2)),
+            batcher.submit("m", cached, rows_of(3, 4)),
+        )
+        return results, time.perf_counter() - started
+
+    results, elapsed = asyncio.run(run())
+
+    assert [r.tolist() for r in results] == [[2, 4], [6, 8]]
+    assert elapsed < 1.0
+
+
+def test_failing_request_does_not_fail_the_batch():
+    batcher = PredictionBatcher(double_values, window_ms=20)
+    cached = object()
+
+    async def run():
+        return await asyncio.gather(
+            batcher.submit("m", cached, rows_of(1)),
+            batcher.submit("m", cached, [{"v": None}]),
+            batcher.submit("m", cached, rows_of(5)),
+            return_exceptions=True
+        )
+
+    ok, failed, other = asyncio.run(run())
+
+    assert ok.tolist() == [2] and other.tolist() == [10]
+    assert isinstance(failed, ValueError)
+    assert batcher.stats()["fallbacks"] == 1
+
+
+@pytest.mark.parametrize("window_ms", [0, 20])
+def test_large_or_unbatched_requests_run_directly(window_ms):
+    batcher = PredictionBatcher(double_values, window_ms=window_ms, max_batch_rows=2)
+    result = asyncio.run(batcher.submit("m", object(), rows_of(1, 2, 3)))
+    assert result.tolist() == [2, 4, 6]
+    assert batcher.stats()["batches"] == 1
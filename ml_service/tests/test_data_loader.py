@@ -0,0 +1,100 @@
+"""
+Tests de la decodificación de ml_data a columnas y del muestreo SQL de services/data_loader.py
+"""
+import math
+
+import orjson
+import pandas as pd
+import pytest
+
+from services.data_loader import ChunkDecoder, ColumnarBuffer, decode_row, rows_to_columns, sample_query
+
+ROWS = [
+    {"entero": 1, "real": 1.5, "mixto": 1, "nulo": 3, "bool": True, "bool_nulo": True, "texto": "a", "fecha": "2024-01-04"},
+    {"entero": 2, "real": 2.0, "mixto": 2.5, "nulo": None, "bool": False, "texto": "b", "fecha": "2024-01-05"},
+    {"entero": 3, "real": -0.25, "mixto": 3, "bool": True, "bool_nulo": False, "texto": None, "fecha": "2024-01-06"},
+]
+
+
+def without_null_kind(frame: pd.DataFrame) -> pd.DataFrame:
+    # pandas distingue None (null explícito) de NaN (clave ausente) en columnas de objetos
+    return frame.astype(object).where(frame.notna(), None)
+
+
+def to_frame(columns, n: int) -> pd.DataFrame:
+    buffer = ColumnarBuffer(n)
+    buffer.append_columns(columns, n)
+    return buffer.to_frame()
+
+
+@pytest.mark.parametrize("decode", [
+    lambda texts: ChunkDecoder().decode(texts),
+    lambda texts: rows_to_columns([decode_row(text) for text in texts]),
+], ids=["pyarrow", "por_fila"])
+def test_frame_matches_dataframe_of_dicts(decode):
+    texts = [orjson.dumps(row).decode() for row in ROWS]
+    frame = to_frame(decode(texts), len(texts))
+    expected = pd.DataFrame(ROWS)
+
+    assert list(frame.columns) == list(expected.columns)
+    assert frame.dtypes.to_dict() == expected.dtypes.to_dict()
+    pd.testing.assert_frame_equal(without_null_kind(frame), without_null_kind(expected))
+
+
+def test_chunk_with_mixed_types_falls_back_to_rows():
+    texts = ['{"a": 1}', '{"a": "x"}']
+    frame = to_frame(ChunkDecoder().decode(texts), 2)
+    assert frame["a"].tolist() == [1, "x"]
+
+
+def test_non_object_rows_keep_alignment():
+    columns = rows_to_columns([{"a": 1}, [1, 2], 3, {"a": 2, "b": "x"}])
+    frame = to_frame(columns, 4)
+    assert frame["a"].tolist()[0] == 1 and frame["a"].tolist()[3] == 2
+    assert frame["a"].isna().tolist() == [False, True, True, False]
+    assert frame["b"].tolist()[3] == "x"
+
+
+WHERE = "schema_id = %s AND jsonb_typeof(data) = 'object'"
+
+
+@pytest.mark.parametrize("strategy, options", [
+    ("random", {}),
+    ("recent", {"half_life_days": 7.0}),
+    ("stratified", {"stratify_column": "zona"}),
+])
+def test_sample_query_binds_every_placeholder(strategy, options):
+    sql, params = sample_query(WHERE, ("s1",), strategy, 100, 10_000, **options)
+    assert sql.count("%s") == len(params)
+    assert sql.lstrip().startswith("SELECT d.data::text FROM ml_data d JOIN")
+    assert params[-1] == 100
+
+
+def test_sample_query_random_filters_with_margin():
+    sql, params = sample_query(WHERE, ("s1",), "random", 100, 10_000)
+    assert "random() < %s ORDER BY random() LIMIT %s" in sql
+    fraction = params[1]
+    # Holgura sobre 100/10000 para no quedar por debajo del tope; nunca más que todo el schema
+    assert 0.01 < fraction < 0.02
+    assert sample_query(WHERE, ("s1",), "random", 100, 50)[1][1] == 1.0
+
+
+def test_sample_query_recent_decays_by_half_life():
+    sql, params = sample_query(WHERE, ("s1",), "recent", 100, 10_000, half_life_days=7.0)
+    # El WHERE se usa en la subconsulta de la fila más nueva y en el filtro principal
+    assert sql.count(WHERE) == 2
+    assert params[:2] == ("s1", "s1")
+    assert params[2] == pytest.approx(math.log(2) / (7 * 86400))
+    assert "ORDER BY -ln(-ln(GREATEST(random(), 1e-12)))" in sql
+
+
+def test_sample_query_stratified_partitions_by_column():
+    sql, params = sample_query(WHERE, ("s1",), "stratified", 100, 10_000, stratify_column="zona")
+    assert "PARTITION BY data->>%s" in sql
+    assert "GREATEST(1, ROUND(stratum_rows * %s))" in sql
+    assert params == ("zona", "zona", "s1", 0.01, 100)
+
+
+def test_sample_query_rejects_unknown_strategy():
+    with pytest.raises(ValueError):
+        sample_query(WHERE, ("s1",), "head", 100, 10_000)
@@ -0,0 +1,53 @@
+"""
+Tests de los artefactos de inferencia de trainers/export.py
+"""
+import pytest
+import torch
+
+from trainers.export import export_regression_model, fold_batchnorm
+from trainers.regression import SimpleRegressionModel
+
+INPUT_DIM = 6
+
+
+@pytest.fixture
+def model():
+    torch.manual_seed(0)
+    model = SimpleRegressionModel(INPUT_DIM)
+    # Unas pasadas en train() para que BatchNorm tenga estadísticas distintas de las iniciales
+    model.train()
+    with torch.no_grad():
+        for _ in range(5):
+            model(torch.randn(128, INPUT_DIM) * 3 + 1)
+    return model.eval()
+
+
+def test_folded_model_matches_eager(model):
+    folded = fold_batchnorm(model)
+    assert not any(isinstance(layer, (torch.nn.BatchNorm1d, torch.nn.Dropout)) for layer in folded)
+
+    X = torch.randn(256, INPUT_DIM)
+    with torch.no_grad():
+        torch.testing.assert_close(folded(X), model(X), rtol=1e-4, atol=1e-4)
+
+
+def test_torchscript_artifact_matches_eager(model, tmp_path):
+    paths = export_regression_model(model, INPUT_DIM, str(tmp_path / "modelo.pt"))
+
+    scripted = torch.jit.load(paths["torchscript"])
+    X = torch.randn(256, INPUT_DIM)
+    with torch.no_grad():
+        torch.testing.assert_close(scripted(X), model(X), rtol=1e-4, atol=1e-4)
+
+
+@pytest.mark.skipif(torch.backends.quantized.engine == "none", reason="sin backend de cuantización")
+def test_int8_artifact_stays_close_to_eager(model, tmp_path):
+    paths = export_regression_model(model, INPUT_DIM, str(tmp_path / "modelo.pt"), quantize=True)
+
+    quantized = torch.jit.load(paths["int8"])
+    X = torch.randn(256, INPUT_DIM)
+    with torch.no_grad():
+        expected = model(X)
+        error = (quantized(X) - expected).abs().max().item()
+    # La cuantización dinámica pierde precisión: el error queda acotado por la escala de las salidas
+    assert error <= 0.05 * expected.abs().max().item() + 1e-3
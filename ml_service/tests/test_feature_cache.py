@@ -0,0 +1,80 @@
+"""
+Tests de la caché en disco de features de services/feature_cache.py
+"""
+import os
+import time
+
+import numpy as np
+import pytest
+
+from services.feature_cache import FeatureCache
+
+SCHEMA_ID = "10de62f3-0944-4cb8-b356-6489a4c674b2"
+FINGERPRINT = (3000, "2024-05-01T10:00:00+00:00")
+OPTIONS = {"target_column": "precio", "max_rows": 1000, "sampling": {"strategy": "random"}, "pipeline_version": 1}
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return FeatureCache(str(tmp_path / "features"), max_bytes=10 * 1024 * 1024, max_age_seconds=0)
+
+
+def test_key_is_stable_for_the_same_inputs():
+    reordered = dict(reversed(list(OPTIONS.items())))
+    assert FeatureCache.make_key(SCHEMA_ID, FINGERPRINT, OPTIONS) == FeatureCache.make_key(SCHEMA_ID, FINGERPRINT, reordered)
+
+
+@pytest.mark.parametrize("fingerprint, options", [
+    ((3001, FINGERPRINT[1]), OPTIONS),
+    ((3000, "2024-05-02T10:00:00+00:00"), OPTIONS),
+    (FINGERPRINT, {**OPTIONS, "target_column": "cantidad"}),
+    (FINGERPRINT, {**OPTIONS, "max_rows": None}),
+    (FINGERPRINT, {**OPTIONS, "sampling": {"strategy": "recent"}}),
+    (FINGERPRINT, {**OPTIONS, "pipeline_version": 2}),
+    (FINGERPRINT, {**OPTIONS, "validation_split": 0.2}),
+], ids=["filas", "created_at", "objetivo", "max_rows", "muestreo", "version", "validacion"])
+def test_key_changes_with_data_or_config(fingerprint, options):
+    base = FeatureCache.make_key(SCHEMA_ID, FINGERPRINT, OPTIONS)
+    assert FeatureCache.make_key(SCHEMA_ID, fingerprint, options) != base
+
+
+def test_put_get_round_trip_and_miss_after_data_change(cache):
+    X = np.arange(12, dtype=np.float32).reshape(4, 3)
+    y = np.arange(4, dtype=np.float32).reshape(4, 1)
+    key = FeatureCache.make_key(SCHEMA_ID, FINGERPRINT, OPTIONS)
+    cache.put(key, X, y, {"pipeline": {"feature_names": ["a", "b", "c"]}})
+
+    X_cached, y_cached, meta = cache.get(key)
+    np.testing.assert_array_equal(X_cached, X)
+    np.testing.assert_array_equal(y_cached, y)
+    assert meta["pipeline"]["feature_names"] == ["a", "b", "c"]
+
+    # Datos nuevos en el schema: otra clave, la entrada vieja no se usa
+    assert cache.get(FeatureCache.make_key(SCHEMA_ID, (3001, FINGERPRINT[1]), OPTIONS)) is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_eviction_drops_least_recently_used_entries(tmp_path):
+    X = np.zeros((256, 64), dtype=np.float32)  # 64 KiB por entrada
+    y = np.zeros((256, 1), dtype=np.float32)
+    cache = FeatureCache(str(tmp_path / "features"), max_bytes=2 * X.nbytes + 8192, max_age_seconds=0)
+
+    cache.put("vieja", X, y, {})
+    cache.put("usada", X, y, {})
+    past = time.time() - 60
+    os.utime(os.path.join(cache.directory, "vieja"), (past, past))
+    os.utime(os.path.join(cache.directory, "usada"), (past - 1, past - 1))
+    assert cache.get("usada") is not None
+    cache.put("nueva", X, y, {})
+
+    assert cache.get("vieja") is None
+    assert cache.get("usada") is not None and cache.get("nueva") is not None
+
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = FeatureCache(str(tmp_path / "features"), max_bytes=1024 * 1024, max_age_seconds=30)
+    cache.put("k", np.zeros((2, 2), dtype=np.float32), np.zeros((2, 1), dtype=np.float32), {})
+    past = time.time() - 60
+    os.utime(os.path.join(cache.directory, "k"), (past, past))
+
+    assert cache.get("k") is None
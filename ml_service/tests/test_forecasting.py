@@ -0,0 +1,67 @@
+"""
+Tests del estado incremental de pronóstico de services/forecasting.py
+"""
+import numpy as np
+import torch
+
+from services.forecasting import ForecastState
+from trainers.timeseries import LSTMModel
+
+SEQUENCE_LENGTH = 8
+
+
+def make_state(reanchor_steps: int = 100) -> ForecastState:
+    torch.manual_seed(0)
+    model = LSTMModel(input_dim=1, hidden_dim=16).eval()
+    window = np.linspace(-1.0, 1.0, SEQUENCE_LENGTH).tolist()
+    return ForecastState(
+        model, torch.device("cpu"), target_mean=10.0, target_std=2.0,
+        sequence_length=SEQUENCE_LENGTH, window=window, reanchor_steps=reanchor_steps
+    )
+
+
+def full_run(state: ForecastState, normalized: list):
+    seq = torch.tensor(normalized, dtype=torch.float32).view(1, -1, 1)
+    with torch.no_grad():
+        _, (h, c) = state.model.lstm(seq)
+    return h, c
+
+
+def test_incremental_step_matches_full_rerun():
+    state = make_state()
+    initial = list(state.window)
+    observations = [11.0, 9.5, 12.25]
+
+    appended, (h, c), _ = state.append_and_snapshot(observations)
+
+    expected_h, expected_c = full_run(state, initial + ((np.array(observations) - 10.0) / 2.0).tolist())
+    assert appended == 3
+    torch.testing.assert_close(h, expected_h, rtol=1e-5, atol=1e-5)
+    torch.testing.assert_close(c, expected_c, rtol=1e-5, atol=1e-5)
+
+    # El primer paso proyectado sale de la misma salida de la LSTM
+    with torch.no_grad():
+        first = state.model.fc(expected_h[-1]).item() * 2.0 + 10.0
+    result = state.forecast(1, state=(h, c))
+    assert abs(result["forecast"][0]["value"] - first) < 1e-4
+
+
+def test_reanchor_recomputes_from_window():
+    state = make_state(reanchor_steps=2)
+    state.append([11.0, 9.5, 12.25])
+
+    expected_h, _ = full_run(state, list(state.window))
+    torch.testing.assert_close(state._state[0], expected_h, rtol=1e-5, atol=1e-5)
+
+
+def test_snapshot_is_consistent_and_state_has_no_graph():
+    state = make_state()
+    assert not state._state[0].requires_grad
+
+    _, _, window = state.append_and_snapshot([14.0])
+    state.append([20.0, 21.0])
+
+    history = state.history(window)
+    assert len(history) == SEQUENCE_LENGTH
+    assert history[-1] == 14.0
+    assert state.history()[-1] == 21.0
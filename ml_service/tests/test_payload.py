@@ -0,0 +1,33 @@
+"""
+Tests de la reducción de puntos de trainers/payload.py
+"""
+import numpy as np
+
+from trainers.payload import sample_indices
+
+
+def test_sample_indices_respects_budget_with_more_groups_than_budget():
+    groups = np.repeat(np.arange(50), np.arange(1, 51))
+    indices = sample_indices(len(groups), 10, groups)
+
+    assert len(indices) <= 10
+    assert len(np.unique(indices)) == len(indices)
+    # Quedan los grupos más grandes, un punto cada uno
+    assert set(groups[indices]) == set(range(40, 50))
+
+
+def test_sample_indices_trims_largest_quotas_when_minimums_exceed_budget():
+    groups = np.concatenate([np.zeros(1000, dtype=np.int64), np.arange(1, 9)])
+    indices = sample_indices(len(groups), 10, groups)
+
+    assert len(indices) == 10
+    # Todos los grupos conservan al menos un punto
+    assert set(groups[indices]) == set(range(9))
+
+
+def test_sample_indices_is_proportional_within_budget():
+    groups = np.repeat([0, 1], [900, 100])
+    indices = sample_indices(len(groups), 100, groups)
+
+    assert len(indices) == 100
+    assert np.bincount(groups[indices]).tolist() == [90, 10]
@@ -0,0 +1,61 @@
+"""
+Tests del pipeline tabular de trainers/preprocessing.py
+"""
+import numpy as np
+import orjson
+import pandas as pd
+
+from trainers.early_stopping import split_indices
+from trainers.preprocessing import TabularPipeline
+
+ROWS = [
+    {"id": 1, "precio": 10.0, "cantidad": 3, "zona": "norte", "fecha": "2024-01-04"},
+    {"id": 2, "precio": 12.5, "cantidad": None, "zona": "sur", "fecha": "2024-02-10"},
+    {"id": 3, "precio": 9.0, "cantidad": 5, "zona": "norte", "fecha": None},
+    {"id": 4, "precio": 15.0, "cantidad": 1, "zona": "este", "fecha": "2024-03-15"},
+]
+
+
+def test_fit_matches_transform():
+    pipeline = TabularPipeline()
+    X, y = pipeline.fit(pd.DataFrame(ROWS), "precio")
+
+    assert pipeline.feature_names == ["cantidad", "zona", "fecha_month", "fecha_day"]
+    np.testing.assert_allclose(pipeline.transform(ROWS), X, rtol=1e-6, atol=1e-6)
+    assert y.ravel().tolist() == [10.0, 12.5, 9.0, 15.0]
+
+
+def test_round_trip_through_checkpoint_state():
+    pipeline = TabularPipeline()
+    pipeline.fit(pd.DataFrame(ROWS), "precio")
+
+    # El estado viaja en el checkpoint: tiene que sobrevivir a la serialización
+    restored = TabularPipeline.from_dict(orjson.loads(orjson.dumps(pipeline.to_dict())))
+
+    assert restored.feature_names == pipeline.feature_names
+    assert restored.target_column == "precio"
+    rows = ROWS + [{"cantidad": "x", "zona": "oeste", "fecha": "no es fecha"}, {"Zona": "sur"}]
+    np.testing.assert_array_equal(restored.transform(rows), pipeline.transform(rows))
+
+
+def test_unknown_category_and_missing_columns_use_defaults():
+    pipeline = TabularPipeline()
+    pipeline.fit(pd.DataFrame(ROWS), "precio")
+
+    raw = pipeline.transform([{"zona": "oeste"}]) * pipeline.std + pipeline.mean
+    cantidad_mean = np.mean([3, 5, 1])
+    np.testing.assert_allclose(raw[0], [cantidad_mean, -1.0, 1.0, 0.0], rtol=1e-5, atol=1e-5)
+
+
+def test_normalization_excludes_validation_rows():
+    rows = [{"x": float(i) ** 2, "y": float(i)} for i in range(20)]
+    pipeline = TabularPipeline()
+    X, _ = pipeline.fit(pd.DataFrame(rows), "y", validation_split=0.25)
+
+    train_idx, val_idx = split_indices(len(rows), 0.25)
+    train_x = np.array([rows[i]["x"] for i in train_idx.tolist()])
+    assert len(val_idx) == 5
+    np.testing.assert_allclose(pipeline.mean, [train_x.mean()], rtol=1e-6)
+    np.testing.assert_allclose(pipeline.std, [train_x.std(ddof=1)], rtol=1e-5)
+    # Las filas de entrenamiento quedan centradas; las de validación no entran en la media
+    np.testing.assert_allclose(X[train_idx.numpy()].mean(), 0.0, atol=1e-5)
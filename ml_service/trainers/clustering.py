@@ -3,23 +3,31 @@ Trainer para Clustering (K-Means) y Reducción de Dimensionalidad (PCA)
 """
 import numpy as np
 import pandas as pd
-from typing import Dict, List, Tuple, Any
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Any, Union
 import logging
-from sklearn.cluster import KMeans
-from sklearn.decomposition import PCA
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.decomposition import PCA, IncrementalPCA
 from sklearn.preprocessing import StandardScaler, LabelEncoder
+from trainers.payload import grid_aggregate, sample_indices
 
 logger = logging.getLogger(__name__)
 
 class ClusteringTrainer:
     """Entrenador de modelos de Clustering (K-Means)"""
     
-    def __init__(self):
+    def __init__(self, max_points: int = 0, point_mode: str = "sample", profile: Optional[Dict[str, Dict[str, Any]]] = None):
         self.feature_metadata = {}
+        # Perfil de columnas calculado en la DB (tipo y media sobre todo el schema), opcional
+        self.profile = profile or {}
+        # Tope de puntos devueltos para el gráfico (0 = todos) y cómo reducirlos: sample | grid | none
+        self.max_points = max_points
+        self.point_mode = point_mode
         self.scaler = StandardScaler()
         self.pca = PCA(n_components=2) # 2D para visualización
         self.kmeans = None
         self.encoders = {}
+        # Especificación de columnas ajustada en prepare_data: {'name', 'type', 'fill' | 'classes'}
+        self.columns: List[Dict[str, Any]] = []
         
     def _generate_cluster_name(self, centroid_scaled: np.ndarray, feature_names: List[str]) -> str:
         """Genera un nombre descriptivo basado en los valores Z del centroide"""
@@ -50,55 +58,75 @@ class ClusteringTrainer:
             
         return " - ".join(parts)
     
-    def prepare_data(self, data: List[Dict]) -> Tuple[pd.DataFrame, List[str]]:
+    def prepare_data(self, data: Union[List[Dict], pd.DataFrame]) -> Tuple[pd.DataFrame, List[str]]:
         """Prepara datos limpieza, encoding y scaling"""
-        if not data:
+        if data is None or len(data) == 0:
             raise ValueError("No hay datos para agrupar")
             
-        df = pd.DataFrame(data)
+        df = data if isinstance(data, pd.DataFrame) else pd.DataFrame(data)
+        feature_names = self._fit_columns(df)
         
-        # 1. Identificar columnas numéricas y categóricas
-        feature_names = []
-        processed_df = df.copy()
+        # 2. Scaling
+        X = self._encode(df)
+        X_scaled = self.scaler.fit_transform(X)
+        
+        self.feature_metadata['features'] = feature_names
+        return pd.DataFrame(X_scaled, columns=feature_names), feature_names
+
+    def _fit_columns(self, df: pd.DataFrame) -> List[str]:
+        """Detecta columnas numéricas y categóricas y ajusta su codificación"""
+        self.columns = []
+        self.encoders = {}
         
         # Ignorar IDs (cualquier columna que contenga 'id' insensible, excepto si es p.ej 'mid' y no queremos ser tan agresivos, pero para ejecutivo mejor limpiar)
         # Seremos agresivos: si contiene "id" y parece ser un identificador (entero unico o string unico muy variable)
-        drop_cols = []
-        for c in df.columns:
-            if 'id' in c.lower() or c.lower() == 'id':
-                drop_cols.append(c)
-        
+        drop_cols = [c for c in df.columns if 'id' in c.lower()]
         if drop_cols:
             logger.info(f"Ignorando columnas ID para clustering: {drop_cols}")
-            processed_df = processed_df.drop(columns=drop_cols)
             
-        for col in processed_df.columns:
+        for col in df.columns:
+            if col in drop_cols:
+                continue
             # Fechas: ignorar o procesar (por simplicidad, ignoramos fechas crudas en clustering numérico)
             if 'date' in col.lower() or 'fecha' in col.lower():
                 logger.info(f"Ignorando columna fecha para clustering: {col}")
-                processed_df = processed_df.drop(columns=[col])
                 continue
                 
-            # Numérico
-            is_numeric = pd.to_numeric(processed_df[col], errors='coerce')
-            if not is_numeric.isna().all():
-                processed_df[col] = is_numeric.fillna(is_numeric.mean())
-                feature_names.append(col)
+            # Numérico (con perfil: tipo y media de todo el schema, no sólo de la muestra)
+            stats = self.profile.get(col)
+            if stats is not None and stats['type'] == 'numeric':
+                fill = stats['mean'] if stats['mean'] is not None else pd.to_numeric(df[col], errors='coerce').mean()
+                self.columns.append({'name': col, 'type': 'numeric', 'fill': float(fill)})
+                continue
+            is_numeric = pd.to_numeric(df[col], errors='coerce') if stats is None else None
+            if is_numeric is not None and not is_numeric.isna().all():
+                self.columns.append({'name': col, 'type': 'numeric', 'fill': float(is_numeric.mean())})
             else:
                 # Categórico: Label Encoding
                 le = LabelEncoder()
-                processed_df[col] = le.fit_transform(processed_df[col].astype(str))
+                le.fit(df[col].astype(str))
                 self.encoders[col] = le
-                feature_names.append(col)
+                self.columns.append({'name': col, 'type': 'categorical', 'classes': pd.Index(le.classes_)})
         
-        # 2. Scaling
-        X = processed_df[feature_names].values
-        X_scaled = self.scaler.fit_transform(X)
-        
-        self.feature_metadata['features'] = feature_names
-        return pd.DataFrame(X_scaled, columns=feature_names), feature_names
+        return [spec['name'] for spec in self.columns]
+
+    def _encode(self, df: pd.DataFrame) -> np.ndarray:
+        """Aplica la codificación ajustada a un lote (sin escalar)"""
+        X = np.empty((len(df), len(self.columns)), dtype=np.float64)
+        for j, spec in enumerate(self.columns):
+            if spec['name'] not in df.columns:
+                X[:, j] = spec['fill'] if spec['type'] == 'numeric' else len(spec['classes'])
+            elif spec['type'] == 'numeric':
+                values = pd.to_numeric(df[spec['name']], errors='coerce')
+                X[:, j] = values.fillna(spec['fill']).to_numpy(dtype=np.float64)
+            else:
+                codes = spec['classes'].get_indexer(df[spec['name']].astype(str))
+                # Categorías que no estaban al ajustar: todas al código siguiente
+                codes[codes < 0] = len(spec['classes'])
+                X[:, j] = codes
+        return X
 
-    def train(self, data: List[Dict], n_clusters: int = 3) -> Dict[str, Any]:
+    def train(self, data: Union[List[Dict], pd.DataFrame], n_clusters: int = 3) -> Dict[str, Any]:
         """Ejecuta K-Means y PCA"""
         
         # 1. Preparar
@@ -112,40 +140,126 @@ class ClusteringTrainer:
         # 3. PCA para visualización 2D
         coords_2d = self.pca.fit_transform(X)
         
-        # 4. Preparar resultado visual
-        points = []
-        original_df = pd.DataFrame(data) # Para mostrar datos reales en tooltip
-        
-        for i in range(len(labels)):
-            points.append({
-                "x": float(coords_2d[i, 0]),
-                "y": float(coords_2d[i, 1]),
-                "cluster": int(labels[i]),
-                # Tomamos una etiqueta representativa (ej: nombre, producto) si existe
-                "label": str(original_df.iloc[i].get('nombre', original_df.iloc[i].get('producto', f"Item {i}")))
-            })
+        # 4. Preparar resultado visual (etiqueta real para el tooltip, ej: nombre o producto)
+        original_df = data if isinstance(data, pd.DataFrame) else pd.DataFrame(data)
+        points = self._build_points(coords_2d, labels, self._display_labels(original_df, 0))
             
         # 5. Métricas e Info de Clusters (Centroides interpretables)
+        cluster_info = self._cluster_info(labels, features, n_clusters)
+
+        return {
+            "points": points,
+            "total_points": int(len(labels)),
+            "clusters": cluster_info,
+            "explained_variance": float(np.sum(self.pca.explained_variance_ratio_)),
+            "features": features
+        }
+
+    def train_streaming(
+        self,
+        sample: pd.DataFrame,
+        chunks: Callable[[], Iterable[Union[List[Dict], pd.DataFrame]]],
+        n_clusters: int = 3
+    ) -> Dict[str, Any]:
+        """
+        Modo para datos grandes: MiniBatchKMeans + IncrementalPCA alimentados por bloques.
+
+        sample: muestra uniforme para detectar columnas, ajustar el scaler e inicializar centroides.
+        chunks: función que devuelve un iterador nuevo sobre todos los bloques de filas
+                (listas de dicts o DataFrames, p.ej. data_loader.stream_frames);
+                se recorre dos veces (ajuste y asignación), así que memoria y tiempo crecen
+                linealmente con las filas.
+        """
+        if sample is None or len(sample) == 0:
+            raise ValueError("No hay datos para agrupar")
+
+        # 1. Columnas, escala y centroides iniciales a partir de la muestra
+        features = self._fit_columns(sample)
+        self.feature_metadata['features'] = features
+        X_sample = self.scaler.fit_transform(self._encode(sample))
+        init = KMeans(n_clusters=n_clusters, random_state=42, n_init=3).fit(X_sample).cluster_centers_
+
+        self.kmeans = MiniBatchKMeans(n_clusters=n_clusters, init=init, n_init=1, random_state=42)
+        self.pca = IncrementalPCA(n_components=2)
+
+        # 2. Primera pasada: ajuste incremental
+        for chunk in chunks():
+            X = self.scaler.transform(self._encode(pd.DataFrame(chunk)))
+            self.kmeans.partial_fit(X)
+            if len(X) >= self.pca.n_components:
+                self.pca.partial_fit(X)
+
+        # 3. Segunda pasada: asignar cluster y coordenadas 2D
+        labels, coords, names = [], [], []
+        offset = 0
+        for chunk in chunks():
+            df = pd.DataFrame(chunk)
+            X = self.scaler.transform(self._encode(df))
+            labels.append(self.kmeans.predict(X).astype(np.int32))
+            coords.append(self.pca.transform(X).astype(np.float32))
+            names.append(self._display_labels(df, offset))
+            offset += len(df)
+
+        labels = np.concatenate(labels) if labels else np.zeros(0, dtype=np.int32)
+        coords = np.concatenate(coords) if coords else np.zeros((0, 2), dtype=np.float32)
+        logger.info(f"Clustering incremental sobre {len(labels)} filas")
+        points = self._build_points(coords, labels, [name for block in names for name in block])
+
+        return {
+            "points": points,
+            "total_points": int(len(labels)),
+            "clusters": self._cluster_info(labels, features, n_clusters),
+            "explained_variance": float(np.sum(self.pca.explained_variance_ratio_)),
+            "features": features
+        }
+
+    def _build_points(self, coords: np.ndarray, labels: np.ndarray, names: List[str]) -> List[Dict[str, Any]]:
+        """
+        Arma los puntos desde columnas (tolist convierte cada columna de una vez), acotados a
+        `max_points`: muestra estratificada por cluster o grilla 2D con conteo por celda.
+        """
+        if self.max_points and len(labels) > self.max_points and self.point_mode == "grid":
+            cells = grid_aggregate(coords[:, 0], coords[:, 1], self.max_points, groups=labels)
+            return [
+                {"x": x, "y": y, "cluster": c, "label": names[i], "count": n}
+                for x, y, c, i, n in zip(
+                    cells["x"].tolist(), cells["y"].tolist(), cells["group"].tolist(),
+                    cells["index"].tolist(), cells["count"].tolist()
+                )
+            ]
+
+        if self.max_points and len(labels) > self.max_points and self.point_mode == "sample":
+            idx = sample_indices(len(labels), self.max_points, groups=labels)
+            coords, labels, names = coords[idx], labels[idx], [names[i] for i in idx.tolist()]
+
+        xs = coords[:, 0].tolist()
+        ys = coords[:, 1].tolist()
+        return [
+            {"x": x, "y": y, "cluster": c, "label": name}
+            for x, y, c, name in zip(xs, ys, labels.tolist(), names)
+        ]
+
+    @staticmethod
+    def _display_labels(df: pd.DataFrame, offset: int) -> List[str]:
+        """Etiqueta representativa por fila (ej: nombre, producto) o 'Item i' si no existe"""
+        for col in ('nombre', 'producto'):
+            if col in df.columns:
+                return list(map(str, df[col].tolist()))
+        return [f"Item {offset + i}" for i in range(len(df))]
+
+    def _cluster_info(self, labels: np.ndarray, features: List[str], n_clusters: int) -> List[Dict[str, Any]]:
         # Invertir scaling para mostrar valores reales en los centroides
         centroids_scaled = self.kmeans.cluster_centers_
         centroids_real = self.scaler.inverse_transform(centroids_scaled)
-        
+        counts = np.bincount(labels, minlength=n_clusters)
+
         cluster_info = []
         for i in range(n_clusters):
             # Encontrar features dominantes (más altas/bajas que la media)
-            name = self._generate_cluster_name(centroids_scaled[i], features)
-            
-            info = {
+            cluster_info.append({
                 "id": i,
-                "name": name,
-                "count": int(np.sum(labels == i)),
+                "name": self._generate_cluster_name(centroids_scaled[i], features),
+                "count": int(counts[i]),
                 "center": dict(zip(features, centroids_real[i].tolist()))
-            }
-            cluster_info.append(info)
-
-        return {
-            "points": points,
-            "clusters": cluster_info,
-            "explained_variance": float(np.sum(self.pca.explained_variance_ratio_)),
-            "features": features
-        }
+            })
+        return cluster_info
@@ -0,0 +1,76 @@
+"""
+Validación, early stopping y scheduler de learning rate compartidos por los trainers
+"""
+import copy
+import logging
+from typing import Dict, Optional, Tuple
+
+import torch
+import torch.nn as nn
+
+logger = logging.getLogger(__name__)
+
+LR_SCHEDULERS = ("plateau",)
+
+
+def split_indices(n_samples: int, validation_split: float, shuffle: bool = True, seed: int = 42) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Índices (train, validación). Sin `shuffle` la validación es el tramo final (series de tiempo,
+    para no evaluar con datos anteriores a los de entrenamiento). Si no alcanzan los datos
+    la validación queda vacía.
+    """
+    n_val = int(n_samples * validation_split) if 0 < validation_split < 1 else 0
+    if n_val < 1 or n_samples - n_val < 2:
+        return torch.arange(n_samples), torch.arange(0)
+
+    if shuffle:
+        order = torch.randperm(n_samples, generator=torch.Generator().manual_seed(seed))
+    else:
+        order = torch.arange(n_samples)
+    return order[:n_samples - n_val], order[n_samples - n_val:]
+
+
+def make_scheduler(name: Optional[str], optimizer: torch.optim.Optimizer, patience: int):
+    """Scheduler opcional; 'plateau' reduce el LR a la mitad cuando la pérdida de validación se estanca"""
+    if not name:
+        return None
+    if name == "plateau":
+        return torch.optim.lr_scheduler.ReduceLROnPlateau(optimizer, mode="min", factor=0.5, patience=max(patience // 2, 1))
+    raise ValueError(f"lr_scheduler desconocido: {name}")
+
+
+class EarlyStopping:
+    """
+    Guarda los pesos de la mejor época según la pérdida de validación y avisa cuando
+    pasan `patience` épocas sin mejorar al menos `min_delta`. patience = 0 lo desactiva
+    (igual se restauran los mejores pesos).
+    """
+
+    def __init__(self, patience: int = 10, min_delta: float = 1e-4):
+        self.patience = patience
+        self.min_delta = min_delta
+        self.best_loss = float("inf")
+        self.best_epoch = 0
+        self.best_state: Optional[Dict[str, torch.Tensor]] = None
+        self.stopped_early = False
+        self._bad_epochs = 0
+
+    def step(self, epoch: int, val_loss: float, model: nn.Module) -> bool:
+        """Registra la época (1-indexada); devuelve True si hay que cortar el entrenamiento"""
+        if val_loss < self.best_loss - self.min_delta:
+            self.best_loss = val_loss
+            self.best_epoch = epoch
+            self.best_state = copy.deepcopy(model.state_dict())
+            self._bad_epochs = 0
+            return False
+
+        self._bad_epochs += 1
+        if self.patience and self._bad_epochs >= self.patience:
+            self.stopped_early = True
+            logger.info(f"Early stopping en la época {epoch} (mejor: {self.best_epoch}, val_loss {self.best_loss:.6f})")
+            return True
+        return False
+
+    def restore(self, model: nn.Module):
+        if self.best_state is not None:
+            model.load_state_dict(self.best_state)
@@ -0,0 +1,77 @@
+"""
+Exportación de modelos de regresión a artefactos optimizados para inferencia en CPU
+"""
+import os
+import copy
+import logging
+from typing import Dict
+
+import torch
+import torch.nn as nn
+
+logger = logging.getLogger(__name__)
+
+
+def artifact_paths(model_path: str) -> Dict[str, str]:
+    """Rutas de los artefactos junto al checkpoint .pt"""
+    base, _ = os.path.splitext(model_path)
+    return {
+        "torchscript": f"{base}.ts.pt",
+        "int8": f"{base}.int8.ts.pt"
+    }
+
+
+def fold_batchnorm(model: nn.Module) -> nn.Sequential:
+    """
+    Copia del SimpleRegressionModel para inferencia: cada BatchNorm1d se funde en la
+    Linear anterior (W' = W·s, b' = (b - μ)·s + β con s = γ/√(σ² + ε)) y se quitan los
+    Dropout, que en eval() son la identidad.
+    """
+    layers = []
+    for layer in copy.deepcopy(model).cpu().eval().network:
+        if isinstance(layer, nn.Dropout):
+            continue
+        if isinstance(layer, nn.BatchNorm1d) and layers and isinstance(layers[-1], nn.Linear):
+            linear = layers[-1]
+            scale = layer.weight / torch.sqrt(layer.running_var + layer.eps)
+            with torch.no_grad():
+                linear.weight.mul_(scale.unsqueeze(1))
+                linear.bias.copy_((linear.bias - layer.running_mean) * scale + layer.bias)
+            continue
+        layers.append(layer)
+    return nn.Sequential(*layers).eval()
+
+
+def export_regression_model(model: nn.Module, input_dim: int, model_path: str, quantize: bool = False) -> Dict[str, str]:
+    """
+    Genera el módulo TorchScript congelado (y opcionalmente la variante int8 con
+    cuantización dinámica de las Linear) y los guarda junto al checkpoint.
+    Verifica que la versión fp32 reproduzca las salidas del modelo original.
+    """
+    paths = artifact_paths(model_path)
+    folded = fold_batchnorm(model)
+    example = torch.randn(64, input_dim)
+
+    with torch.no_grad():
+        expected = copy.deepcopy(model).cpu().eval()(example)
+        if not torch.allclose(folded(example), expected, rtol=1e-4, atol=1e-4):
+            raise ValueError("El modelo con BatchNorm fusionado no reproduce las salidas originales")
+
+    exported = {}
+    _save(torch.jit.freeze(torch.jit.script(folded)), paths["torchscript"])
+    exported["torchscript"] = paths["torchscript"]
+
+    if quantize:
+        quantized = torch.ao.quantization.quantize_dynamic(folded, {nn.Linear}, dtype=torch.qint8)
+        _save(torch.jit.freeze(torch.jit.script(quantized)), paths["int8"])
+        exported["int8"] = paths["int8"]
+
+    logger.info(f"Artefactos de inferencia exportados: {list(exported)}")
+    return exported
+
+
+def _save(module: torch.jit.ScriptModule, path: str):
+    # Escribir a un temporal y renombrar: otro proceso nunca lee un archivo a medias
+    tmp_path = f"{path}.tmp"
+    module.save(tmp_path)
+    os.replace(tmp_path, path)
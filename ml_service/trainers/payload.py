@@ -0,0 +1,78 @@
+"""
+Reducción de puntos para gráficos (scatter de clustering y de regresión)
+"""
+import numpy as np
+from typing import Dict, Optional
+
+POINT_MODES = ("sample", "grid", "none")
+
+
+def sample_indices(n: int, budget: int, groups: Optional[np.ndarray] = None, seed: int = 42) -> np.ndarray:
+    """
+    Índices de una muestra de como mucho `budget` filas. Con `groups` es estratificada:
+    cada grupo aporta en proporción a su tamaño y al menos un punto, para que los
+    grupos chicos no desaparezcan del gráfico. Si ese mínimo excede `budget` se recortan
+    las cuotas más grandes y, con más grupos que `budget`, quedan sólo los más grandes.
+    """
+    if budget <= 0 or n <= budget:
+        return np.arange(n)
+
+    rng = np.random.default_rng(seed)
+    if groups is None:
+        return np.sort(rng.choice(n, size=budget, replace=False))
+
+    order = np.argsort(groups, kind='stable')
+    uniques, starts, sizes = np.unique(groups[order], return_index=True, return_counts=True)
+    quotas = np.minimum(sizes, np.maximum(1, np.floor(sizes * budget / n).astype(np.int64)))
+
+    excess = int(quotas.sum()) - budget
+    if excess > 0 and len(quotas) > budget:
+        quotas = np.zeros_like(quotas)
+        quotas[np.argsort(-sizes, kind='stable')[:budget]] = 1
+    elif excess > 0:
+        for i in np.argsort(-quotas, kind='stable'):
+            take = min(excess, int(quotas[i]) - 1)
+            quotas[i] -= take
+            excess -= take
+            if excess == 0:
+                break
+
+    selected = [
+        order[start + rng.choice(size, size=quota, replace=False)]
+        for start, size, quota in zip(starts, sizes, quotas)
+    ]
+    return np.sort(np.concatenate(selected))
+
+
+def grid_aggregate(
+    x: np.ndarray,
+    y: np.ndarray,
+    budget: int,
+    groups: Optional[np.ndarray] = None
+) -> Dict[str, np.ndarray]:
+    """
+    Agrega los puntos en una grilla 2D (por grupo) con como mucho `budget` celdas.
+    Devuelve por celda el centroide (x, y), la cantidad de puntos, el grupo y el
+    índice de un punto representativo.
+    """
+    n = len(x)
+    if groups is None:
+        groups = np.zeros(n, dtype=np.int64)
+    n_groups = max(int(groups.max()) + 1, 1) if n else 1
+    bins = max(int(np.sqrt(max(budget, 1) / n_groups)), 1)
+
+    def cell(values: np.ndarray) -> np.ndarray:
+        low, high = float(values.min()), float(values.max())
+        scaled = (values - low) / (high - low + 1e-12) * bins
+        return np.clip(scaled.astype(np.int64), 0, bins - 1)
+
+    keys = (groups.astype(np.int64) * bins + cell(x)) * bins + cell(y)
+    uniques, first, inverse, counts = np.unique(keys, return_index=True, return_inverse=True, return_counts=True)
+
+    return {
+        "x": np.bincount(inverse, weights=x) / counts,
+        "y": np.bincount(inverse, weights=y) / counts,
+        "count": counts,
+        "group": uniques // (bins * bins),
+        "index": first
+    }
@@ -0,0 +1,299 @@
+"""
+Pipeline de preprocesamiento tabular compartido por entrenamiento e inferencia
+"""
+import numpy as np
+import pandas as pd
+from typing import Any, Dict, List, Optional, Tuple, Union
+import logging
+
+from trainers.early_stopping import split_indices
+
+logger = logging.getLogger(__name__)
+
+# Valores de relleno para fechas no parseables o ausentes (mismo criterio que la inferencia original)
+DATE_FILL = {"month": 1.0, "day": 0.0}
+
+
+def is_id_column(col: str) -> bool:
+    return col.lower() == 'id' or col.lower().startswith('id')
+
+
+def is_date_column(col: str) -> bool:
+    return 'fecha' in col.lower() or 'date' in col.lower()
+
+
+class TabularPipeline:
+    """
+    Transformación de filas crudas a una matriz float32 normalizada.
+
+    Se ajusta una vez al entrenar (`fit`) y se serializa en el checkpoint (`to_dict`),
+    de modo que la inferencia aplica exactamente las mismas columnas, codificaciones
+    y estadísticas con operaciones vectorizadas de NumPy/pandas:
+    - categóricas: búsqueda por hash (pd.Index.get_indexer), desconocidas -> -1
+    - fechas: expansión fija a <col>_month y <col>_day
+    - numéricas: coerción y relleno con la media de entrenamiento
+    - nombres de columna resueltos sin distinguir mayúsculas/minúsculas
+    """
+
+    # Cambiar si se modifica la transformación (invalida checkpoints y la caché de features)
+    VERSION = 1
+
+    def __init__(self):
+        self.target_column: Optional[str] = None
+        # Una entrada por columna de origen, en el orden de feature_names
+        self.columns: List[Dict[str, Any]] = []
+        self.feature_names: List[str] = []
+        self.mean = np.zeros(0, dtype=np.float32)
+        self.std = np.ones(0, dtype=np.float32)
+        self._indexes: Dict[str, pd.Index] = {}
+
+    # --- Ajuste -----------------------------------------------------------------
+
+    def fit(
+        self,
+        df: pd.DataFrame,
+        target_column: str,
+        profile: Optional[Dict[str, Dict[str, Any]]] = None,
+        validation_split: float = 0.0
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Detecta tipos, ajusta codificaciones y estadísticas; devuelve (X, y) float32.
+        Con `profile` (services.profiling, calculado en Postgres) el tipo y el valor de relleno
+        de cada columna perfilada se toman de ahí en vez de convertir la columna para detectarlo.
+        Con `validation_split` la normalización y los rellenos se ajustan sólo sobre las filas de
+        entrenamiento de `split_indices` (la misma partición que usan los trainers), para que la
+        validación no se filtre en el escalado. Los rellenos del perfil de la DB sí cubren todas
+        las filas del schema.
+        """
+        if target_column not in df.columns:
+            raise ValueError(f"Columna objetivo '{target_column}' no encontrada")
+
+        self.target_column = target_column
+        self.columns = []
+
+        # 1. Limpiar Target (asegurar que sea numérico)
+        target = pd.to_numeric(df[target_column], errors='coerce')
+        mask = target.notna().to_numpy()
+        if not mask.all():
+            df = df.loc[mask]
+            target = target[mask]
+        fit_rows = split_indices(len(df), validation_split)[0].numpy()
+        fit_all = len(fit_rows) == len(df)
+
+        # 2. Detectar tipo de cada columna
+        for col in df.columns:
+            if col == target_column or is_id_column(col):
+                logger.info(f"Ignorando columna de ID: {col}")
+                continue
+
+            stats = (profile or {}).get(col)
+            if stats is not None:
+                self.columns.append(self._spec_from_profile(df, col, stats))
+                continue
+
+            if is_date_column(col):
+                dates = pd.to_datetime(df[col], errors='coerce')
+                if not dates.isna().all():
+                    self.columns.append({'name': col, 'type': 'date', 'outputs': [f'{col}_month', f'{col}_day']})
+                    logger.info(f"Fecha detectada en '{col}', extraídos mes y día.")
+                    continue
+
+            numeric = pd.to_numeric(df[col], errors='coerce')
+            if not numeric.isna().all():
+                fill = numeric.mean() if fit_all else numeric.iloc[fit_rows].mean()
+                self.columns.append({'name': col, 'type': 'numeric', 'outputs': [col], 'fill': float(fill)})
+                logger.info(f"Columna numérica detectada: {col}")
+            else:
+                # Categórico (Label Encoding por orden de aparición)
+                _, uniques = pd.factorize(df[col])
+                self.columns.append({'name': col, 'type': 'categorical', 'outputs': [col], 'uniques': uniques.tolist()})
+                logger.info(f"Columna categórica detectada: {col} ({len(uniques)} categorías)")
+
+        self.feature_names = [name for spec in self.columns for name in spec['outputs']]
+        self._build_indexes()
+
+        # 3. Estadísticas de normalización (Z-Score) sobre las features sin normalizar
+        X = self._encode(df)
+        X_fit = X if fit_all else X[fit_rows]
+        self.mean = X_fit.mean(axis=0, dtype=np.float64).astype(np.float32)
+        self.std = (X_fit.std(axis=0, ddof=1, dtype=np.float64) + 1e-8).astype(np.float32) if len(X_fit) > 1 \
+            else np.ones(X.shape[1], dtype=np.float32)
+        X -= self.mean
+        X /= self.std
+
+        y = target.to_numpy(dtype=np.float32).reshape(-1, 1)
+        return X, y
+
+    @staticmethod
+    def _spec_from_profile(df: pd.DataFrame, col: str, stats: Dict[str, Any]) -> Dict[str, Any]:
+        kind = stats['type']
+        if kind == 'date':
+            return {'name': col, 'type': 'date', 'outputs': [f'{col}_month', f'{col}_day']}
+        if kind == 'numeric':
+            fill = stats.get('mean')
+            if fill is None:
+                fill = float(pd.to_numeric(df[col], errors='coerce').mean())
+            return {'name': col, 'type': 'numeric', 'outputs': [col], 'fill': float(fill)}
+        _, uniques = pd.factorize(df[col])
+        return {'name': col, 'type': 'categorical', 'outputs': [col], 'uniques': uniques.tolist()}
+
+    def extend(self, df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Reajuste para warm start: conserva columnas, codificaciones y estadísticas (los pesos
+        del modelo previo dependen de ellas) y agrega al final las categorías nuevas, de modo
+        que los códigos existentes no cambian. Devuelve (X, y) float32 como `fit`.
+        """
+        if self.target_column not in df.columns:
+            raise ValueError(f"Columna objetivo '{self.target_column}' no encontrada")
+
+        target = pd.to_numeric(df[self.target_column], errors='coerce')
+        mask = target.notna().to_numpy()
+        if not mask.all():
+            df = df.loc[mask]
+            target = target[mask]
+
+        lookup = {str(c).lower(): c for c in df.columns}
+        for spec in self.columns:
+            if spec['type'] != 'categorical':
+                continue
+            src = spec['name'] if spec['name'] in df.columns else lookup.get(spec['name'].lower())
+            if src is None:
+                continue
+            _, uniques = pd.factorize(df[src])
+            new = uniques[self._indexes[spec['name']].get_indexer(uniques) < 0].tolist()
+            if new:
+                spec['uniques'] = spec['uniques'] + new
+                logger.info(f"Columna categórica '{spec['name']}': {len(new)} categorías nuevas")
+        self._build_indexes()
+
+        ignored = [c for c in df.columns if c != self.target_column and not is_id_column(c)
+                   and str(c).lower() not in {spec['name'].lower() for spec in self.columns}]
+        if ignored:
+            logger.info(f"Columnas nuevas ignoradas (el modelo previo no las conoce): {ignored}")
+
+        X = self.transform(df)
+        y = target.to_numpy(dtype=np.float32).reshape(-1, 1)
+        return X, y
+
+    # --- Transformación -----------------------------------------------------------
+
+    def transform(self, data: Union[pd.DataFrame, List[Dict]]) -> np.ndarray:
+        """Convierte un lote de filas en la matriz float32 normalizada [n, n_features]"""
+        df = data if isinstance(data, pd.DataFrame) else pd.DataFrame(data)
+        X = self._encode(df)
+        X -= self.mean
+        X /= self.std
+        return X
+
+    def _encode(self, df: pd.DataFrame) -> np.ndarray:
+        n = len(df)
+        X = np.empty((n, len(self.feature_names)), dtype=np.float32)
+        lookup = {str(c).lower(): c for c in df.columns}
+
+        j = 0
+        for spec in self.columns:
+            src = spec['name'] if spec['name'] in df.columns else lookup.get(spec['name'].lower())
+            if src is None:
+                logger.warning(f"Feature '{spec['name']}' faltante en input, rellenando con valor por defecto")
+
+            if spec['type'] == 'numeric':
+                if src is None:
+                    X[:, j] = spec['fill']
+                else:
+                    values = pd.to_numeric(df[src], errors='coerce').to_numpy(dtype=np.float32, na_value=np.nan)
+                    np.nan_to_num(values, copy=False, nan=spec['fill'])
+                    X[:, j] = values
+                j += 1
+
+            elif spec['type'] == 'categorical':
+                if src is None:
+                    X[:, j] = -1
+                else:
+                    X[:, j] = self._indexes[spec['name']].get_indexer(df[src])
+                j += 1
+
+            else:  # date
+                if src is None:
+                    X[:, j] = DATE_FILL['month']
+                    X[:, j + 1] = DATE_FILL['day']
+                else:
+                    dates = pd.to_datetime(df[src], errors='coerce')
+                    X[:, j] = dates.dt.month.to_numpy(dtype=np.float32, na_value=DATE_FILL['month'])
+                    X[:, j + 1] = dates.dt.dayofweek.to_numpy(dtype=np.float32, na_value=DATE_FILL['day'])
+                j += 2
+
+        return X
+
+    def _build_indexes(self):
+        self._indexes = {
+            spec['name']: pd.Index(spec['uniques'], dtype=object)
+            for spec in self.columns if spec['type'] == 'categorical'
+        }
+
+    # --- Serialización -----------------------------------------------------------
+
+    def feature_metadata(self) -> Dict[str, Any]:
+        """Metadatos en el formato histórico de ml_models.feature_metadata"""
+        metadata: Dict[str, Any] = {}
+        for spec in self.columns:
+            if spec['type'] == 'categorical':
+                metadata[spec['name']] = {'type': 'categorical', 'uniques': spec['uniques']}
+            else:
+                metadata[spec['name']] = {'type': spec['type']}
+        metadata['stats'] = {
+            'mean': dict(zip(self.feature_names, self.mean.tolist())),
+            'std': dict(zip(self.feature_names, self.std.tolist()))
+        }
+        return metadata
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'version': self.VERSION,
+            'target_column': self.target_column,
+            'columns': self.columns,
+            'feature_names': self.feature_names,
+            'mean': self.mean.tolist(),
+            'std': self.std.tolist()
+        }
+
+    @classmethod
+    def from_dict(cls, state: Dict[str, Any]) -> "TabularPipeline":
+        pipeline = cls()
+        pipeline.target_column = state.get('target_column')
+        pipeline.columns = state['columns']
+        pipeline.feature_names = state['feature_names']
+        pipeline.mean = np.asarray(state['mean'], dtype=np.float32)
+        pipeline.std = np.asarray(state['std'], dtype=np.float32)
+        pipeline._build_indexes()
+        return pipeline
+
+    @classmethod
+    def from_feature_metadata(cls, metadata: Dict[str, Any], feature_names: List[str]) -> "TabularPipeline":
+        """Reconstruye el pipeline de checkpoints antiguos que sólo guardaban feature_metadata"""
+        pipeline = cls()
+        stats = metadata.get('stats', {})
+        mean = stats.get('mean', {})
+        std = stats.get('std', {})
+
+        for col, meta in metadata.items():
+            if col == 'stats':
+                continue
+            if meta['type'] == 'date':
+                outputs = [f'{col}_month', f'{col}_day']
+                pipeline.columns.append({'name': col, 'type': 'date', 'outputs': outputs})
+            elif meta['type'] == 'categorical':
+                pipeline.columns.append({'name': col, 'type': 'categorical', 'outputs': [col], 'uniques': meta['uniques']})
+            else:
+                pipeline.columns.append({'name': col, 'type': 'numeric', 'outputs': [col], 'fill': float(mean.get(col, 0.0))})
+
+        # Respetar el orden de columnas con el que se entrenó el modelo
+        position = {name: i for i, name in enumerate(feature_names)}
+        pipeline.columns.sort(key=lambda spec: position.get(spec['outputs'][0], len(position)))
+        pipeline.feature_names = [name for spec in pipeline.columns for name in spec['outputs']]
+        if pipeline.feature_names != list(feature_names):
+            raise ValueError("feature_metadata no coincide con las features del modelo")
+
+        pipeline.mean = np.asarray([mean.get(c, 0.0) for c in feature_names], dtype=np.float32)
+        pipeline.std = np.asarray([std.get(c, 1.0) for c in feature_names], dtype=np.float32)
+        pipeline._build_indexes()
+        return pipeline
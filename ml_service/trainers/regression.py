@@ -5,9 +5,11 @@ import torch
 import torch.nn as nn
 import numpy as np
 import pandas as pd
-from typing import Dict, List, Tuple, Any
+from typing import Dict, List, Tuple, Any, Callable, Optional, Union
 import logging
-from datetime import datetime
+from trainers.preprocessing import TabularPipeline
+from trainers.payload import grid_aggregate, sample_indices
+from trainers.early_stopping import EarlyStopping, make_scheduler, split_indices
 
 logger = logging.getLogger(__name__)
 
@@ -36,128 +38,137 @@ class SimpleRegressionModel(nn.Module):
     def forward(self, x):
         return self.network(x)
 
+class LinearRegressionModel(nn.Module):
+    """Regresión lineal (ridge) sobre las mismas features que el MLP"""
+    
+    def __init__(self, input_dim: int):
+        super().__init__()
+        self.linear = nn.Linear(input_dim, 1)
+    
+    def forward(self, x):
+        return self.linear(x)
+
 class RegressionTrainer:
     """Entrenador de modelos de regresión con Feature Engineering básico"""
     
-    def __init__(self, device: torch.device):
+    def __init__(self, device: torch.device, scatter_points: int = 300, point_mode: str = "sample"):
         self.device = device
+        # Puntos del scatter real vs. predicho guardado en las métricas (sample | grid)
+        self.scatter_points = scatter_points
+        self.point_mode = point_mode
         self.feature_metadata = {}
+        self.pipeline = None
     
     def prepare_data(
         self, 
-        data: List[Dict], 
-        target_column: str
+        data: Union[List[Dict], pd.DataFrame], 
+        target_column: str,
+        pipeline: Optional[TabularPipeline] = None,
+        profile: Optional[Dict[str, Dict[str, Any]]] = None,
+        validation_split: float = 0.0
     ) -> Tuple[torch.Tensor, torch.Tensor, List[str]]:
         """
-        Prepara datos para entrenamiento con codificación de categorías y fechas
+        Prepara datos para entrenamiento con codificación de categorías y fechas.
+        Con `pipeline` (warm start) se reutiliza el del modelo previo, extendiendo sus categorías.
+        `profile` (perfil de columnas hecho en la DB) evita detectar los tipos en pandas.
+        `validation_split` debe ser el mismo que se pase a `train`/`train_linear`: la normalización
+        se ajusta sólo con las filas de entrenamiento de esa partición.
         """
-        if not data:
+        if data is None or len(data) == 0:
             raise ValueError("No hay datos para entrenar")
         
-        df = pd.DataFrame(data)
-        
-        if target_column not in df.columns:
-            raise ValueError(f"Columna objetivo '{target_column}' no encontrada")
-
-        # 1. Limpiar Target (asegurar que sea numérico)
-        df[target_column] = pd.to_numeric(df[target_column], errors='coerce')
-        df = df.dropna(subset=[target_column])
-        
-        feature_names = []
-        processed_features = []
-
-        # 2. Procesar Columnas
-        for col in df.columns:
-            if col == target_column or col.lower() == 'id' or col.lower().startswith('id'):
-                logger.info(f"Ignorando columna de ID: {col}")
-                continue
-            
-            # Intentar convertir fechas
-            if 'fecha' in col.lower() or 'date' in col.lower():
-                try:
-                    dates = pd.to_datetime(df[col], errors='coerce')
-                    if not dates.isna().all():
-                        df[f'{col}_month'] = dates.dt.month
-                        df[f'{col}_day'] = dates.dt.dayofweek
-                        feature_names.extend([f'{col}_month', f'{col}_day'])
-                        self.feature_metadata[col] = { 'type': 'date' }
-                        logger.info(f"Fecha detectada en '{col}', extraídos mes y día.")
-                        continue
-                except:
-                    pass
-
-            # Intentar numérico
-            is_numeric = pd.to_numeric(df[col], errors='coerce')
-            if not is_numeric.isna().all():
-                # Rellenar nulos con media
-                df[col] = is_numeric.fillna(is_numeric.mean())
-                feature_names.append(col)
-                self.feature_metadata[col] = { 'type': 'numeric' }
-                logger.info(f"Columna numérica detectada: {col}")
-            else:
-                # Categórico (Label Encoding simple)
-                codes, uniques = pd.factorize(df[col])
-                df[col] = codes
-                self.feature_metadata[col] = {
-                    'type': 'categorical',
-                    'uniques': uniques.tolist()
-                }
-                feature_names.append(col)
-                logger.info(f"Columna categórica detectada: {col} ({len(uniques)} categorías)")
-
-        # 3. Preparar tensores finales
-        X_df = df[feature_names].astype(np.float32)
-        y_df = df[target_column].astype(np.float32).values.reshape(-1, 1)
-        
-        # Normalización (Z-Score)
-        X_mean = X_df.mean()
-        X_std = X_df.std() + 1e-8
-        X_normalized = (X_df - X_mean) / X_std
+        df = data if isinstance(data, pd.DataFrame) else pd.DataFrame(data)
         
-        # Guardar metadatos para inferencia futura
-        self.feature_metadata['stats'] = {
-            'mean': X_mean.to_dict(),
-            'std': X_std.to_dict()
-        }
+        # El pipeline se guarda en el checkpoint para repetir la misma transformación al predecir
+        if pipeline is not None:
+            self.pipeline = pipeline
+            X, y = self.pipeline.extend(df)
+        else:
+            self.pipeline = TabularPipeline()
+            X, y = self.pipeline.fit(df, target_column, profile=profile, validation_split=validation_split)
+        feature_names = self.pipeline.feature_names
+        self.feature_metadata = self.pipeline.feature_metadata()
 
-        X_tensor = torch.from_numpy(X_normalized.values).to(self.device).contiguous()
-        y_tensor = torch.from_numpy(y_df).to(self.device).contiguous()
+        X_tensor = torch.from_numpy(X).to(self.device).contiguous()
+        y_tensor = torch.from_numpy(y).to(self.device).contiguous()
         
         logger.info(f"Datos finales: {X_tensor.shape[0]} muestras, {X_tensor.shape[1]} features")
         return X_tensor, y_tensor, feature_names
     
+    def load_prepared(
+        self,
+        X: np.ndarray,
+        y: np.ndarray,
+        pipeline: TabularPipeline
+    ) -> Tuple[torch.Tensor, torch.Tensor, List[str]]:
+        """Equivalente a `prepare_data` con matrices ya preparadas (caché de features)"""
+        self.pipeline = pipeline
+        self.feature_metadata = pipeline.feature_metadata()
+        X_tensor = torch.from_numpy(X).to(self.device)
+        y_tensor = torch.from_numpy(y).to(self.device)
+        logger.info(f"Features desde caché: {X_tensor.shape[0]} muestras, {X_tensor.shape[1]} features")
+        return X_tensor, y_tensor, pipeline.feature_names
+
     def train(
         self,
         X: torch.Tensor,
         y: torch.Tensor,
         epochs: int = 100,
         learning_rate: float = 0.001,
-        batch_size: int = 32
+        batch_size: int = 32,
+        progress_callback: Optional[Callable[[int, int, float], None]] = None,
+        validation_split: float = 0.2,
+        patience: int = 10,
+        min_delta: float = 1e-4,
+        lr_scheduler: Optional[str] = None,
+        model: Optional[nn.Module] = None,
+        prune_callback: Optional[Callable[[int, float], bool]] = None
     ) -> Tuple[nn.Module, Dict]:
         """
-        Entrena el modelo con los tensores preparados
+        Entrena el modelo con los tensores preparados (o sigue entrenando `model`, si se pasa).
+        progress_callback(epoch, epochs, loss) se invoca al final de cada época.
+        prune_callback(epoch, val_loss) permite cortar un trial poco prometedor (búsqueda de
+        hiperparámetros): si devuelve True se termina como con early stopping.
+
+        Se reserva `validation_split` de las filas para validación: el entrenamiento se corta
+        tras `patience` épocas sin mejora (0 = nunca), se restauran los pesos de la mejor época
+        y las métricas se reportan sobre validación. `lr_scheduler='plateau'` reduce el LR
+        cuando la validación se estanca.
         """
         input_dim = X.shape[1]
-        model = SimpleRegressionModel(input_dim).to(self.device)
+        if model is None:
+            model = SimpleRegressionModel(input_dim)
+        model = model.to(self.device)
         
         criterion = nn.MSELoss()
         optimizer = torch.optim.Adam(model.parameters(), lr=learning_rate)
+        scheduler = make_scheduler(lr_scheduler, optimizer, patience)
         
         n_samples = X.shape[0]
-        n_batches = (n_samples + batch_size - 1) // batch_size
+        train_idx, val_idx = split_indices(n_samples, validation_split)
+        X_train, y_train = X[train_idx.to(X.device)], y[train_idx.to(X.device)]
+        X_val, y_val = X[val_idx.to(X.device)], y[val_idx.to(X.device)]
+        has_validation = len(val_idx) > 0
+        n_train = X_train.shape[0]
+        stopper = EarlyStopping(patience=patience if has_validation else 0, min_delta=min_delta)
         
-        logger.info(f"Entrenando en {self.device}...")
+        logger.info(f"Entrenando en {self.device} ({n_train} train / {len(val_idx)} validación)...")
         
-        model.train()
+        epochs_trained = 0
         for epoch in range(epochs):
-            indices = torch.randperm(n_samples)
-            X_sh = X[indices]
-            y_sh = y[indices]
+            model.train()
+            indices = torch.randperm(n_train, device=X.device)
+            X_sh = X_train[indices]
+            y_sh = y_train[indices]
             
             epoch_loss = 0.0
-            for i in range(0, n_samples, batch_size):
+            n_batches = 0
+            for i in range(0, n_train, batch_size):
                 batch_X = X_sh[i:i+batch_size]
                 batch_y = y_sh[i:i+batch_size]
+                # BatchNorm no puede entrenar con un lote de una sola fila
+                if batch_X.shape[0] < 2 and n_train > 1:
+                    continue
                 
                 optimizer.zero_grad()
                 pred = model(batch_X)
@@ -165,37 +176,139 @@ class RegressionTrainer:
                 loss.backward()
                 optimizer.step()
                 epoch_loss += loss.item()
+                n_batches += 1
+            
+            train_loss = epoch_loss / max(n_batches, 1)
+            epochs_trained = epoch + 1
+
+            if has_validation:
+                model.eval()
+                with torch.no_grad():
+                    val_loss = criterion(model(X_val), y_val).item()
+                if scheduler is not None:
+                    scheduler.step(val_loss)
+                stop = stopper.step(epochs_trained, val_loss, model)
+                if prune_callback is not None and prune_callback(epochs_trained, val_loss):
+                    stop = True
+            else:
+                val_loss, stop = None, False
             
             if (epoch + 1) % 20 == 0:
-                logger.info(f"Epoch {epoch+1}/{epochs} - Loss: {epoch_loss/n_batches:.6f}")
+                val_msg = f" - Val: {val_loss:.6f}" if val_loss is not None else ""
+                logger.info(f"Epoch {epoch+1}/{epochs} - Loss: {train_loss:.6f}{val_msg}")
+
+            if progress_callback:
+                progress_callback(epoch + 1, epochs, train_loss)
 
-        # Métricas finales
+            if stop:
+                break
+
+        stopper.restore(model)
+
+        metrics = self._final_metrics(model, X_train, y_train, X_val, y_val)
+        metrics.update({
+            'epochs_trained': epochs_trained,
+            'best_epoch': stopper.best_epoch or epochs_trained,
+            'stopped_early': stopper.stopped_early
+        })
+        return model, metrics
+
+    def train_linear(
+        self,
+        X: torch.Tensor,
+        y: torch.Tensor,
+        alpha: float = 1.0,
+        validation_split: float = 0.2,
+        progress_callback: Optional[Callable[[int, int, float], None]] = None
+    ) -> Tuple[nn.Module, Dict]:
+        """
+        Ridge en forma cerrada: w = (XcᵀXc + αI)⁻¹ Xcᵀyc con X e y centrados (el intercepto
+        no se regulariza). Usa la misma partición de validación que `train`, así las métricas
+        de ambos modelos son comparables.
+        """
+        input_dim = X.shape[1]
+        train_idx, val_idx = split_indices(X.shape[0], validation_split)
+        X_train, y_train = X[train_idx.to(X.device)], y[train_idx.to(X.device)]
+        X_val, y_val = X[val_idx.to(X.device)], y[val_idx.to(X.device)]
+
+        logger.info(f"Ridge en forma cerrada (alpha={alpha}, {X_train.shape[0]} train / {len(val_idx)} validación)...")
+
+        # float64 para que el sistema normal no pierda precisión con features correlacionadas
+        Xd, yd = X_train.double(), y_train.double()
+        x_mean, y_mean = Xd.mean(dim=0), yd.mean(dim=0)
+        Xc, yc = Xd - x_mean, yd - y_mean
+        gram = Xc.T @ Xc + alpha * torch.eye(input_dim, dtype=torch.float64, device=X.device)
+        rhs = Xc.T @ yc
+        try:
+            weight = torch.linalg.solve(gram, rhs)
+        except RuntimeError:
+            # Sistema singular (alpha = 0 con columnas colineales): mínima norma
+            weight = torch.linalg.pinv(gram) @ rhs
+        bias = y_mean - x_mean @ weight
+
+        model = LinearRegressionModel(input_dim).to(self.device)
+        with torch.no_grad():
+            model.linear.weight.copy_(weight.T.float())
+            model.linear.bias.copy_(bias.float())
+        model.eval()
+
+        metrics = self._final_metrics(model, X_train, y_train, X_val, y_val)
+        metrics.update({'solver': 'ridge', 'alpha': float(alpha)})
+        if progress_callback:
+            progress_callback(1, 1, metrics['train_mse'])
+        return model, metrics
+
+    def _final_metrics(
+        self,
+        model: nn.Module,
+        X_train: torch.Tensor,
+        y_train: torch.Tensor,
+        X_val: torch.Tensor,
+        y_val: torch.Tensor
+    ) -> Dict[str, Any]:
+        """MSE, R² y scatter del modelo final (sobre validación si la hay)"""
+        has_validation = X_val.shape[0] > 0
         model.eval()
         with torch.no_grad():
-            preds = model(X)
-            final_loss = criterion(preds, y).item()
+            train_preds = model(X_train)
+            train_mse = nn.functional.mse_loss(train_preds, y_train).item()
+            X_eval, y_eval = (X_val, y_val) if has_validation else (X_train, y_train)
+            preds = model(X_eval) if has_validation else train_preds
+            final_loss = nn.functional.mse_loss(preds, y_eval).item()
             
+            ss_res = torch.sum((y_eval - preds) ** 2).item()
+            ss_tot = torch.sum((y_eval - y_eval.mean()) ** 2).item()
             r2_score = 1 - (ss_res / (ss_tot + 1e-8))
             
             # Generar datos para gráfico "Actual vs Predicted" (Sampleado)
-            actuals = y.cpu().numpy().flatten()
+            actuals = y_eval.cpu().numpy().flatten()
             predictions = preds.cpu().numpy().flatten()
             
-            scatter_data = []
-            sample_indices = np.random.choice(len(actuals), size=min(len(actuals), 300), replace=False)
+            scatter_data = self._scatter_data(actuals, predictions)
             
-            for idx in sample_indices:
-                scatter_data.append({
-                    "actual": float(actuals[idx]),
-                    "predicted": float(predictions[idx])
-                })
-            
-        return model, {
+        return {
             'mse': float(final_loss),
             'r2_score': float(r2_score),
-            'samples': n_samples,
-            'features': input_dim,
+            'train_mse': float(train_mse),
+            'evaluated_on': 'validation' if has_validation else 'train',
+            'validation_samples': int(X_val.shape[0]),
+            'samples': int(X_train.shape[0] + X_val.shape[0]),
+            'features': int(X_train.shape[1]),
             'metadata': self.feature_metadata,
             'scatter_data': scatter_data
         }
 
+    def _scatter_data(self, actuals: np.ndarray, predictions: np.ndarray) -> List[Dict[str, float]]:
+        """Scatter real vs. predicho acotado a `scatter_points` (muestra o grilla con conteo)"""
+        if self.point_mode == "grid" and len(actuals) > self.scatter_points:
+            cells = grid_aggregate(actuals.astype(np.float64), predictions.astype(np.float64), self.scatter_points)
+            return [
+                {"actual": a, "predicted": p, "count": n}
+                for a, p, n in zip(cells["x"].tolist(), cells["y"].tolist(), cells["count"].tolist())
+            ]
+
+        idx = sample_indices(len(actuals), self.scatter_points)
+        return [
+            {"actual": a, "predicted": p}
+            for a, p in zip(actuals[idx].astype(float).tolist(), predictions[idx].astype(float).tolist())
+        ]
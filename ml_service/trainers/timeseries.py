@@ -5,8 +5,9 @@ import torch
 import torch.nn as nn
 import numpy as np
 import pandas as pd
-from typing import Dict, List, Tuple, Any
+from typing import Dict, List, Tuple, Callable, Optional, Union
 import logging
+from trainers.early_stopping import EarlyStopping, make_scheduler, split_indices
 
 logger = logging.getLogger(__name__)
 
@@ -41,51 +42,81 @@ class LSTMModel(nn.Module):
         out = self.fc(hn[-1])
         return out
 
+class SequenceWindows:
+    """
+    Ventanas deslizantes de largo `seq_length` sobre una serie [N, F] sin materializarlas.
+    La ventana i es series[i:i+seq_length] y su objetivo series[i+seq_length];
+    los lotes se arman al vuelo indexando la serie (memoria O(N) en lugar de O(N·seq_len)).
+    """
+
+    def __init__(self, series: torch.Tensor, seq_length: int):
+        self.series = series
+        self.seq_length = seq_length
+        self._offsets = torch.arange(seq_length, device=series.device)
+
+    def __len__(self) -> int:
+        return max(self.series.shape[0] - self.seq_length, 0)
+
+    @property
+    def shape(self) -> Tuple[int, int, int]:
+        return (len(self), self.seq_length, self.series.shape[1])
+
+    @property
+    def targets(self) -> torch.Tensor:
+        """Objetivos de todas las ventanas (vista, sin copia)"""
+        return self.series[self.seq_length:]
+
+    def gather(self, indices: torch.Tensor) -> torch.Tensor:
+        """Ventanas para los índices dados: [len(indices), seq_len, F]"""
+        return self.series[indices.unsqueeze(1) + self._offsets]
+
+    def window(self, index: int) -> torch.Tensor:
+        """Una ventana como lote de tamaño 1: [1, seq_len, F]"""
+        if index < 0:
+            index += len(self)
+        return self.series[index:index + self.seq_length].unsqueeze(0)
+
+
 class TimeSeriesTrainer:
     """Entrenador de modelos LSTM con ventanas deslizantes"""
     
     def __init__(self, device: torch.device):
         self.device = device
         self.feature_metadata = {}
+        # Última ventana y sigma de residuos para servir /forecast desde el checkpoint
+        self.forecast_context = None
     
-    def create_sequences(self, data: np.ndarray, seq_length: int) -> Tuple[np.ndarray, np.ndarray]:
-        """Crea secuencias input/output para LSTM"""
-        xs = []
-        ys = []
-        for i in range(len(data) - seq_length):
-            x = data[i:(i + seq_length)]
-            y = data[i + seq_length] # Predecir el siguiente paso (solo target será usado)
-            xs.append(x)
-            ys.append(y)
-        return np.array(xs), np.array(ys)
-
     def prepare_data(
         self, 
-        data: List[Dict], 
+        data: Union[List[Dict], pd.DataFrame], 
         target_column: str,
         date_column: str,
-        sequence_length: int = 30
-    ) -> Tuple[torch.Tensor, torch.Tensor, List[str]]:
+        sequence_length: int = 30,
+        ordered: bool = False
+    ) -> Tuple[SequenceWindows, torch.Tensor, List[str]]:
         """
-        Prepara datos secuenciales ordenados por fecha
+        Prepara datos secuenciales ordenados por fecha.
+        Con `ordered` los datos ya vienen limpios y en orden (data_loader.load_series) y no se
+        vuelven a convertir ni ordenar.
         """
-        if not data:
+        if data is None or len(data) == 0:
             raise ValueError("No hay datos para entrenar")
         
-        df = pd.DataFrame(data)
+        df = data if isinstance(data, pd.DataFrame) else pd.DataFrame(data)
         
         if target_column not in df.columns:
             raise ValueError(f"Columna objetivo '{target_column}' no encontrada")
         if date_column not in df.columns:
             raise ValueError(f"Columna de fecha '{date_column}' no encontrada")
 
-        # 1. Ordenar por fecha
-        df[date_column] = pd.to_datetime(df[date_column], errors='coerce')
-        df = df.dropna(subset=[date_column]).sort_values(by=date_column)
-        
-        # 2. Limpiar Target
-        df[target_column] = pd.to_numeric(df[target_column], errors='coerce')
-        df = df.dropna(subset=[target_column])
+        if not ordered:
+            # 1. Ordenar por fecha
+            df[date_column] = pd.to_datetime(df[date_column], errors='coerce')
+            df = df.dropna(subset=[date_column]).sort_values(by=date_column)
+
+            # 2. Limpiar Target
+            df[target_column] = pd.to_numeric(df[target_column], errors='coerce')
+            df = df.dropna(subset=[target_column])
 
         # 3. Guardar stats para normalización inversa
         target_mean = df[target_column].mean()
@@ -102,51 +133,64 @@ class TimeSeriesTrainer:
         data_norm = (df[target_column].values - target_mean) / target_std
         data_norm = data_norm.reshape(-1, 1) # [n_samples, 1] (univariado por ahora)
         
-        # 5. Crear secuencias
-        X, y = self.create_sequences(data_norm, sequence_length)
+        # 5. Ventanas deslizantes sobre la serie (se arman por lote durante el entrenamiento)
+        series = torch.from_numpy(data_norm.astype(np.float32)).to(self.device)
+        windows = SequenceWindows(series, sequence_length)
         
-        if len(X) == 0:
+        if len(windows) == 0:
             raise ValueError(f"No hay suficientes datos para crear secuencias de largo {sequence_length}")
-
-        X_tensor = torch.from_numpy(X).float().to(self.device)
-        y_tensor = torch.from_numpy(y).float().to(self.device)
         
-        logger.info(f"Secuencias creadas: {X_tensor.shape[0]}. Input shape: {X_tensor.shape}")
-        return X_tensor, y_tensor, [target_column]
+        logger.info(f"Secuencias creadas: {len(windows)}. Input shape: {windows.shape}")
+        return windows, windows.targets, [target_column]
     
     def train(
         self,
-        X: torch.Tensor,
+        X: SequenceWindows,
         y: torch.Tensor,
         epochs: int = 100,
         learning_rate: float = 0.001,
-        batch_size: int = 32
+        batch_size: int = 32,
+        progress_callback: Optional[Callable[[int, int, float], None]] = None,
+        validation_split: float = 0.2,
+        patience: int = 10,
+        min_delta: float = 1e-4,
+        lr_scheduler: Optional[str] = None
     ) -> Tuple[nn.Module, Dict]:
-        
+        """
+        Entrena la LSTM. Las últimas `validation_split` ventanas (en orden temporal) quedan
+        para validación, con early stopping tras `patience` épocas sin mejora (0 = nunca),
+        restauración de los mejores pesos y métricas sobre validación.
+        """
         input_dim = X.shape[2] # [Batch, Seq, Features]
         model = LSTMModel(input_dim=input_dim).to(self.device)
         
         criterion = nn.MSELoss()
         optimizer = torch.optim.Adam(model.parameters(), lr=learning_rate)
+        scheduler = make_scheduler(lr_scheduler, optimizer, patience)
         
-        n_samples = X.shape[0]
-        n_batches = (n_samples + batch_size - 1) // batch_size
+        n_samples = len(X)
+        train_idx, val_idx = split_indices(n_samples, validation_split, shuffle=False)
+        train_idx, val_idx = train_idx.to(self.device), val_idx.to(self.device)
+        has_validation = len(val_idx) > 0
+        n_train = len(train_idx)
+        n_batches = (n_train + batch_size - 1) // batch_size
+        stopper = EarlyStopping(patience=patience if has_validation else 0, min_delta=min_delta)
         
-        logger.info(f"Entrenando LSTM en {self.device}...")
+        logger.info(f"Entrenando LSTM en {self.device} ({n_train} train / {len(val_idx)} validación)...")
         
-        model.train()
+        epochs_trained = 0
         for epoch in range(epochs):
+            model.train()
             # No barajamos temporalmente para mantener cierta coherencia si usáramos stateful LSTM,
             # pero para stateless (default) se puede barajar. Para TS puro mejor no barajar a veces.
             # Aquí barajaremos para evitar sesgos de batch.
-            indices = torch.randperm(n_samples)
-            X_sh = X[indices]
-            y_sh = y[indices]
+            indices = train_idx[torch.randperm(n_train, device=self.device)]
             
             epoch_loss = 0.0
-            for i in range(0, n_samples, batch_size):
-                batch_X = X_sh[i:i+batch_size]
-                batch_y = y_sh[i:i+batch_size]
+            for i in range(0, n_train, batch_size):
+                batch_idx = indices[i:i+batch_size]
+                batch_X = X.gather(batch_idx)
+                batch_y = y[batch_idx]
                 
                 optimizer.zero_grad()
                 pred = model(batch_X)
@@ -155,28 +199,52 @@ class TimeSeriesTrainer:
                 optimizer.step()
                 epoch_loss += loss.item()
             
+            train_loss = epoch_loss / n_batches
+            epochs_trained = epoch + 1
+
+            if has_validation:
+                model.eval()
+                with torch.no_grad():
+                    val_loss = criterion(self._predict_windows(model, X, val_idx), y[val_idx]).item()
+                if scheduler is not None:
+                    scheduler.step(val_loss)
+                stop = stopper.step(epochs_trained, val_loss, model)
+            else:
+                val_loss, stop = None, False
+            
             if (epoch + 1) % 10 == 0:
-                logger.info(f"Epoch {epoch+1}/{epochs} - Loss: {epoch_loss/n_batches:.6f}")
+                val_msg = f" - Val: {val_loss:.6f}" if val_loss is not None else ""
+                logger.info(f"Epoch {epoch+1}/{epochs} - Loss: {train_loss:.6f}{val_msg}")
+
+            if progress_callback:
+                progress_callback(epoch + 1, epochs, train_loss)
+
+            if stop:
+                break
+
+        stopper.restore(model)
 
-        # Métricas finales
+        # Métricas finales (sobre validación si la hay)
         model.eval()
         with torch.no_grad():
-            preds = model(X)
-            final_loss = criterion(preds, y).item()
+            eval_idx = val_idx if has_validation else train_idx
+            y_eval = y[eval_idx]
+            preds = self._predict_windows(model, X, eval_idx)
+            final_loss = criterion(preds, y_eval).item()
             
             # R2 Score (aproximado)
-            ss_res = torch.sum((y - preds) ** 2).item()
-            ss_tot = torch.sum((y - y.mean()) ** 2).item()
+            ss_res = torch.sum((y_eval - preds) ** 2).item()
+            ss_tot = torch.sum((y_eval - y_eval.mean()) ** 2).item()
             r2_score = 1 - (ss_res / (ss_tot + 1e-8))
             
+            # Estimamos sigma (RMSE en datos normalizados, fuera de muestra si hay validación)
+            rmse_norm = np.sqrt(ss_res / len(eval_idx))
+            
             # Generate Fan Chart Data
             # Tomamos la última secuencia conocida para proyectar desde ahí
-            last_seq = X[-1:].clone() # [1, seq, 1]
+            last_seq = X.window(-1).clone() # [1, seq, 1]
             last_val_norm = y[-1].item()
             
-            # Estimamos sigma (RMSE en datos normalizados)
-            rmse_norm = np.sqrt(ss_res / n_samples)
-            
             fan_data = self._generate_fan_chart_data(
                 model, 
                 last_seq, 
@@ -190,19 +258,42 @@ class TimeSeriesTrainer:
             # Tomamos los últimos 50 puntos de y (o todos si son menos)
             history_len = min(50, len(y))
             history_vals_norm = y[-history_len:].cpu().numpy().flatten()
-            history_real = [(v * self.feature_metadata['stats']['target_std']) + self.feature_metadata['stats']['target_mean'] for v in history_vals_norm]
+            history_real = [float(v * self.feature_metadata['stats']['target_std'] + self.feature_metadata['stats']['target_mean']) for v in history_vals_norm]
             
             fan_data['history'] = history_real
             
+        self.forecast_context = {
+            'last_window': X.series[-X.seq_length:].flatten().tolist(),
+            'sigma': float(rmse_norm)
+        }
+
         return model, {
             'mse': float(final_loss),
             'r2_score': float(r2_score),
+            'evaluated_on': 'validation' if has_validation else 'train',
+            'validation_samples': int(len(val_idx)),
+            'epochs_trained': epochs_trained,
+            'best_epoch': stopper.best_epoch or epochs_trained,
+            'stopped_early': stopper.stopped_early,
             'samples': n_samples,
             'features': input_dim,
             'metadata': self.feature_metadata,
             'fan_chart_data': fan_data
         }
 
+    def _predict_windows(
+        self,
+        model: nn.Module,
+        windows: SequenceWindows,
+        indices: Optional[torch.Tensor] = None,
+        chunk_size: int = 4096
+    ) -> torch.Tensor:
+        """Predicción sobre las ventanas indicadas (todas por defecto) por bloques, sin materializarlas"""
+        if indices is None:
+            indices = torch.arange(len(windows), device=self.device)
+        preds = [model(windows.gather(indices[start:start + chunk_size])) for start in range(0, len(indices), chunk_size)]
+        return torch.cat(preds)
+
     def _generate_fan_chart_data(self, model: nn.Module, X_last: torch.Tensor, last_real_val: float, steps: int = 30, sigma: float = 0.0, meta: Dict = {}) -> Dict:
         """
         Genera prohibición a futuro con intervalos de confianza